@@ -1,57 +1,489 @@
-from flask import Flask, request, jsonify
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-
-from battlesim.agents import add_agents_to_model, add_agents_to_model
-from battlesim.model import BattleModel
-from battlesim.map_creator import MapCreator
-from battlesim.utils import final_stats
+import os
+import re
+import threading
+import time
+import uuid
+
+from flask import Flask, Response, request, jsonify
+
+from battlesim.utils import final_stats, run_battle
+from battlesim.batch import create_model, run_batch
+from battlesim.model import ENGINES
 from battlesim.visualizer import Visualizer # ADDED
+from battlesim.renderer import FrameRenderer
+from battlesim.stream import BattleBroadcast
+from battlesim.jobs import JobQueue, QueueFull
+from battlesim.cache import ResultCache, result_key
+from battlesim.profiling import Metrics, format_metric
+from battlesim.assets import AssetCache
+from battlesim.raster import FORMATS, Rasterizer, encode
+from battlesim.replay import Replay, ReplayRecorder
+from battlesim.stream import pack_agents
+from battlesim.visualizer import raster_layer
+from battlesim.scenario import ScenarioError, compile_scenario, load_scenario, scenario_ids
+from battlesim.sweep import Sweep, SweepError
 
 app = Flask(__name__)
 
+# one background renderer process shared by all requests, started by the first one
+renderer = None
+renderer_lock = threading.Lock()
+
+
+def get_renderer():
+    global renderer
+    with renderer_lock:
+        if renderer is None or not renderer.is_alive():
+            if renderer is not None:
+                renderer.close()
+            renderer = FrameRenderer()
+    return renderer
+
+
+# live battles that viewers can join, by id
+broadcasts = {}
+BROADCAST_TTL = 60  # seconds a finished battle stays joinable
+
+
+# worker pool for /simulations jobs, created on first use
+job_queue = None
+MAX_WORKERS = int(os.environ.get("BATTLESIM_MAX_WORKERS", 0)) or None
+MAX_PENDING = int(os.environ.get("BATTLESIM_MAX_PENDING", 16))
+
+# /run_batch runs inside the request, larger batches go through /simulations or Python
+MAX_REPLICATIONS = int(os.environ.get("BATTLESIM_MAX_REPLICATIONS", 200))
+
+
+def get_job_queue():
+    global job_queue
+    if job_queue is None:
+        job_queue = JobQueue(max_workers=MAX_WORKERS, max_pending=MAX_PENDING)
+    return job_queue
+
+
+# results of seeded /run_simulation requests
+result_cache = ResultCache(db_path=os.environ.get("BATTLESIM_CACHE_DB"),
+                           max_db_bytes=int(os.environ.get("BATTLESIM_CACHE_MB", 64)) * 2**20)
+
+
+# totals behind /metrics; per-phase numbers come from profiled runs, i.e.
+# every run with BATTLESIM_PROFILE=1, otherwise runs asked for timing=true
+metrics = Metrics()
+PROFILE_ALL = os.environ.get("BATTLESIM_PROFILE", "0").lower() not in ("0", "false", "no")
+SLOW_STEP_MS = float(os.environ.get("BATTLESIM_SLOW_STEP_MS", 0)) or None
+
+
+# replays of runs asked for record=true, opened on demand and kept by id
+REPLAY_DIR = os.environ.get("BATTLESIM_REPLAY_DIR", "database/replays")
+replays = AssetCache(max_entries=8)
+
+
+def replay_path(replay_id):
+    return os.path.join(REPLAY_DIR, f"{replay_id}.npz")
+
+
+# adaptive sweeps, run in background threads and checkpointed by id
+SWEEP_DIR = os.environ.get("BATTLESIM_SWEEP_DIR", "database/sweeps")
+SWEEP_WORKERS = int(os.environ.get("BATTLESIM_SWEEP_WORKERS", 0)) or None
+sweeps = {}  # id -> (sweep, thread, stop event) of sweeps started by this process
+
+
+def sweep_path(sweep_id):
+    return os.path.join(SWEEP_DIR, f"{sweep_id}.json")
+
+
+def start_sweep(sweep_id, sweep):
+    stop = threading.Event()
+    thread = threading.Thread(target=sweep.run, kwargs={"max_workers": SWEEP_WORKERS, "stop": stop},
+                              daemon=True)
+    sweeps[sweep_id] = (sweep, thread, stop)
+    thread.start()
+
+
+def flag(name, default="true"):
+    return request.args.get(name, default=default, type=str).lower() not in ("0", "false", "no")
+
+
+class ParameterError(ValueError):
+    """A request parameter that does not parse, answered with a 400."""
+
+
+def number_arg(args, name, kind, default=None):
+    """`args[name]` converted by `kind` (int or float), `default` when missing."""
+    value = args.get(name)
+    if value is None:
+        return default
+    expected = "an integer" if kind is int else "a number"
+    # JSON bodies carry numbers as such: int() would truncate 1.5 and accept true
+    if isinstance(value, bool) or kind is int and isinstance(value, float) and not value.is_integer():
+        raise ParameterError(f"{name} must be {expected}, got {value!r}")
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        raise ParameterError(f"{name} must be {expected}, got {value!r}") from None
+
+
+def engine_arg(args):
+    """Engine of a request, one of `ENGINES`."""
+    engine = args.get('engine', "mesa")
+    if engine not in ENGINES:
+        raise ParameterError(f"engine must be one of {', '.join(ENGINES)}, got {engine!r}")
+    return engine
+
+
+def map_files():
+    """Height maps and images of the built-in scenarios."""
+    files = set()
+    for scenario_id in scenario_ids():
+        world = load_scenario(scenario_id).get("map", {})
+        files.update(world[name] for name in ("heights", "image") if world.get(name))
+    return files
+
+
+def scenario_arg(args):
+    """Scenario of a request: a built-in id or an inline scenario (JSON text or object)."""
+    source = args.get('scenario') or "small_battle"
+    built_in = isinstance(source, str) and source in scenario_ids()
+    # requests may not name files on the server
+    if isinstance(source, str) and not source.lstrip().startswith("{") and not built_in:
+        raise ScenarioError(f"Unknown scenario: {source!r}, built-in: {', '.join(scenario_ids())}")
+    scenario = load_scenario(source)
+    if built_in:
+        return scenario
+    if isinstance(scenario.get("attributes"), str):
+        raise ScenarioError("attributes: inline scenarios must give the attributes, not a file")
+    world = scenario.get("map")
+    for name in ("heights", "image"):
+        if isinstance(world, dict) and world.get(name) is not None and world[name] not in map_files():
+            raise ScenarioError(f"map.{name}: inline scenarios can only use the map files of the "
+                                f"built-in scenarios, got {world[name]!r}")
+    return scenario
+
+
+@app.errorhandler(ScenarioError)
+@app.errorhandler(SweepError)
+@app.errorhandler(ParameterError)
+def invalid_scenario(error):
+    return jsonify({"error": str(error)}), 400
+
+
+@app.route('/scenarios', methods=['GET'])
+def list_scenarios():
+    scenarios = [load_scenario(scenario_id) for scenario_id in scenario_ids()]
+    return jsonify([{"id": scenario["id"],
+                     "description": scenario.get("description", ""),
+                     "params": scenario.get("params", {})} for scenario in scenarios])
+
+
 @app.route('/run_simulation', methods=['GET'])
 def run_battle_simulation():
     # Get parameters from URL query string
     n_soldiers = request.args.get('n_soldiers', default=50, type=int)
     n_medics = request.args.get('n_medics', default=0, type=int)
     n_mines = request.args.get('n_mines', default=1, type=int) 
+    engine = engine_arg(request.args)
+    render = flag('render')
+    early_stop = flag('early_stop')
+    stalemate_steps = request.args.get('stalemate_steps', default=0, type=int)
+    time_budget = request.args.get('time_budget', default=None, type=float)
+    seed = request.args.get('seed', default=None, type=int)
+    timing = flag('timing', default="false")
+    record = flag('record', default="false")
+    scenario = scenario_arg(request.args)
+    compiled = compile_scenario(scenario, {"n_soldiers": n_soldiers, "n_medics": n_medics, "n_mines": n_mines})
+    if compiled.grid == "sparse":
+        if record:
+            raise ScenarioError("record: replays need a dense map")
+        render = False  # sparse theatres are never drawn whole
+    breakdown = {}
+
+    def simulate():
+        start = time.perf_counter()
+        model = create_model(n_soldiers, n_medics, n_mines, seed=seed, engine=engine, scenario=scenario)
+        profiler = model.enable_profiling(SLOW_STEP_MS) if timing or PROFILE_ALL else None
+        visualizer = Visualizer(model, image_path=compiled.image or "database/image.png") if render else None # ADDED
+        recorder = None
+        if record:
+            os.makedirs(REPLAY_DIR, exist_ok=True)
+            replay_id = uuid.uuid4().hex
+            recorder = ReplayRecorder(replay_path(replay_id), model,
+                                      meta={"scenario": scenario.get("id"), "scenario_key": compiled.key, "seed": seed, "engine": engine,
+                                            "image": compiled.image})
+        created = time.perf_counter()
+
+        def submit_frame():
+            # rendered asynchronously, frames are dropped if the renderer lags
+            get_renderer().submit(visualizer.frame(), "database/teritory.png", image_path=visualizer.image_path)
 
-    # create map
-    map_creator = MapCreator(size=100)
-    map_creator.read_heights(path_to_file="database/heights.txt")
-    height_map = map_creator.height_map
-    mine_map = map_creator.create_mine_map((0,30), (100, 50), n_mines)
-
-    # create model
-    model = BattleModel(width=100,
-                    height=100,
-                    height_map=height_map,
-                    mine_map=mine_map)
-    
-    visualizer = Visualizer(model, image_path="database/image.png") # ADDED
-    
-    # add agents
-    add_agents_to_model(model=model,
-                        case="small_battle",
-                        n=n_soldiers,
-                        n_medics=n_medics)
-
-    max_steps = 150
-    for i in range(max_steps):
-        model.step()
-        if i%3 == 0:
-            fig = visualizer.plot_teritory()
-            fig.savefig("database/teritory.png",
-                        bbox_inches='tight',
-                        pad_inches=0)
-            plt.close(fig)
-
-    stats = final_stats(model)  # Get final stats
-    return jsonify(stats)
+        def on_step(i):
+            if recorder is not None:
+                recorder.record()
+            if render and i%3 == 0:
+                if profiler is None:
+                    submit_frame()
+                else:
+                    profiler.timed("render", submit_frame)
 
+        run = run_battle(model,
+                         max_steps=150,
+                         stop_when_decided=early_stop,
+                         stalemate_steps=stalemate_steps,
+                         time_budget=time_budget,
+                         on_step=on_step)
+        finished = time.perf_counter()
+        model.close()
+
+        stats = final_stats(model)  # Get final stats
+        stats["Steps"] = run["steps"]
+        stats["Stop reason"] = run["reason"]
+        if recorder is not None:
+            recorder.close(result=run)
+            stats["Replay"] = replay_id
+        metrics.observe_simulation(time.perf_counter() - start, profiler)
+        if profiler is not None:
+            breakdown.update(setup_ms=1000 * (created - start),
+                             run_ms=1000 * (finished - created),
+                             stats_ms=1000 * (time.perf_counter() - finished),
+                             **profiler.report())
+        return stats
+
+    def respond(stats):
+        if timing:
+            # cached results were not simulated by this request
+            stats = dict(stats, Timing=breakdown or {"cached": True})
+        return jsonify(stats)
+
+    # only seeded runs without a wall-clock budget are reproducible;
+    # recorded runs are simulated again to write their own replay
+    if seed is None or time_budget is not None or record:
+        return respond(simulate())
+
+    # the scenario key covers its content and the counts it uses
+    key = result_key({"scenario": compiled.key,
+                      "engine": engine,
+                      "seed": seed,
+                      "early_stop": early_stop,
+                      "stalemate_steps": stalemate_steps,
+                      "max_steps": 150},
+                     heights_path=compiled.heights)
+    return respond(result_cache.get_or_compute(key, simulate))
+
+
+@app.route('/cache', methods=['GET'])
+def cache_stats():
+    return jsonify(result_cache.stats())
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    cache = result_cache.stats()
+    text = metrics.render() + "".join(
+        format_metric(f"battlesim_cache_{name}_total", "counter", f"Result cache {name}.", [("", {}, cache[name])])
+        for name in ("hits", "misses", "shared"))
+    return Response(text, content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def open_replay(replay_id):
+    # ids are generated by the server, anything else is not a replay file
+    if not re.fullmatch(r"[0-9a-f]{32}", replay_id) or not os.path.exists(replay_path(replay_id)):
+        return None
+    return replays.get(replay_id, lambda: Replay(replay_path(replay_id)))
+
+
+@app.route('/replays/<replay_id>', methods=['GET'])
+def replay_info(replay_id):
+    replay = open_replay(replay_id)
+    if replay is None:
+        return jsonify({"error": f"Unknown replay: {replay_id}"}), 404
+    return jsonify(replay.meta)
+
+
+@app.route('/replays/<replay_id>/<int:step>', methods=['GET'])
+def replay_frame(replay_id, step):
+    format = request.args.get('format', default="png", type=str).lower()
+    if format != "json" and format not in FORMATS:
+        return jsonify({"error": f"Unknown format: {format}, use json, png, jpeg or webp"}), 400
+    replay = open_replay(replay_id)
+    if replay is None:
+        return jsonify({"error": f"Unknown replay: {replay_id}"}), 404
+    try:
+        frame = replay.frame(step)
+    except IndexError as error:
+        return jsonify({"error": str(error)}), 404
+
+    if format == "json":
+        return jsonify({"step": frame["step"],
+                        "alive": frame["alive"],
+                        "health": frame["total_health"],
+                        "agents": pack_agents(frame["x"], frame["y"], frame["health"],
+                                              frame["fraction"], frame["kind"])})
+    rasterizer = Rasterizer()
+    layer = raster_layer(replay.meta.get("image") or "database/image.png", frame, rasterizer.scaler,
+                         show_heights=flag('heights'))
+    image = rasterizer.draw(layer, frame, show_mines=flag('mines'))
+    return Response(encode(image, format), mimetype=f"image/{'jpeg' if format == 'jpg' else format}")
+
+
+@app.route('/stream_simulation', methods=['GET'])
+def stream_battle_simulation():
+    # Get parameters from URL query string
+    n_soldiers = request.args.get('n_soldiers', default=50, type=int)
+    n_medics = request.args.get('n_medics', default=0, type=int)
+    n_mines = request.args.get('n_mines', default=1, type=int)
+    engine = engine_arg(request.args)
+    fps = request.args.get('fps', default=10, type=float)
+    agents = flag('agents')
+    early_stop = flag('early_stop')
+    scenario = scenario_arg(request.args)
+
+    # forget finished battles nobody can still join
+    now = time.time()
+    for battle_id, broadcast in list(broadcasts.items()):
+        if broadcast.finished and now - broadcast.finished_at > BROADCAST_TTL:
+            del broadcasts[battle_id]
+
+    model = create_model(n_soldiers, n_medics, n_mines, engine=engine, scenario=scenario)
+    broadcast = BattleBroadcast(model, fps=fps, agents=agents,
+                                max_steps=150, stop_when_decided=early_stop)
+    broadcasts[broadcast.id] = broadcast
+    broadcast.start()
+    return Response(broadcast.sse(), mimetype="text/event-stream")
+
+
+@app.route('/stream/<battle_id>', methods=['GET'])
+def join_battle_stream(battle_id):
+    broadcast = broadcasts.get(battle_id)
+    if broadcast is None:
+        return jsonify({"error": f"Unknown battle: {battle_id}"}), 404
+    return Response(broadcast.sse(), mimetype="text/event-stream")
+
+
+@app.route('/simulations', methods=['POST'])
+def submit_simulation():
+    # parameters from a JSON body or from the URL query string
+    args = request.get_json(silent=True) or request.args
+    params = {"n_soldiers": number_arg(args, 'n_soldiers', int, 50),
+              "n_medics": number_arg(args, 'n_medics', int, 0),
+              "n_mines": number_arg(args, 'n_mines', int, 1),
+              "engine": engine_arg(args),
+              "max_steps": number_arg(args, 'max_steps', int, 150),
+              "stalemate_steps": number_arg(args, 'stalemate_steps', int, 0),
+              "stop_when_decided": str(args.get('early_stop', "true")).lower() not in ("0", "false", "no")}
+    if args.get('seed') is not None:
+        params["seed"] = number_arg(args, 'seed', int)
+    if args.get('time_budget') is not None:
+        params["time_budget"] = number_arg(args, 'time_budget', float)
+    if args.get('scenario') is not None:
+        # validated here so a bad scenario is a 400, not a failed job
+        params["scenario"] = scenario_arg(args)
+        compile_scenario(params["scenario"], params)
+
+    try:
+        job_id = get_job_queue().submit(params)
+    except QueueFull as error:
+        return jsonify({"error": str(error)}), 429
+    return jsonify({"id": job_id, "status": "queued"}), 202
+
+
+@app.route('/simulations/<job_id>', methods=['GET'])
+def simulation_status(job_id):
+    status = get_job_queue().status(job_id)
+    if status is None:
+        return jsonify({"error": f"Unknown simulation: {job_id}"}), 404
+    return jsonify(status)
+
+
+@app.route('/simulations/<job_id>', methods=['DELETE'])
+def cancel_simulation(job_id):
+    status = get_job_queue().cancel(job_id)
+    if status is None:
+        return jsonify({"error": f"Unknown simulation: {job_id}"}), 404
+    return jsonify(status)
+
+
+@app.route('/sweeps', methods=['POST'])
+def submit_sweep():
+    spec = request.get_json(silent=True)
+    if not isinstance(spec, dict):
+        return jsonify({"error": "the sweep spec must be a JSON object"}), 400
+    if spec.get("scenario") is not None:
+        scenario_arg(spec)
+
+    sweep_id = uuid.uuid4().hex
+    os.makedirs(SWEEP_DIR, exist_ok=True)
+    sweep = Sweep(spec, checkpoint=sweep_path(sweep_id))
+    sweep.save()
+    start_sweep(sweep_id, sweep)
+    return jsonify({"id": sweep_id, "status": "running"}), 202
+
+
+def find_sweep(sweep_id):
+    """Summary of a sweep: live if it runs here, otherwise from its checkpoint."""
+    if sweep_id in sweeps:
+        sweep, thread, _ = sweeps[sweep_id]
+        summary = sweep.summary()
+        if summary["status"] == "running" and not thread.is_alive():
+            summary["status"] = "failed"
+        return summary
+    # ids are generated by the server, anything else is not a checkpoint file
+    if not re.fullmatch(r"[0-9a-f]{32}", sweep_id) or not os.path.exists(sweep_path(sweep_id)):
+        return None
+    summary = Sweep.resume(sweep_path(sweep_id)).summary()
+    if summary["status"] in ("created", "running"):
+        summary["status"] = "interrupted"  # the process running it is gone
+    return summary
+
+
+@app.route('/sweeps/<sweep_id>', methods=['GET'])
+def sweep_status(sweep_id):
+    summary = find_sweep(sweep_id)
+    if summary is None:
+        return jsonify({"error": f"Unknown sweep: {sweep_id}"}), 404
+    return jsonify(summary)
+
+
+@app.route('/sweeps/<sweep_id>', methods=['DELETE'])
+def stop_sweep(sweep_id):
+    if sweep_id in sweeps:
+        sweep, thread, stop = sweeps[sweep_id]
+        stop.set()
+        thread.join()
+    return sweep_status(sweep_id)
+
+
+@app.route('/sweeps/<sweep_id>/resume', methods=['POST'])
+def resume_sweep(sweep_id):
+    summary = find_sweep(sweep_id)
+    if summary is None:
+        return jsonify({"error": f"Unknown sweep: {sweep_id}"}), 404
+    if summary["status"] == "done" or (sweep_id in sweeps and sweeps[sweep_id][1].is_alive()):
+        return jsonify({"id": sweep_id, "status": summary["status"]})
+    start_sweep(sweep_id, Sweep.resume(sweep_path(sweep_id)))
+    return jsonify({"id": sweep_id, "status": "running"}), 202
+
+
+@app.route('/run_batch', methods=['GET'])
+def run_battle_batch():
+    # Get parameters from URL query string
+    n_soldiers = number_arg(request.args, 'n_soldiers', int, 50)
+    n_medics = number_arg(request.args, 'n_medics', int, 0)
+    n_mines = number_arg(request.args, 'n_mines', int, 1)
+    replications = number_arg(request.args, 'replications', int, 10)
+    seed = number_arg(request.args, 'seed', int, 0)
+    engine = engine_arg(request.args)
+    if not 1 <= replications <= MAX_REPLICATIONS:
+        raise ParameterError(f"replications must be between 1 and {MAX_REPLICATIONS}, got {replications}")
+    scenario = scenario_arg(request.args)
+    compile_scenario(scenario, {"n_soldiers": n_soldiers, "n_medics": n_medics, "n_mines": n_mines})
 
+    result = run_batch(n_soldiers=n_soldiers,
+                       n_medics=n_medics,
+                       n_mines=n_mines,
+                       replications=replications,
+                       seed=seed,
+                       engine=engine,
+                       scenario=scenario)
+    return jsonify(result)
 
 
 if __name__ == '__main__':
@@ -1,5 +1,8 @@
 from .agents import SoldierAgent, place_agents
 from .model import BattleModel
+from .engine import VectorEngine
 from .visualizer import Visualizer
 from .utils import run_simulation, final_plots, final_stats
-from .map_creator import MapCreator
\ No newline at end of file
+from .map_creator import MapCreator
+from .mines import MineField
+from .batch import run_batch, run_replication
@@ -1,22 +1,101 @@
 import json
-import copy
-import random
-import numpy as np
-from mesa import Agent
+import os
+from operator import attrgetter
+from typing import NamedTuple
 
+from .enums import (AgentType, Fraction, Movement, Status,
+                    MEDIC, MORTAR, ALIVE, WOUNDED, DEAD, RANDOM, ROUTE, STAY, PATH)
 
-class SoldierAgent(Agent):
-    """An agent with fixed initial health."""
+
+# default attribute table, scenarios can also load it as a file
+# ("attributes": "database/attributes.json")
+ATTRIBUTES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                               "database", "attributes.json")
+with open(ATTRIBUTES_PATH) as file:
+    ATTRIBUTES = json.load(file)
+
+
+class TypeAttributes(NamedTuple):
+    """Immutable attributes of one agent type, shared by all its agents."""
+    max_health: float = 100
+    speed: int = 1
+    damage: float = 0
+    damage_range: int = 3
+    damage_chance: float = 0.5
+    healing: float = 0
+    healing_chance: float = 0
+    healing_range: int = 0
+    caliber: AgentType = None
+    # initial values of the per-agent counters
+    steps_after_healing: int = 0
+    steps_after_shot: int = 0
+    is_projectile: bool = False
+
+
+def _type_attributes(kind, attrs):
+    values = {key: value for key, value in attrs.items() if key != "special"}
+    values.update(attrs.get("special", {}))
+    if "caliber" in values:
+        values["caliber"] = AgentType.parse(values["caliber"])
+    return TypeAttributes(is_projectile=kind.is_projectile, **values)
+
+
+TYPE_ATTRIBUTES = {AgentType.parse(name): _type_attributes(AgentType.parse(name), attrs)
+                   for name, attrs in ATTRIBUTES.items()}
+
+
+def build_type_attributes(overrides):
+    """TYPE_ATTRIBUTES with some fields replaced, given in the ATTRIBUTES layout."""
+    table = dict(TYPE_ATTRIBUTES)
+    for name, attrs in overrides.items():
+        merged = dict(ATTRIBUTES[str(AgentType.parse(name))], **attrs)
+        merged["special"] = dict(ATTRIBUTES[str(AgentType.parse(name))].get("special", {}),
+                                 **attrs.get("special", {}))
+        table[AgentType.parse(name)] = _type_attributes(AgentType.parse(name), merged)
+    return table
+
+
+def _shared(name):
+    """Read-only view of a field of the agent's TypeAttributes."""
+    return property(attrgetter("attributes." + name))
+
+
+class SoldierAgent():
+    """
+    An agent with fixed initial health.
+
+    `fraction`, `type`, `status` and `movement` are interned enum members
+    and per-type attributes live in one shared TypeAttributes record, so
+    an agent is a handful of slots with no per-instance dict. It has the
+    interface of `mesa.Agent` (`unique_id`, `model`, `pos`, `step`,
+    `advance`, `random`) without subclassing it, as `mesa.Agent` has no
+    `__slots__` and would bring the dict back.
+    """
+
+    __slots__ = ("unique_id", "model", "pos",
+                 "status", "fraction", "type", "is_projectile", "attributes", "health",
+                 "last_aim", "last_heal",
+                 "movement", "route", "route_index", "steps_after_attack",
+                 "steps_after_healing", "steps_after_shot",
+                 "damaged", "healed")
+
+    max_health = _shared("max_health")
+    speed = _shared("speed")
+    damage = _shared("damage")
+    damage_range = _shared("damage_range")
+    damage_chance = _shared("damage_chance")
 
     def __init__(self, unique_id, params, model):
         
-        super().__init__(unique_id, model)
+        self.unique_id = unique_id
+        self.model = model
+        self.pos = None
 
         # general atributes
-        self.status = "alive"
+        self.status = ALIVE
         
-        self.fraction = params["fraction"] # ally / enemy
-        self.type = params["type"] # soldier or mine-thrower
+        self.fraction = Fraction.parse(params["fraction"]) # ally / enemy
+        self.type = AgentType.parse(params["type"]) # soldier or mine-thrower
         
         # type specific atributes
         self._set_type_specific_attributes()
@@ -26,7 +105,7 @@ class SoldierAgent(Agent):
         self.last_heal = None
         
         # movement attributes
-        self.movement = params["movement"] # [random, stay, route]
+        self.movement = Movement.parse(params["movement"]) # [random, stay, route, path]
         self.route = params["route"]  # List of points (x, y) to visit
         self.route_index = 0  # Current target point index in the route
         self.steps_after_attack = 0  # Steps count after last attack
@@ -35,80 +114,52 @@ class SoldierAgent(Agent):
         self.damaged = 0
         self.healed = 0
     
+    @property
+    def random(self):
+        return self.model.random
+
     def _set_type_specific_attributes(self):
         
-        ATTRIBUTES = {
-    "infantry": {
-        "max_health": 100,
-        "speed": 1,
-        "damage": 10,
-        "damage_range": 6,
-        "damage_chance": 0.4
-    },
-    "medic": {
-        "max_health": 70,
-        "speed": 1,
-        "damage": 5,
-        "damage_range": 3,
-        "damage_chance": 0.2,
-        "special": {
-            "healing": 5,
-            "healing_chance": 0.8,
-            "healing_range": 1,
-            "steps_after_healing": 0
-        }
-    },
-    "mortar": {
-        "max_health": 30,
-        "speed": 1,
-        "damage_range": 99,
-        "special": {
-            "caliber": "projectile_120mm",
-            "steps_after_shot": 25
-        }
-    },
-    "projectile_120mm": {
-        "max_health": 10,
-        "speed": 10,
-        "damage": 80,
-        "damage_range": 1,
-        "damage_chance": 0.05
-    }
-}
-        type_attrs = copy.deepcopy(ATTRIBUTES[self.type])
-        self.max_health = self.health = type_attrs.get("max_health", 100)
-        self.speed = type_attrs.get("speed", 1)
-        self.damage = type_attrs.get("damage", 0)
-        self.damage_range = type_attrs.get("damage_range", 3)
-        self.damage_chance = type_attrs.get("damage_chance", 0.5)
-        self.special_attributes = type_attrs.get("special", dict())
+        self.attributes = self.model.type_attributes[self.type]
+        self.is_projectile = self.attributes.is_projectile
+        self.health = self.attributes.max_health
+        self.steps_after_healing = self.attributes.steps_after_healing
+        self.steps_after_shot = self.attributes.steps_after_shot
         
     def kill_agent(self):
+        if self.status is DEAD:
+            return
+        self.model.stats.remove_agent(self)
         self.health = 0
-        self.status = "dead"   
+        self.status = DEAD
+        self.model.grid.unindex_agent(self)
+        self.model.dead_agents.append(self)  # leaves the schedule and grid after the step
         
     def step(self):
-        if self.status == "dead":
+        if self.status is DEAD:
             return
-        if self.type == "medic":
+        if self.type is MEDIC:
             if not self.heal_wounded():
                 self.attack()
         else:
             self.attack()
-        for _ in range(self.speed):
+        for _ in range(self.attributes.speed):
             self.move()
+
+    def advance(self):
+        pass
     
     def _mortar_shoot(self, target_agent):
-        if self.special_attributes["steps_after_shot"] < 30:
-            self.special_attributes["steps_after_shot"] += 1
+        if self.steps_after_shot < 30:
+            self.steps_after_shot += 1
             return
         else:
             x, y = self.pos
             target_x, target_y = target_agent.pos
             params = dict(
                 fraction = self.fraction,
-                type = self.special_attributes["caliber"],
-                movement = "route",
+                type = self.attributes.caliber,
+                movement = ROUTE,
                 route = [(x, y), (target_x, target_y)]
             )
             place_agents(model=self.model,
@@ -116,68 +167,61 @@ class SoldierAgent(Agent):
                          params=params,
                          pos=(x,y))
             self.steps_after_attack = 0
-            self.special_attributes["steps_after_shot"] = 0
+            self.steps_after_shot = 0
             return
          
     def attack(self):
-        if self.last_aim is not None and self.last_aim.status != "dead":
+        if self.last_aim is not None and self.last_aim.status is not DEAD:
             smart_attack(self, self.last_aim)
         else:
-            range_positions = self.model.grid.get_neighborhood(
-                self.pos,
-                moore=True,
-                include_center=True,
-                radius=self.damage_range) # get x,y in range N
+            grid = self.model.grid
+            in_range = grid.cells_in_range(self.pos,
+                                           self.attributes.damage_range,
+                                           grid.enemies(self.fraction)) # occupied enemy cells in range N
     
-            for position in range_positions: # get all agents in range
-                result = self.model.grid.get_cell_list_contents([position])
-                random.shuffle(result)
-                for cellmate in result:
-                    if cellmate.fraction != self.fraction and cellmate.status != "dead" and not cellmate.type.startswith("projectile_"): # check if enemy
-                        if self.type == "mortar":
-                            self._mortar_shoot(cellmate)
-                        else:
-                            smart_attack(self, cellmate)
-                        break
+            for position, cellmates in in_range: # one random enemy per cell
+                cellmate = self.model.rng.choice(cellmates)
+                if self.type is MORTAR:
+                    self._mortar_shoot(cellmate)
+                else:
+                    smart_attack(self, cellmate)
                         
     def heal_wounded(self):
-        if self.last_heal is not None and self.last_heal.status != "dead":
+        if self.last_heal is not None and self.last_heal.status is not DEAD:
             smart_heal(self, self.last_heal)
             return True
         else:
-            if self.special_attributes["steps_after_healing"] < 10:
-                self.special_attributes["steps_after_healing"] += 1
+            if self.steps_after_healing < 10:
+                self.steps_after_healing += 1
                 return False
             
-            range_positions = self.model.grid.get_neighborhood(
+            in_range = self.model.grid.cells_in_range(
                 self.pos,
-                moore=True,
-                include_center=True,
-                radius=self.special_attributes["healing_range"]) # get x,y in range N
-
-            for position in range_positions: # get all agents in range
-                result = self.model.grid.get_cell_list_contents([position])
-                random.shuffle(result)
-                for cellmate in result:
-                    if cellmate.fraction == self.fraction and cellmate.status == "wounded" and self != cellmate and not cellmate.type.startswith("projectile_"): # check if enemy
-                        smart_heal(self, cellmate)
-                        return True
+                self.attributes.healing_range,
+                [self.fraction]) # occupied ally cells in range N
+
+            for position, cellmates in in_range:
+                wounded = [cellmate for cellmate in cellmates
+                           if cellmate.status is WOUNDED and cellmate is not self]
+                if wounded:
+                    smart_heal(self, self.model.rng.choice(wounded))
+                    return True
             return False
 
     
     ### movements ###
     def move(self):
         
-        if self.type == "medic" and self.special_attributes["steps_after_healing"] < 10:
-            self.special_attributes["steps_after_healing"] += 1
+        if self.type is MEDIC and self.steps_after_healing < 10:
+            self.steps_after_healing += 1
             self.steps_after_attack += 1
             return
         
-        if not self.type.startswith("projectile_") and self.steps_after_attack < 10:
+        if not self.is_projectile and self.steps_after_attack < 10:
             self.steps_after_attack += 1
             return
         
-        if self.movement == "random":
+        if self.movement is RANDOM:
             possible_steps = self.model.grid.get_neighborhood(
                 self.pos,
                 moore=True,
@@ -185,21 +229,31 @@ class SoldierAgent(Agent):
             new_position = self.random.choice(possible_steps)
             self.model.grid.move_agent(self, new_position)
             
-        elif self.movement == "stay":
+        elif self.movement is STAY:
             pass
         
-        elif self.movement == "route":
+        elif self.movement is ROUTE:
             if self.route_index < len(self.route):
                 self.move_towards(self.route[self.route_index])
                 if self.pos == self.route[self.route_index]:
                     self.route_index += 1
-            if self.type.startswith("projectile_") and self.pos == self.route[-1] and self.status != "dead":
+            if self.is_projectile and self.pos == self.route[-1] and self.status is not DEAD:
                 self.attack()
                 self.kill_agent()
+
+        elif self.movement is PATH:
+            if self.route_index < len(self.route):
+                target = self.route[self.route_index]
+                self.follow_path(target)
+                if self.pos == tuple(target):
+                    self.route_index += 1
             
             
         # Check for mines after moving
-        if self.pos in self.model.mine_map and self.model.mine_map[self.pos] > 0:
+        self.check_mines()
+
+    def check_mines(self):
+        if self.model.mine_map.count(self.pos) > 0:
             self.trigger_mine()
 
     def move_towards(self, target):
@@ -216,28 +270,32 @@ class SoldierAgent(Agent):
             new_position = (next_x, next_y)
             self.model.grid.move_agent(self, new_position)
             
+    def follow_path(self, target):
+        """Move one step along the flow field towards the target."""
+        new_position = self.model.paths.next_cell(self.pos, target)
+        if new_position != self.pos:
+            self.model.grid.move_agent(self, new_position)
+
     def trigger_mine(self):
-        if self.type.startswith("projectile_"):
+        if self.is_projectile:
             return
         mine_damage = 80
 
         self.health -= mine_damage
+        self.model.stats.change_health(self, -mine_damage)
         if self.health <= 0:
-            self.health = 0
-            self.status = "dead"
+            self.kill_agent()
 
         # Reduce the number of mines at this location
-        self.model.mine_map[self.pos] -= 1
-        if self.model.mine_map[self.pos] == 0:
-            del self.model.mine_map[self.pos]  # Remove the mine location if no mines are left
+        self.model.mine_map.trigger(self.pos)
 
 def smart_attack(agent_damager, agent_aim):
-    if agent_damager.type.startswith("projectile_") and agent_damager.pos != agent_damager.route[-1]:
+    if agent_damager.is_projectile and agent_damager.pos != agent_damager.route[-1]:
         return
      
     # general change 0 or 1
-    chance = np.random.binomial(n=1, p=agent_damager.damage_chance)
-    basic_damage = agent_damager.damage 
+    chance = agent_damager.model.rng.roll(agent_damager.attributes.damage_chance)
+    basic_damage = agent_damager.attributes.damage
     
     # basic damage amount
     height_map = agent_damager.model.height_map
@@ -248,13 +306,14 @@ def smart_attack(agent_damager, agent_aim):
 
     # atack (change attributes)
     agent_aim.health -= amount_to_damage
-    agent_aim.status = "wounded"
+    agent_damager.model.stats.change_health(agent_aim, -amount_to_damage)
+    agent_aim.status = WOUNDED
     agent_damager.damaged += amount_to_damage
     
     # change status if needed
     if agent_aim.health <= 0:
         agent_aim.kill_agent()
-    if agent_damager.type.startswith("projectile_"):
+    if agent_damager.is_projectile:
         agent_damager.kill_agent()
         
     agent_damager.steps_after_attack = 0
@@ -263,22 +322,70 @@ def smart_attack(agent_damager, agent_aim):
 
 def smart_heal(agent_medic, agent_wounded):
     # variables
-    chance = np.random.binomial(n=1, p=agent_medic.special_attributes["healing_chance"]) # 0 or 1
-    heal_amount = agent_medic.special_attributes["healing"]
+    chance = agent_medic.model.rng.roll(agent_medic.attributes.healing_chance) # 0 or 1
+    heal_amount = agent_medic.attributes.healing
     
     # calculate healing
     result = chance * heal_amount
     
     # heal
+    health_before = agent_wounded.health
     agent_wounded.health += result
     if agent_wounded.health > agent_wounded.max_health:
         agent_wounded.health = agent_wounded.max_health
-        agent_wounded.status = "alive"
+        agent_wounded.status = ALIVE
+    agent_medic.model.stats.change_health(agent_wounded, agent_wounded.health - health_before)
     agent_medic.healed += result
-    agent_medic.special_attributes["steps_after_healing"] = 0
+    agent_medic.steps_after_healing = 0
     agent_medic.last_heal = agent_wounded
 
 
+def _new_agent(model, unique_id, params):
+    """A fresh agent, recycling a dead pooled projectile of the same type if there is one."""
+    pool = model.projectile_pool.get(AgentType.parse(params["type"]))
+    if pool:
+        agent = pool.pop()
+        agent.__init__(unique_id, params, model)
+        return agent
+    return SoldierAgent(unique_id, params, model)
+
+
+def register_agent(model, agent, pos):
+    """Add a new agent to the schedule, the grid, the stats and the engine."""
+    if agent.movement is PATH:
+        # placed before any mine goes off, so paths avoid the mines known at the start
+        model.plan_paths()
+    model.schedule.add(agent)
+    model.grid.place_agent(agent, pos)
+    model.stats.add_agent(agent)
+    if model.engine is not None:
+        model.engine.add_agent(agent)
+    if model.profiler is not None:
+        model.profiler.add_agent(agent)
+
+
+def register_block(model, agents, positions):
+    """
+    `register_agent` for a block of new agents sharing fraction, type and
+    movement: paths are planned once and the grid and stats take the whole
+    block in one call.
+    """
+    if not agents:
+        return
+    if agents[0].movement is PATH:
+        model.plan_paths()
+    for agent in agents:
+        model.schedule.add(agent)
+    model.grid.place_agents(agents, positions)
+    model.stats.add_agents(agents)
+    if model.engine is not None and model.engine.compiled:
+        for agent in agents:
+            model.engine.add_agent(agent)
+    if model.profiler is not None:
+        for agent in agents:
+            model.profiler.add_agent(agent)
+
+
 # place agents to grid
 def place_agents(model, n_soldiers, params, pos=None):
     """
@@ -294,153 +401,31 @@ def place_agents(model, n_soldiers, params, pos=None):
     current_id = model.max_id
     
     for unique_id in range(current_id + 1, current_id + 1 + n_soldiers):
-        agent = SoldierAgent(unique_id, params, model)
-        model.schedule.add(agent)
+        agent = _new_agent(model, unique_id, params)
         
         if pos is None:
             x = model.random.randrange(model.grid.width)
             y = model.random.randrange(model.grid.height)
-            model.grid.place_agent(agent, (x, y))
+            register_agent(model, agent, (x, y))
         else:
-            model.grid.place_agent(agent, pos)
+            register_agent(model, agent, pos)
         
     model.max_id += n_soldiers + 1
 
 
 def add_agents_to_model(model, case=1, n=50, n_medics=0, n_mortars=0):
-    
-    if case == "big_battle":
-        
-        ### ENEMIES ###
-        
-        # mortars 
-        params = {"fraction": "enemy",
-                  "type": "mortar",
-                  "movement": "stop",
-                  "route": []}
-        place_agents(model=model, n_soldiers=1, params=params, pos=(40, 90))
-        place_agents(model=model, n_soldiers=1, params=params, pos=(45, 90))
-        place_agents(model=model, n_soldiers=1, params=params, pos=(50, 90))
-        place_agents(model=model, n_soldiers=1, params=params, pos=(55, 90))
-        place_agents(model=model, n_soldiers=1, params=params, pos=(60, 90))
-        
-        # infantries
-        params = {"fraction": "enemy",
-                  "type": "infantry",
-                  "movement": "stop",
-                  "route": []}
-        
-        place_agents(model=model, n_soldiers=20, params=params, pos=(45, 75))
-        place_agents(model=model, n_soldiers=20, params=params, pos=(55, 75))
-        
-        # infantries with random walking
-        params = {"fraction": "enemy",
-                  "type": "infantry",
-                  "movement": "random",
-                  "route": []}
-        place_agents(model=model, n_soldiers=1, params=params, pos=(50, 80))
-        
-        ### ALLIES ###
-        
-        # mortars 
-        params = {"fraction": "ally", "type": "mortar", "movement": "stop", "route": []}
-        place_agents(model=model, n_soldiers=1, params=params, pos=(40, 10))
-        place_agents(model=model, n_soldiers=1, params=params, pos=(45, 10))
-        place_agents(model=model, n_soldiers=1, params=params, pos=(55, 10))
-        place_agents(model=model, n_soldiers=1, params=params, pos=(60, 10))
-        
-        # infantries 
-        params = {"fraction": "ally",
-                  "type": "infantry",
-                  "movement": "route",
-                  "route": [(40, 90)]}
-        
-        place_agents(model=model, n_soldiers=30,
-                     params=params,
-                     pos=(50, 15))
-        
-        params = {"fraction": "ally",
-                  "type": "medic",
-                  "movement": "route",
-                  "route": [(40, 90)]}
-        place_agents(model=model, n_soldiers=2,
-                     params=params,
-                     pos=(50, 15))
-        
-        params = {"fraction": "ally",
-                  "type": "infantry",
-                  "movement": "route",
-                  "route": [(60, 90)]}
-        place_agents(model=model, n_soldiers=30,
-                     params=params,
-                     pos=(50, 15))
-        
-        params = {"fraction": "ally",
-                  "type": "medic",
-                  "movement": "route",
-                  "route": [(60, 90)]}
-        place_agents(model=model, n_soldiers=2,
-                     params=params,
-                     pos=(50, 15))
-        
-    if case == "small_battle":
-        ### ENEMIES ###
-        
-        # infantries
-        params = {"fraction": "enemy",
-                  "type": "infantry",
-                  "movement": "stop",
-                  "route": []}
-        place_agents(model=model, n_soldiers=5, params=params, pos=(40, 90))
-        place_agents(model=model, n_soldiers=5, params=params, pos=(45, 90))
-        place_agents(model=model, n_soldiers=5, params=params, pos=(50, 90))
-        place_agents(model=model, n_soldiers=5, params=params, pos=(55, 90))
-        place_agents(model=model, n_soldiers=5, params=params, pos=(60, 90))
-        place_agents(model=model, n_soldiers=5, params=params, pos=(40, 70))
-        place_agents(model=model, n_soldiers=5, params=params, pos=(60, 70))
-        
-        ### ALLIES ###
-        
-        # infantries 
-        params = {"fraction": "ally", "type": "infantry", "movement": "route", "route": [(40, 90), (60,90)]}
-        place_agents(model=model, n_soldiers=n//2,
-                     params=params,
-                     pos=(50, 20))
-        if n_medics != 0:
-            params = {"fraction": "ally", "type": "medic", "movement": "route", "route": [(40, 90), (60,90)]}
-            place_agents(model=model, n_soldiers=n_medics,
-                            params=params,
-                            pos=(50, 20))
-        
-        params = {"fraction": "ally", "type": "infantry", "movement": "route", "route": [(60, 90), (40,90)]}
-        place_agents(model=model, n_soldiers=n//2,
-                     params=params,
-                     pos=(50, 20))
-        
-        if n_mortars != 0:
-            params = {"fraction": "ally", "type": "mortar", "movement": "stop", "route": []}
-            place_agents(model=model, n_soldiers=n_mortars,
-                            params=params,
-                            pos=(70, 20))
-        
-    # for visualization
-    if case == 1:
-        params = {"fraction": "enemy", "type": "infantry", "movement": "stop", "route": None}
-        place_agents(model=model, n_soldiers=1, params=params, pos=(60, 80))
-        place_agents(model=model, n_soldiers=1, params=params, pos=(40, 80))
-        place_agents(model=model, n_soldiers=1, params=params, pos=(20, 80))
-
-        params = {"fraction": "ally", "type": "infantry", "movement": "route", "route": [(20, 80), (80, 80)]}
-        place_agents(model=model, n_soldiers=30, params=params, pos=(20, 0))
-
-        params = {"fraction": "ally", "type": "mortar", "movement": "stop", "route": []}
-        place_agents(model=model, n_soldiers=1, params=params, pos=(20, 0))
-        place_agents(model=model, n_soldiers=1, params=params, pos=(60, 0))
-    
-    # for tests
-    if case == 2:
-        params = {"fraction": "enemy", "type": "infantry", "movement": "stop", "route": None}
-        place_agents(model=model, n_soldiers=5, params=params, pos=(60, 80))
+    """
+    Place the agents of a scenario.
+
+    Args:
+        model: The model instance.
+        case: A built-in scenario id ("small_battle", "big_battle", or 1 and 2
+            for "demo" and "test"), a scenario file path or a scenario dict.
+        n, n_medics, n_mortars: Scenario parameters, used by the scenarios
+            that declare n_soldiers, n_medics and n_mortars.
+    """
+    from .scenario import compile_scenario, load_scenario, place_scenario
 
-        params = {"fraction": "ally", "type": "infantry", "movement": "stop", "route": None}
-        place_agents(model=model, n_soldiers=5, params=params, pos=(65, 80))
\ No newline at end of file
+    compiled = compile_scenario(load_scenario(case),
+                                {"n_soldiers": n, "n_medics": n_medics, "n_mortars": n_mortars})
+    place_scenario(model, compiled)
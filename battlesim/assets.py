@@ -0,0 +1,156 @@
+import os
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+import scipy.ndimage
+import cv2
+
+
+class AssetCache():
+    """Process-wide LRU cache for static map layers."""
+
+    def __init__(self, max_entries=16):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, loader):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+        value = loader()
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+ASSET_CACHE = AssetCache()
+
+
+def _file_key(path):
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+
+def _read_only(array):
+    array.setflags(write=False)
+    return array
+
+
+# id of a read-only height map -> (weak reference to it, its fingerprint)
+_fingerprints = {}
+_fingerprints_lock = threading.Lock()
+
+
+def _remember(height_map, fingerprint):
+    key = id(height_map)
+    forget = lambda _: _fingerprints.pop(key, None)
+    with _fingerprints_lock:
+        _fingerprints[key] = (weakref.ref(height_map, forget), fingerprint)
+    return fingerprint
+
+
+def heights_fingerprint(height_map):
+    """
+    Key of a height map, used to cache layers derived from it.
+
+    Maps from `load_heights` are keyed by their file (path, mtime and
+    size); other maps by a hash of their content, computed once per
+    read-only array and on every call for writable ones, which may change.
+    """
+    entry = _fingerprints.get(id(height_map))
+    if entry is not None and entry[0]() is height_map:
+        return entry[1]
+    digest = hashlib.blake2b(np.ascontiguousarray(height_map).tobytes(), digest_size=16)
+    fingerprint = (height_map.shape, digest.hexdigest())
+    if isinstance(height_map, np.ndarray) and not height_map.flags.writeable:
+        _remember(height_map, fingerprint)
+    return fingerprint
+
+
+def file_digest(path):
+    """Content hash of a file, recomputed only when the file changes."""
+
+    def loader():
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, "rb") as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    return ASSET_CACHE.get(("digest",) + _file_key(path), loader)
+
+
+def read_heights_file(path):
+    """Read a height map, choosing the format by file extension.
+
+    `.npy` files are memory-mapped read-only, so every process that opens
+    the same file shares its pages; a directory of chunks (see
+    `battlesim.chunks.save_layer`) opens as a ChunkedLayer that loads
+    chunks on first use; anything else is parsed as text.
+    """
+    if os.path.isdir(path):
+        from .chunks import open_layer
+        return open_layer(path)
+    if os.path.splitext(path)[1] == ".npy":
+        return np.load(path, mmap_mode="r")
+    return _read_only(np.loadtxt(path))
+
+
+def load_heights(path):
+    """Height map, shared and read-only."""
+    key = _file_key(path)
+
+    def loader():
+        height_map = read_heights_file(path)
+        if isinstance(height_map, np.ndarray):
+            _remember(height_map, ("file",) + key)
+        return height_map
+
+    return ASSET_CACHE.get(("heights",) + key, loader)
+
+
+def load_background(image_path, width, height, scaler=10):
+    """Background image resized to the rendered map size, RGB uint8."""
+
+    def loader():
+        image = cv2.imread(image_path)
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        image = cv2.resize(image, dsize=(scaler*width, scaler*height),
+                           interpolation=cv2.INTER_CUBIC)
+        return _read_only(image)
+
+    return ASSET_CACHE.get(("background",) + _file_key(image_path) + (width, height, scaler),
+                           loader)
+
+
+def load_terrain(image_path, height_map, scaler=10, fingerprint=None):
+    """
+    Background with the height map blended over it, as drawn by the
+    `Visualizer` (gray heights with alpha 0.4 on top of the image).
+    """
+    if fingerprint is None:
+        fingerprint = heights_fingerprint(height_map)
+    width, height = height_map.shape[1], height_map.shape[0]
+
+    def loader():
+        image = load_background(image_path, width, height, scaler)
+        zoomed = scipy.ndimage.zoom(height_map.round(1), (scaler, scaler), order=1)
+        span = zoomed.max() - zoomed.min()
+        gray = (zoomed - zoomed.min()) / span if span > 0 else np.zeros_like(zoomed)
+        blended = 0.6 * image + 0.4 * 255 * gray[:, :, None]
+        return _read_only(blended.round().astype(np.uint8))
+
+    return ASSET_CACHE.get(("terrain",) + _file_key(image_path) + (fingerprint, scaler),
+                           loader)
@@ -0,0 +1,131 @@
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from .assets import load_heights
+from .chunks import ChunkedLayer
+from .mines import ChunkedMineField, MineField
+from .model import BattleModel
+from .rng import BattleRandom, spawn_seeds
+from .scenario import ScenarioError, compile_scenario, load_scenario, place_scenario
+from .utils import final_stats, run_battle
+
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+
+def create_model(n_soldiers=50, n_medics=0, n_mines=1, seed=None,
+                 case="small_battle", engine="mesa",
+                 heights_path=None, scenario=None, n_mortars=0, workers=None):
+    """
+    Build the battle of a scenario with a random minefield.
+
+    `scenario` is a built-in id, a file path or a scenario dict and
+    defaults to `case`; the counts are passed as scenario parameters.
+    `heights_path` overrides the height map of the scenario, `workers`
+    sets the processes of the "parallel" engine. The same `seed` gives
+    the same battle; without one a fresh seed is drawn and kept in
+    `model.seed`.
+    """
+
+    # the minefield and the model draw from streams of one seed, so a run is reproducible
+    rng = BattleRandom(seed)
+
+    compiled = compile_scenario(load_scenario(case if scenario is None else scenario),
+                                {"n_soldiers": n_soldiers, "n_medics": n_medics,
+                                 "n_mortars": n_mortars, "n_mines": n_mines})
+    width, height = compiled.width, compiled.height
+    heights_path = heights_path or compiled.heights
+    sparse = compiled.grid == "sparse"
+    if heights_path:
+        height_map = load_heights(heights_path)
+    else:
+        height_map = ChunkedLayer((width, height), np.float32) if sparse else np.zeros((width, height))
+    if tuple(height_map.shape) != (width, height):
+        raise ScenarioError(f"map.heights: {heights_path} is {tuple(height_map.shape)}, "
+                            f"the scenario map is {(width, height)}")
+    if isinstance(height_map, ChunkedLayer) and not sparse:
+        height_map = height_map.to_array()
+    x0, y0, x1, y1 = compiled.mines_area
+    if sparse:
+        # drawn chunk by chunk as agents reach them
+        mine_map = ChunkedMineField.random(width, height, (x0, y0), (x1, y1), compiled.mines_per_cell,
+                                           seed=rng.integer_seed("mines"), chunk=compiled.chunk)
+    else:
+        mine_map = MineField.random(width, height, (x0, y0), (x1, y1), compiled.mines_per_cell,
+                                    seed=rng.integer_seed("mines"))
+
+    model = BattleModel(width=width,
+                        height=height,
+                        height_map=height_map,
+                        mine_map=mine_map,
+                        engine=engine,
+                        seed=rng.seed,
+                        grid=compiled.grid,
+                        chunk=compiled.chunk,
+                        workers=workers)
+    place_scenario(model, compiled)
+    model.scenario = compiled
+    return model
+
+
+def run_replication(n_soldiers=50, n_medics=0, n_mines=1, seed=0,
+                    case="small_battle", max_steps=150, engine="mesa",
+                    heights_path=None, scenario=None, n_mortars=0):
+    """Run one seeded battle and return its final stats."""
+    model = create_model(n_soldiers, n_medics, n_mines, seed=seed, case=case,
+                         engine=engine, heights_path=heights_path, scenario=scenario,
+                         n_mortars=n_mortars)
+    run_battle(model, max_steps=max_steps)
+    model.close()
+    return final_stats(model)
+
+
+def _run_job(job):
+    return run_replication(**job)
+
+
+def replication_seeds(seed, replications):
+    """Independent per-replication seeds derived from one batch seed."""
+    return spawn_seeds(seed, replications)
+
+
+def aggregate_stats(results):
+    """Mean, std and quantiles of every stat over replications."""
+    aggregate = {}
+    for key in results[0]:
+        values = np.array([result[key] for result in results], dtype=float)
+        aggregate[key] = {"mean": float(values.mean()),
+                          "std": float(values.std()),
+                          "quantiles": {str(q): float(np.quantile(values, q))
+                                        for q in QUANTILES}}
+    return aggregate
+
+
+def run_batch(n_soldiers=50, n_medics=0, n_mines=1, replications=10, seed=0,
+              max_workers=None, **kwargs):
+    """
+    Run seeded replications of one scenario in a process pool.
+
+    Args:
+        n_soldiers, n_medics, n_mines: Scenario parameters, as in /run_simulation.
+        replications: Number of independent battles.
+        seed: Batch seed; the same seed always gives the same results.
+        max_workers: Pool size, defaults to the number of cores.
+        kwargs: Passed to `run_replication` (scenario, max_steps, engine, ...).
+
+    Returns:
+        Dict with the per-replication `final_stats` and their aggregate.
+    """
+
+    seeds = replication_seeds(seed, replications)
+    jobs = [dict(n_soldiers=n_soldiers, n_medics=n_medics, n_mines=n_mines,
+                 seed=s, **kwargs) for s in seeds]
+
+    max_workers = max_workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=min(max_workers, replications)) as executor:
+        chunksize = max(1, replications // (4 * max_workers))
+        results = list(executor.map(_run_job, jobs, chunksize=chunksize))
+
+    return {"seeds": seeds,
+            "replications": results,
+            "aggregate": aggregate_stats(results)}
@@ -0,0 +1,372 @@
+"""
+Benchmarks of the simulation, the map and frame code, and the API.
+
+    python -m battlesim.benchmark run --out results.json [--quick] [--api local|URL]
+    python -m battlesim.benchmark compare base.json results.json [--threshold 0.1]
+
+Every benchmark runs a fixed, seeded workload, so two result files measure
+the same work and `compare` only sees the speed of the code. Metrics ending
+in `_per_s` are better when higher, all others (`_ms`, `_us`) when lower.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .assets import ASSET_CACHE
+from .batch import create_model
+from .engine import PROJECTILE
+from .map_creator import MapCreator
+from .scenario import _count, load_scenario
+from .utils import final_stats, run_battle
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = ("small_battle", "big_battle")
+ENGINES = ("mesa", "vector")  # "parallel" on request, it only pays off with many cores
+SIZES = (50, 500, 5000, 50000)
+QUICK_SIZES = (50, 500)
+CONCURRENCY = (1, 4, 16)
+
+
+### helpers ###
+def _median_ms(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return 1000 * statistics.median(times)
+
+
+def scaled_scenario(source, n_agents):
+    """
+    Scenario with every unit count scaled so the battle has about `n_agents`
+    agents; units keep their proportions and at least one agent each.
+    """
+    spec = load_scenario(source)
+    params = spec.get("params", {})
+    counts = [_count(unit.get("count", 1), params, f"units[{i}].count")
+              for i, unit in enumerate(spec["units"])]
+    # units spawning at several points place `count` agents at each
+    points = [len(unit["pos"]) if unit.get("pos") and isinstance(unit["pos"][0], list) else 1
+              for unit in spec["units"]]
+    factor = n_agents / sum(count * n for count, n in zip(counts, points))
+    for unit, count in zip(spec["units"], counts):
+        unit["count"] = max(1, round(count * factor)) if count else 0
+    spec["id"] = f"{spec.get('id', 'scenario')}@{n_agents}"
+    return spec
+
+
+def default_steps(n_agents):
+    """Steps timed per size, fixed so that results stay comparable."""
+    return int(np.clip(200000 // n_agents, 3, 50))
+
+
+### benchmarks ###
+def bench_step(scenario, engine, n_agents, seed=0, steps=None):
+    """Throughput of `BattleModel.step` on a scaled scenario."""
+    steps = steps or default_steps(n_agents)
+    start = time.perf_counter()
+    model = create_model(seed=seed, engine=engine, scenario=scaled_scenario(scenario, n_agents))
+    setup = time.perf_counter() - start
+
+    # the first step also builds the arrays of the vector engine
+    start = time.perf_counter()
+    model.step()
+    first_step = time.perf_counter() - start
+
+    agent_steps, elapsed = 0, 0.0
+    for _ in range(steps):
+        agent_steps += model.schedule.get_agent_count()
+        start = time.perf_counter()
+        model.step()
+        elapsed += time.perf_counter() - start
+    return {"agents": n_agents,
+            "steps": steps,
+            "setup_ms": 1000 * setup,
+            "first_step_ms": 1000 * first_step,
+            "step_ms": 1000 * elapsed / steps,
+            "steps_per_s": steps / elapsed,
+            "agent_steps_per_s": agent_steps / elapsed}
+
+
+def bench_parallel_scan(n_agents=5000, workers=None, seed=0, repeat=5):
+    """
+    One target scan of every live agent of a scaled big battle, by the
+    vector engine and split over `workers` processes (at least 2) by the
+    parallel engine.
+    """
+    workers = max(workers or os.cpu_count() or 1, 2)
+    spec = scaled_scenario("big_battle", n_agents)
+    times = {}
+    for engine in ("vector", "parallel"):
+        model = create_model(seed=seed, engine=engine, scenario=spec, workers=workers)
+        try:
+            model.step()
+            engine = model.engine
+            attackers = np.flatnonzero(engine.live() & (engine.kind != PROJECTILE))
+            if engine.name == "parallel" and not engine._parallel(attackers):
+                raise RuntimeError(f"{len(attackers)} attackers are too few for a parallel scan")
+            engine._scan_targets(attackers)  # start the workers
+            times[engine.name] = _median_ms(lambda: engine._scan_targets(attackers), repeat)
+        finally:
+            model.close()
+    return {"agents": n_agents,
+            "workers": workers,
+            "vector_scan_ms": times["vector"],
+            "parallel_scan_ms": times["parallel"],
+            "speedup": times["vector"] / times["parallel"]}
+
+
+def bench_read_heights(path="database/heights.txt", repeat=5):
+    """`MapCreator.read_heights` from disk and from the asset cache."""
+    creator = MapCreator(100)
+
+    def cold():
+        ASSET_CACHE.clear()
+        creator.read_heights(path)
+
+    cold_ms = _median_ms(cold, repeat)
+    return {"cold_ms": cold_ms,
+            "warm_us": 1000 * _median_ms(lambda: creator.read_heights(path), 100 * repeat)}
+
+
+def bench_plot_teritory(n_agents=500, seed=0, repeat=5):
+    """Frame time of `Visualizer.plot_teritory` and of the raster renderer, alone and as PNG."""
+    import matplotlib
+    matplotlib.use("Agg")
+    from .visualizer import Visualizer
+
+    model = create_model(seed=seed, scenario=scaled_scenario("small_battle", n_agents))
+    for _ in range(10):
+        model.step()
+    visualizer = Visualizer(model, "database/image.png")
+    visualizer.plot_teritory()  # warm the terrain caches
+    visualizer.raster()
+
+    def png():
+        visualizer.plot_teritory().savefig(io.BytesIO(), format="png", bbox_inches='tight', pad_inches=0)
+
+    return {"agents": n_agents,
+            "frame_ms": _median_ms(visualizer.plot_teritory, repeat),
+            "png_frame_ms": _median_ms(png, repeat),
+            "raster_frame_ms": _median_ms(visualizer.raster, 10 * repeat),
+            "raster_png_frame_ms": _median_ms(visualizer.render, 10 * repeat)}
+
+
+def bench_final_stats(seed=0, repeat=10000):
+    model = create_model(seed=seed)
+    run_battle(model)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        final_stats(model)
+    return {"call_us": 1e6 * (time.perf_counter() - start) / repeat}
+
+
+def _get(url):
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=600) as response:
+            response.read()
+            ok = response.status == 200
+    except OSError:
+        ok = False
+    return time.perf_counter() - start, ok
+
+
+def bench_api(base_url, concurrency, requests=32, seed=0, cached=False, **params):
+    """
+    Latency and throughput of `/run_simulation` with `concurrency` clients.
+
+    Requests are seeded; uncached runs pass a large `time_budget`, which
+    keeps the result reproducible but skips the result cache of the server.
+    """
+    params = {"n_soldiers": 50, "render": "false", **params}
+    if not cached:
+        params["time_budget"] = 3600
+    # cached requests all ask for the same battle, uncached ones for different ones
+    seeds = [seed] * requests if cached else range(seed, seed + requests)
+    urls = [f"{base_url}/run_simulation?{urllib.parse.urlencode({**params, 'seed': s})}" for s in seeds]
+    if cached:
+        _get(urls[0])  # the first request fills the cache
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(_get, urls))
+    elapsed = time.perf_counter() - start
+
+    latencies = 1000 * np.array([latency for latency, ok in results])
+    return {"concurrency": concurrency,
+            "requests": requests,
+            "errors": sum(not ok for latency, ok in results),
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p95_ms": float(np.percentile(latencies, 95)),
+            "p99_ms": float(np.percentile(latencies, 99)),
+            "requests_per_s": requests / elapsed}
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_local_server(timeout=60):
+    """Start `api.py` on a free local port, return the process and its URL."""
+    port = _free_port()
+    process = subprocess.Popen([sys.executable, "-m", "flask", "--app", "api", "run",
+                                "--port", str(port), "--with-threads"],
+                               cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("the API server exited on start")
+        if _get(url + "/scenarios")[1]:
+            return process, url
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"the API server did not start within {timeout}s")
+
+
+### suite ###
+def machine_info():
+    import mesa
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": commit,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "mesa": mesa.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count()}
+
+
+def run_suite(sizes=SIZES, engines=ENGINES, scenarios=SCENARIOS, api=None,
+              concurrency=CONCURRENCY, api_requests=32, seed=0, log=print):
+    """
+    Run every benchmark and return the results as a JSON-ready dict.
+
+    `api` is the URL of a running server, "local" to start one, or None to
+    skip the API benchmarks.
+    """
+    benchmarks = {}
+
+    def record(name, function, *args, **kwargs):
+        log(f"{name} ...")
+        benchmarks[name] = function(*args, **kwargs)
+        log(f"{name}: {benchmarks[name]}")
+
+    for scenario in scenarios:
+        for engine in engines:
+            for n_agents in sizes:
+                record(f"step/{scenario}/{engine}/{n_agents}", bench_step, scenario, engine, n_agents, seed=seed)
+    record("parallel_scan", bench_parallel_scan, seed=seed)
+    record("read_heights", bench_read_heights)
+    record("plot_teritory", bench_plot_teritory, seed=seed)
+    record("final_stats", bench_final_stats, seed=seed)
+
+    if api is not None:
+        server, url = start_local_server() if api == "local" else (None, api.rstrip("/"))
+        try:
+            for clients in concurrency:
+                record(f"api/run_simulation/c{clients}", bench_api, url, clients,
+                       requests=api_requests, seed=seed)
+                record(f"api/run_simulation/cached/c{clients}", bench_api, url, clients,
+                       requests=api_requests, seed=seed, cached=True)
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+
+    return {"meta": {**machine_info(), "seed": seed}, "benchmarks": benchmarks}
+
+
+def compare(base, new, threshold=0.1):
+    """
+    Relative change of every metric present in two results.
+
+    Returns rows (benchmark, metric, base, new, change, regressed), where
+    `change` is positive when `new` is better and `regressed` is set when
+    it is worse by more than `threshold`.
+    """
+    rows = []
+    for name, metrics in base["benchmarks"].items():
+        for metric, before in metrics.items():
+            after = new["benchmarks"].get(name, {}).get(metric)
+            if after is None or not metric.endswith(("_per_s", "_ms", "_us")) or not before:
+                continue
+            change = (after - before) / before
+            if not metric.endswith("_per_s"):
+                change = -change
+            rows.append((name, metric, before, after, change, change < -threshold))
+    return rows
+
+
+def _load(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m battlesim.benchmark", description=__doc__.split("\n")[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="run the benchmarks")
+    run.add_argument("--out", default="benchmark.json", help="result file (default: benchmark.json)")
+    run.add_argument("--quick", action="store_true", help=f"only {QUICK_SIZES} agents")
+    run.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="agent counts")
+    run.add_argument("--engines", nargs="+", default=ENGINES, choices=ENGINES + ("parallel",))
+    run.add_argument("--scenarios", nargs="+", default=SCENARIOS)
+    run.add_argument("--api", help='API to load: a server URL or "local" to start one')
+    run.add_argument("--concurrency", type=int, nargs="+", default=CONCURRENCY)
+    run.add_argument("--requests", type=int, default=32, help="requests per concurrency level")
+    run.add_argument("--seed", type=int, default=0)
+
+    diff = commands.add_parser("compare", help="compare two result files")
+    diff.add_argument("base")
+    diff.add_argument("new")
+    diff.add_argument("--threshold", type=float, default=0.1,
+                      help="relative slowdown reported as a regression (default: 0.1)")
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        results = run_suite(sizes=QUICK_SIZES if args.quick else args.sizes,
+                            engines=args.engines,
+                            scenarios=args.scenarios,
+                            api=args.api,
+                            concurrency=args.concurrency,
+                            api_requests=args.requests,
+                            seed=args.seed)
+        with open(args.out, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"results written to {args.out}")
+        return 0
+
+    rows = compare(_load(args.base), _load(args.new), args.threshold)
+    for name, metric, before, after, change, regressed in rows:
+        print(f"{'REGRESSION' if regressed else '':<10} {name:<40} {metric:<18} "
+              f"{before:>12.4g} {after:>12.4g} {100 * change:>+8.1f}%")
+    regressions = sum(row[-1] for row in rows)
+    print(f"{regressions} regression(s) beyond {100 * args.threshold:.0f}%")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from .agents import ATTRIBUTES
+from .assets import file_digest
+from .rng import RNG_VERSION
+
+ATTRIBUTES_VERSION = hashlib.blake2b(json.dumps(ATTRIBUTES, sort_keys=True).encode(),
+                                     digest_size=8).hexdigest()
+
+
+def result_key(params, heights_path="database/heights.txt"):
+    """
+    Cache key of a seeded run: every scenario parameter plus the content of
+    the height map and the versions of the attribute table and of the
+    random streams.
+    """
+    key = dict(params,
+               heights=file_digest(heights_path) if heights_path else None,
+               attributes=ATTRIBUTES_VERSION,
+               rng=RNG_VERSION)
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+class ResultCache():
+    """
+    Cache of simulation results with single-flight deduplication.
+
+    Results live in an in-memory LRU tier and, when `db_path` is given, in
+    an SQLite tier evicted by least recent access once it grows past
+    `max_db_bytes`. Concurrent requests for a key that is being computed
+    wait for that one computation instead of starting their own.
+    """
+
+    def __init__(self, max_entries=1024, db_path=None, max_db_bytes=64 * 2**20):
+        self.max_entries = max_entries
+        self.max_db_bytes = max_db_bytes
+        self.memory = OrderedDict()
+        self.inflight = {}
+        self.lock = threading.Lock()
+        self.counters = {"hits": 0, "disk_hits": 0, "shared": 0, "misses": 0}
+
+        self.db = None
+        if db_path is not None:
+            self.db = sqlite3.connect(db_path, check_same_thread=False)
+            self.db.execute("CREATE TABLE IF NOT EXISTS results "
+                            "(key TEXT PRIMARY KEY, value TEXT, size INTEGER, accessed REAL)")
+            self.db.commit()
+
+    ### tiers ###
+    def _remember(self, key, value):
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def _disk_get(self, key):
+        row = self.db.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self.db.execute("UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key))
+        self.db.commit()
+        return json.loads(row[0])
+
+    def _disk_put(self, key, value):
+        text = json.dumps(value)
+        self.db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                        (key, text, len(text), time.time()))
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        while total > self.max_db_bytes:
+            key_, size = self.db.execute(
+                "SELECT key, size FROM results ORDER BY accessed LIMIT 1").fetchone()
+            self.db.execute("DELETE FROM results WHERE key = ?", (key_,))
+            total -= size
+        self.db.commit()
+
+    ### public ###
+    def get_or_compute(self, key, compute):
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.counters["hits"] += 1
+                return self.memory[key]
+            if self.db is not None:
+                value = self._disk_get(key)
+                if value is not None:
+                    self._remember(key, value)
+                    self.counters["disk_hits"] += 1
+                    return value
+            future = self.inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self.inflight[key] = Future()
+                self.counters["misses"] += 1
+            else:
+                self.counters["shared"] += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            value = compute()
+        except BaseException as error:
+            with self.lock:
+                self.inflight.pop(key, None)
+            future.set_exception(error)
+            raise
+
+        with self.lock:
+            self._remember(key, value)
+            if self.db is not None:
+                self._disk_put(key, value)
+            self.inflight.pop(key, None)
+        future.set_result(value)
+        return value
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters, entries=len(self.memory), inflight=len(self.inflight))
+            if self.db is not None:
+                stats["disk_entries"], stats["disk_bytes"] = self.db.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        return stats
@@ -0,0 +1,193 @@
+import json
+import os
+
+import numpy as np
+
+CHUNK = 256  # cells per chunk side
+
+LAYER_FILE = "layer.json"
+
+
+class ChunkFiles():
+    """Chunks saved by `save_layer`, one `.npy` per chunk, memory-mapped read-only."""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def load(self, cx, cy, shape):
+        path = os.path.join(self.directory, f"{cx}_{cy}.npy")
+        if not os.path.exists(path):
+            return None
+        return np.load(path, mmap_mode="r")
+
+
+class ChunkedLayer():
+    """
+    2D layer of fixed-size chunks, indexed as layer[x, y] like an array.
+
+    Chunks are materialized on first use: loaded from `source` (chunk
+    files, or generated), or allocated when a cell is written. Cells of
+    chunks the source does not have read as `fill` and take no memory, so
+    a layer costs memory for the area that was touched, not for the map.
+    Indices are (x, y) integers or arrays of them.
+    """
+
+    def __init__(self, shape, dtype, chunk=CHUNK, source=None, fill=0):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.chunk = chunk
+        self.source = source
+        self.fill = fill
+        self.chunks = {}
+        self.missing = set()  # chunks the source does not have
+
+    def _shape(self, cx, cy):
+        c = self.chunk
+        return (min(c, self.shape[0] - cx * c), min(c, self.shape[1] - cy * c))
+
+    def _chunk(self, cx, cy, write=False):
+        chunk = self.chunks.get((cx, cy))
+        if chunk is None and self.source is not None and (cx, cy) not in self.missing:
+            chunk = self.source.load(cx, cy, self._shape(cx, cy))
+            if chunk is None:
+                self.missing.add((cx, cy))
+            else:
+                self.chunks[(cx, cy)] = chunk
+        if write:
+            if chunk is None:
+                chunk = np.full(self._shape(cx, cy), self.fill, dtype=self.dtype)
+                self.chunks[(cx, cy)] = chunk
+            elif not chunk.flags.writeable:
+                chunk = self.chunks[(cx, cy)] = np.array(chunk, dtype=self.dtype)
+        return chunk
+
+    def _groups(self, x, y):
+        """Chunks of the cells (x, y), with the positions of their cells."""
+        c = self.chunk
+        key = (x // c) * ((self.shape[1] + c - 1) // c) + y // c
+        order = np.argsort(key, kind="stable")
+        keys, starts = np.unique(key[order], return_index=True)
+        for i, start in enumerate(starts):
+            members = order[start:starts[i + 1] if i + 1 < len(starts) else len(order)]
+            yield x[members[0]] // c, y[members[0]] // c, members
+
+    def __getitem__(self, key):
+        x, y = key
+        c = self.chunk
+        if np.isscalar(x) and np.isscalar(y):
+            chunk = self._chunk(x // c, y // c)
+            return self.dtype.type(self.fill) if chunk is None else chunk[x % c, y % c]
+        x, y = np.broadcast_arrays(np.asarray(x, dtype=np.int64), np.asarray(y, dtype=np.int64))
+        values = np.full(x.shape, self.fill, dtype=self.dtype)
+        flat_x, flat_y, flat = x.ravel(), y.ravel(), values.reshape(-1)
+        for cx, cy, members in self._groups(flat_x, flat_y):
+            chunk = self._chunk(int(cx), int(cy))
+            if chunk is not None:
+                flat[members] = chunk[flat_x[members] % c, flat_y[members] % c]
+        return values
+
+    def __setitem__(self, key, value):
+        x, y = key
+        c = self.chunk
+        if np.isscalar(x) and np.isscalar(y):
+            self._chunk(x // c, y // c, write=True)[x % c, y % c] = value
+            return
+        x, y = np.broadcast_arrays(np.asarray(x, dtype=np.int64), np.asarray(y, dtype=np.int64))
+        value = np.broadcast_to(np.asarray(value, dtype=self.dtype), x.shape).ravel()
+        x, y = x.ravel(), y.ravel()
+        for cx, cy, members in self._groups(x, y):
+            self._chunk(int(cx), int(cy), write=True)[x[members] % c, y[members] % c] = value[members]
+
+    def subtract_at(self, x, y, n=1):
+        """Unbuffered `layer[x, y] -= n`: repeated cells are decremented once per repeat."""
+        c = self.chunk
+        x, y = np.asarray(x, dtype=np.int64), np.asarray(y, dtype=np.int64)
+        for cx, cy, members in self._groups(x, y):
+            np.subtract.at(self._chunk(int(cx), int(cy), write=True), (x[members] % c, y[members] % c), n)
+
+    def chunk_indices(self):
+        """Every chunk of the map, materialized or not."""
+        c = self.chunk
+        for cx in range((self.shape[0] + c - 1) // c):
+            for cy in range((self.shape[1] + c - 1) // c):
+                yield cx, cy
+
+    def nonzero(self):
+        """Cells that are not zero, like `np.nonzero`; reads every chunk of the source."""
+        xs, ys = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.int64)]
+        for cx, cy in self.chunk_indices():
+            chunk = self._chunk(cx, cy)
+            if chunk is None:
+                if self.fill:
+                    raise ValueError("nonzero of a layer with a non-zero fill")
+                continue
+            x, y = np.nonzero(chunk)
+            xs.append(x + cx * self.chunk)
+            ys.append(y + cy * self.chunk)
+        return np.concatenate(xs), np.concatenate(ys)
+
+    def to_array(self):
+        """The whole layer as a dense array."""
+        array = np.full(self.shape, self.fill, dtype=self.dtype)
+        c = self.chunk
+        for cx, cy in self.chunk_indices():
+            chunk = self._chunk(cx, cy)
+            if chunk is not None:
+                array[cx * c:cx * c + chunk.shape[0], cy * c:cy * c + chunk.shape[1]] = chunk
+        return array
+
+    def copy(self):
+        """Independent layer: written chunks are copied, source chunks are shared read-only."""
+        layer = ChunkedLayer(self.shape, self.dtype, self.chunk, self.source, self.fill)
+        layer.chunks = {key: chunk if not chunk.flags.writeable else chunk.copy()
+                        for key, chunk in self.chunks.items()}
+        layer.missing = set(self.missing)
+        return layer
+
+    @property
+    def nbytes(self):
+        """Memory held by materialized chunks, not counting memory-mapped files."""
+        return sum(chunk.nbytes for chunk in self.chunks.values() if not isinstance(chunk, np.memmap))
+
+    def __getstate__(self):
+        # chunks still as in the source are loaded again after unpickling
+        state = dict(self.__dict__)
+        state["chunks"] = {key: np.asarray(chunk) for key, chunk in self.chunks.items() if chunk.flags.writeable}
+        return state
+
+
+def as_layer(layer):
+    """A ChunkedLayer as it is, anything else as an ndarray."""
+    return layer if isinstance(layer, ChunkedLayer) else np.asarray(layer)
+
+
+def save_layer(array, directory, chunk=CHUNK, fill=0):
+    """
+    Write a 2D array (or ChunkedLayer) as a chunk directory for `open_layer`.
+    Chunks that only hold `fill` are not written.
+    """
+    os.makedirs(directory, exist_ok=True)
+    width, height = array.shape
+    for cx in range((width + chunk - 1) // chunk):
+        for cy in range((height + chunk - 1) // chunk):
+            x0, y0 = cx * chunk, cy * chunk
+            x1, y1 = min(x0 + chunk, width), min(y0 + chunk, height)
+            if isinstance(array, ChunkedLayer):
+                x, y = np.meshgrid(np.arange(x0, x1), np.arange(y0, y1), indexing="ij")
+                block = array[x, y]
+            else:
+                block = np.asarray(array[x0:x1, y0:y1])
+            if np.all(block == fill):
+                continue
+            np.save(os.path.join(directory, f"{cx}_{cy}.npy"), block)
+    with open(os.path.join(directory, LAYER_FILE), "w") as file:
+        json.dump({"shape": [width, height], "dtype": np.dtype(array.dtype).str,
+                   "chunk": chunk, "fill": fill}, file)
+
+
+def open_layer(directory):
+    """ChunkedLayer over a directory written by `save_layer`; chunks load on first use."""
+    with open(os.path.join(directory, LAYER_FILE)) as file:
+        meta = json.load(file)
+    return ChunkedLayer(meta["shape"], meta["dtype"], chunk=meta["chunk"],
+                        source=ChunkFiles(directory), fill=meta["fill"])
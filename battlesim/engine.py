@@ -0,0 +1,616 @@
+import numpy as np
+
+from .chunks import as_layer
+
+from .enums import AgentType, Fraction, Movement, Status
+
+# integer codes used by the array engine, the values of the enums
+FRACTIONS = tuple(Fraction)
+STATUSES = tuple(Status)
+ALIVE, WOUNDED, DEAD = Status.ALIVE.value, Status.WOUNDED.value, Status.DEAD.value
+INFANTRY, MEDIC, MORTAR = AgentType.INFANTRY.value, AgentType.MEDIC.value, AgentType.MORTAR.value
+PROJECTILE = AgentType.PROJECTILE_120MM.value
+RANDOM, ROUTE, STAY, PATH = Movement.RANDOM.value, Movement.ROUTE.value, Movement.STAY.value, Movement.PATH.value
+
+MINE_DAMAGE = 80
+WAIT_STEPS = 10
+SHOT_STEPS = 30
+MAX_PAIRS = 2_000_000  # pairwise distance chunk size
+
+# per-agent row arrays
+COLUMNS = ("fraction", "kind", "status", "health", "max_health", "speed", "damage",
+           "damage_range", "damage_chance", "x", "y", "steps_after_attack", "damaged", "healed",
+           "healing", "healing_chance", "healing_range", "steps_after_healing", "steps_after_shot",
+           "last_aim", "last_heal", "movement", "route", "route_len", "route_index")
+
+MOORE = np.array([(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)
+                  if (dx, dy) != (0, 0)])
+
+
+def cell_pairs(x, y, sources, radius, cell_x, cell_y):
+    """
+    All (source, cell) pairs within Chebyshev `radius` of the agents at
+    `x`, `y`, ordered by source then cell; returns the source rows and
+    the cell positions.
+    """
+    src, cells = [], []
+    if len(sources) == 0 or len(cell_x) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    chunk = max(1, MAX_PAIRS // len(cell_x))
+    for start in range(0, len(sources), chunk):
+        part = sources[start:start + chunk]
+        dist = np.maximum(np.abs(x[part, None] - cell_x[None, :]),
+                          np.abs(y[part, None] - cell_y[None, :]))
+        rows, cols = np.nonzero(dist <= radius[start:start + chunk, None])
+        src.append(part[rows])
+        cells.append(cols)
+    return np.concatenate(src), np.concatenate(cells)
+
+
+def _pad_routes(route, width):
+    return np.pad(route, ((0, 0), (0, width - route.shape[1]), (0, 0)))
+
+
+class VectorEngine():
+    """Structure-of-arrays backend for BattleModel.
+
+    Agents placed with `place_agents` are compiled into NumPy arrays on the
+    first step. Every phase (healing, targeting, damage, movement, mines)
+    is then resolved for all agents at once against the state at the start
+    of the phase, instead of one `SoldierAgent.step` call per agent.
+    Dead rows are dropped once they make up half of the arrays, so the
+    cost of a step follows the live agents, not the shots fired so far.
+    The rules follow the Mesa agents: agents without a locked aim hit one
+    random enemy in every occupied cell within range, mortars spend one
+    reload tick per enemy cell and projectiles detonate on arrival.
+    The Mesa agents are only written back when read, see `sync`.
+    """
+
+    name = "vector"
+
+    def __init__(self, model):
+        self.model = model
+        self.compiled = False
+        self.synced = True  # whether the Mesa agents match the arrays
+        self.rng = model.rng.generator("engine")
+        self.compactions = 0    # times the rows were renumbered by `_compact`
+        self.cells_scanned = 0  # (agent, cell) pairs looked at by target and healing scans
+
+    ### compilation ###
+    def _columns(self, agents, index):
+        """Column arrays for `agents`; `index` maps id(agent) to its row."""
+        columns = dict(
+            fraction=np.array([a.fraction for a in agents], dtype=np.int8),
+            kind=np.array([a.type for a in agents], dtype=np.int8),
+            status=np.array([a.status for a in agents], dtype=np.int8),
+            health=np.array([a.health for a in agents], dtype=float),
+            max_health=np.array([a.max_health for a in agents], dtype=float),
+            speed=np.array([a.speed for a in agents], dtype=np.int16),
+            damage=np.array([a.damage for a in agents], dtype=float),
+            damage_range=np.array([a.damage_range for a in agents], dtype=np.int32),
+            damage_chance=np.array([a.damage_chance for a in agents], dtype=float),
+            x=np.array([a.pos[0] for a in agents], dtype=np.int32),
+            y=np.array([a.pos[1] for a in agents], dtype=np.int32),
+            steps_after_attack=np.array([a.steps_after_attack for a in agents], dtype=np.int32),
+            damaged=np.array([a.damaged for a in agents], dtype=float),
+            healed=np.array([a.healed for a in agents], dtype=float),
+            healing=np.array([a.attributes.healing for a in agents], dtype=float),
+            healing_chance=np.array([a.attributes.healing_chance for a in agents], dtype=float),
+            healing_range=np.array([a.attributes.healing_range for a in agents], dtype=np.int32),
+            steps_after_healing=np.array([a.steps_after_healing for a in agents], dtype=np.int32),
+            steps_after_shot=np.array([a.steps_after_shot for a in agents], dtype=np.int32),
+            last_aim=np.array([index.get(id(a.last_aim), -1) for a in agents], dtype=np.int64),
+            last_heal=np.array([index.get(id(a.last_heal), -1) for a in agents], dtype=np.int64),
+            movement=np.array([a.movement for a in agents], dtype=np.int8))
+
+        routes = [a.route or [] for a in agents]
+        length = max([len(r) for r in routes] + [2])
+        route = np.zeros((len(agents), length, 2), dtype=np.int32)
+        for i, r in enumerate(routes):
+            if r:
+                route[i, :len(r)] = r
+        columns.update(
+            route=route,
+            route_len=np.array([len(r) for r in routes], dtype=np.int32),
+            route_index=np.array([a.route_index for a in agents], dtype=np.int32))
+        return columns
+
+    def block_columns(self, blocks, routes, x, y):
+        """
+        Column arrays of freshly placed agents, from the blocks of a compiled
+        scenario (per-block fraction, type, movement, route id and count)
+        and the spawn cells, without reading the agents.
+        """
+        counts = blocks["count"]
+        attrs = [self.model.type_attributes[AgentType(kind)] for kind in blocks["type"]]
+
+        def per_block(values, dtype):
+            return np.repeat(np.array(values, dtype=dtype), counts)
+
+        def attribute(name, dtype=float):
+            return per_block([getattr(a, name) for a in attrs], dtype)
+
+        n = int(counts.sum())
+        max_health = attribute("max_health")
+        length = max([len(r) for r in routes] + [2])
+        route = np.zeros((len(routes), length, 2), dtype=np.int32)
+        for i, r in enumerate(routes):
+            if r:
+                route[i, :len(r)] = r
+        return dict(
+            fraction=per_block(blocks["fraction"], np.int8),
+            kind=per_block(blocks["type"], np.int8),
+            status=np.full(n, ALIVE, dtype=np.int8),
+            health=max_health.copy(),
+            max_health=max_health,
+            speed=attribute("speed", np.int16),
+            damage=attribute("damage"),
+            damage_range=attribute("damage_range", np.int32),
+            damage_chance=attribute("damage_chance"),
+            x=np.asarray(x, dtype=np.int32),
+            y=np.asarray(y, dtype=np.int32),
+            steps_after_attack=np.zeros(n, dtype=np.int32),
+            damaged=np.zeros(n),
+            healed=np.zeros(n),
+            healing=attribute("healing"),
+            healing_chance=attribute("healing_chance"),
+            healing_range=attribute("healing_range", np.int32),
+            steps_after_healing=attribute("steps_after_healing", np.int32),
+            steps_after_shot=attribute("steps_after_shot", np.int32),
+            last_aim=np.full(n, -1, dtype=np.int64),
+            last_heal=np.full(n, -1, dtype=np.int64),
+            movement=per_block(blocks["movement"], np.int8),
+            route=route[np.repeat(blocks["route"], counts)],
+            route_len=per_block([len(routes[r]) for r in blocks["route"]], np.int32),
+            route_index=np.zeros(n, dtype=np.int32))
+
+    def compile(self, columns=None):
+        """Build the arrays from the agents, or take `columns` already built for them."""
+        model = self.model
+        agents = list(model.schedule.agents)
+
+        self.agents = agents
+        self.n = len(agents)
+        if columns is None:
+            index = {id(a): i for i, a in enumerate(agents)}
+            columns = self._columns(agents, index)
+        for name, values in columns.items():
+            setattr(self, name, values)
+        self.calibers = {i: a.attributes.caliber for i, a in enumerate(agents)
+                         if a.attributes.caliber is not None}
+
+        self.width = model.grid.width
+        self.height = model.grid.height
+        self.height_map = as_layer(model.height_map)
+        self.mines = model.mine_map.grid  # shared with the model, no sync needed
+        self.pending = []
+
+        self.compiled = True
+
+    def close(self):
+        """Release what the engine holds outside the model; nothing here."""
+
+    def add_agent(self, agent):
+        """Agents placed after compilation join as new rows on the next step."""
+        if self.compiled:
+            self.pending.append(agent)
+
+    def _append(self, rows, agents=None):
+        """Append new rows given as a dict of column arrays."""
+        k = len(rows["x"])
+        width = max(self.route.shape[1], rows["route"].shape[1])
+        self.route = _pad_routes(self.route, width)
+        rows["route"] = _pad_routes(rows["route"], width)
+        for name, values in rows.items():
+            setattr(self, name, np.concatenate([getattr(self, name), values]))
+        for i, agent in enumerate(agents or []):
+            if agent.attributes.caliber is not None:
+                self.calibers[self.n + i] = agent.attributes.caliber
+        self.agents.extend(agents if agents is not None else [None] * k)
+        self.n += k
+
+    def _add_pending(self):
+        agents, self.pending = self.pending, []
+        index = {id(a): i for i, a in enumerate(self.agents) if a is not None}
+        index.update({id(a): self.n + i for i, a in enumerate(agents)})
+        self._append(self._columns(agents, index), agents)
+
+    def _compact(self):
+        """Drop the dead rows, keeping the order of the live ones."""
+        keep = np.flatnonzero(self.status != DEAD)
+        remap = np.full(self.n + 1, -1, dtype=np.int64)  # the extra slot maps -1 to -1
+        remap[keep] = np.arange(len(keep))
+        for name in COLUMNS:
+            setattr(self, name, getattr(self, name)[keep])
+        self.last_aim = remap[self.last_aim]
+        self.last_heal = remap[self.last_heal]
+        self.calibers = {int(remap[i]): caliber for i, caliber in self.calibers.items()
+                         if remap[i] >= 0}
+        self.agents = [self.agents[i] for i in keep]
+        self.n = len(keep)
+        self.compactions += 1
+
+    ### queries ###
+    def live(self):
+        return self.status != DEAD
+
+    def alive_count(self, fraction):
+        code = Fraction.parse(fraction)
+        mask = (self.status != DEAD) & (self.kind != PROJECTILE) & (self.fraction == code)
+        return int(mask.sum())
+
+    def total_health(self, fraction):
+        code = Fraction.parse(fraction)
+        mask = (self.status != DEAD) & (self.kind != PROJECTILE) & (self.fraction == code)
+        return float(self.health[mask].sum())
+
+    def can_engage(self):
+        """`BattleModel.can_engage` on the arrays."""
+        if self.pending:
+            return True
+        live = self.status != DEAD
+        units = live & (self.kind != PROJECTILE)
+        unfinished = ((self.movement == ROUTE) | (self.movement == PATH)) & (self.route_index < self.route_len)
+        if np.any(live & ~units) or np.any(units & ((self.movement == RANDOM) | unfinished)):
+            return True
+        # medics look for wounded allies and keep healing their last patient
+        medics = units & (self.kind == MEDIC) & (self.healing > 0)
+        wounded = units & (self.status == WOUNDED) & (self.health < self.max_health)
+        if np.any(wounded & np.isin(self.fraction, np.unique(self.fraction[medics]))):
+            return True
+        patients = self.last_heal[medics]
+        patients = patients[patients >= 0]
+        if np.any((self.status[patients] != DEAD) & (self.health[patients] < self.max_health[patients])):
+            return True
+        armed = units & ((self.kind == MORTAR) | ((self.damage > 0) & (self.damage_chance > 0)))
+        aims = self.last_aim[armed]
+        if np.any((aims >= 0) & (self.status[np.maximum(aims, 0)] != DEAD)):
+            return True
+        for code in np.unique(self.fraction[armed]):
+            own = np.flatnonzero(armed & (self.fraction == code))
+            _, cell_x, cell_y, _, _ = self._cells(np.flatnonzero(units & (self.fraction != code)))
+            src, _ = cell_pairs(self.x, self.y, own, self.damage_range[own], cell_x, cell_y)
+            if len(src):
+                return True
+        return False
+
+    def _cells(self, members):
+        """Group agent indices by cell in x-major (neighbourhood) order."""
+        key = self.x[members].astype(np.int64) * self.height + self.y[members]
+        order = np.argsort(key, kind="stable")
+        members = members[order]
+        keys, starts, counts = np.unique(key[order], return_index=True, return_counts=True)
+        return members, keys // self.height, keys % self.height, starts, counts
+
+    def _pairs(self, sources, radius, cell_x, cell_y):
+        """All (source, cell) pairs within Chebyshev `radius`, cells ascending."""
+        self.cells_scanned += len(sources) * len(cell_x)
+        return cell_pairs(self.x, self.y, sources, radius, cell_x, cell_y)
+
+    def _scan_targets(self, attackers):
+        """One random live enemy per occupied cell in range of each attacker."""
+        sources, targets = [], []
+        live = (self.status != DEAD) & (self.kind != PROJECTILE)
+        for code in np.unique(self.fraction[attackers]):
+            own = attackers[self.fraction[attackers] == code]
+            enemies = np.flatnonzero(live & (self.fraction != code))
+            members, cell_x, cell_y, starts, counts = self._cells(enemies)
+            src, cells = self._pairs(own, self.damage_range[own], cell_x, cell_y)
+            pick = (self.rng.random(len(cells)) * counts[cells]).astype(np.int64)
+            sources.append(src)
+            targets.append(members[starts[cells] + pick])
+        if not sources:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return np.concatenate(sources), np.concatenate(targets)
+
+    ### combat ###
+    def _apply_attacks(self, sources, targets):
+        if len(sources) == 0:
+            return
+        hit = self.rng.random(len(sources)) < self.damage_chance[sources]
+        h_coefficient = 0.3 * (self.height_map[self.x[sources], self.y[sources]]
+                               - self.height_map[self.x[targets], self.y[targets]]) + 1
+        amount = hit * self.damage[sources] * h_coefficient
+
+        self.health -= np.bincount(targets, weights=amount, minlength=self.n)
+        self.damaged += np.bincount(sources, weights=amount, minlength=self.n)
+        self.status[targets] = WOUNDED
+        killed = self.health <= 0
+        self.health[killed] = 0
+        self.status[killed] = DEAD
+
+        # the last target in neighbourhood order becomes the locked aim
+        self.last_aim[sources] = targets
+        self.steps_after_attack[sources] = 0
+        projectiles = sources[self.kind[sources] == PROJECTILE]
+        self.health[projectiles] = 0
+        self.status[projectiles] = DEAD
+
+    def _heal(self):
+        """Resolve medics; return the mask of medics that healed this step."""
+        medics = np.flatnonzero((self.status != DEAD) & (self.kind == MEDIC))
+        healers = np.zeros(self.n, dtype=bool)
+        if len(medics) == 0:
+            return healers
+
+        locked = self.last_heal[medics]
+        locked_ok = (locked >= 0) & (self.status[np.maximum(locked, 0)] != DEAD)
+        healer_list = [medics[locked_ok]]
+        patient_list = [locked[locked_ok]]
+
+        free = medics[~locked_ok]
+        cooling = free[self.steps_after_healing[free] < WAIT_STEPS]
+        self.steps_after_healing[cooling] += 1
+        searching = free[self.steps_after_healing[free] >= WAIT_STEPS]
+        searching = np.setdiff1d(searching, cooling)
+
+        wounded = np.flatnonzero((self.status == WOUNDED) & (self.kind != PROJECTILE))
+        for code in np.unique(self.fraction[searching]):
+            own = searching[self.fraction[searching] == code]
+            members, cell_x, cell_y, starts, counts = self._cells(
+                wounded[self.fraction[wounded] == code])
+            src, cells = self._pairs(own, self.healing_range[own], cell_x, cell_y)
+            if len(src) == 0:
+                continue
+            rank = np.full(self.n, -1, dtype=np.int64)
+            rank[members] = np.arange(len(members))
+            # a medic never heals itself, so drop its own slot from the cell
+            self_rank = rank[src] - starts[cells]
+            self_in = ((rank[src] >= 0) & (self.x[src] == cell_x[cells])
+                       & (self.y[src] == cell_y[cells]))
+            available = counts[cells] - self_in
+            valid = available > 0
+            src, cells, self_rank, self_in, available = (
+                src[valid], cells[valid], self_rank[valid], self_in[valid], available[valid])
+            first = np.unique(src, return_index=True)[1]
+            src, cells, self_rank, self_in, available = (
+                src[first], cells[first], self_rank[first], self_in[first], available[first])
+            pick = (self.rng.random(len(src)) * available).astype(np.int64)
+            pick += self_in & (pick >= self_rank)
+            healer_list.append(src)
+            patient_list.append(members[starts[cells] + pick])
+
+        sources = np.concatenate(healer_list)
+        patients = np.concatenate(patient_list)
+        if len(sources) == 0:
+            return healers
+
+        hit = self.rng.random(len(sources)) < self.healing_chance[sources]
+        amount = hit * self.healing[sources]
+        self.health += np.bincount(patients, weights=amount, minlength=self.n)
+        over = self.health > self.max_health
+        self.health[over] = self.max_health[over]
+        self.status[over] = ALIVE
+        self.healed += np.bincount(sources, weights=amount, minlength=self.n)
+        self.steps_after_healing[sources] = 0
+        self.last_heal[sources] = patients
+        healers[sources] = True
+        return healers
+
+    def _mortar_fire(self, mortars):
+        """Mortars count one reload tick per enemy cell and fire every 31 ticks."""
+        spawns = []
+        live = (self.status != DEAD) & (self.kind != PROJECTILE)
+        # the enemy cells of a fraction are the same for all its mortars
+        enemy_cells = {code: self._cells(np.flatnonzero(live & (self.fraction != code)))
+                       for code in np.unique(self.fraction[mortars])}
+        ticks, shots = self._mortar_shots(mortars, enemy_cells)
+        for i, count, cells in zip(mortars, ticks, shots):
+            counter = self.steps_after_shot[i]
+            if len(cells) == 0:
+                self.steps_after_shot[i] = counter + count
+                continue
+            last = max(SHOT_STEPS - counter, 0) + (len(cells) - 1) * (SHOT_STEPS + 1)
+            self.steps_after_shot[i] = count - 1 - last
+            self.steps_after_attack[i] = 0
+            members, _, _, starts, counts = enemy_cells[self.fraction[i]]
+            pick = (self.rng.random(len(cells)) * counts[cells]).astype(np.int64)
+            for target in members[starts[cells] + pick]:
+                spawns.append((i, target))
+        return spawns
+
+    def _mortar_shots(self, mortars, enemy_cells):
+        """Reload ticks of every mortar (enemy cells in range) and the cells it fires at."""
+        ticks, shots = np.zeros(len(mortars), dtype=np.int64), []
+        for k, i in enumerate(mortars):
+            _, cell_x, cell_y, _, _ = enemy_cells[self.fraction[i]]
+            near = np.flatnonzero(np.maximum(np.abs(cell_x - self.x[i]),
+                                             np.abs(cell_y - self.y[i])) <= self.damage_range[i])
+            ticks[k] = len(near)
+            shots.append(near[max(SHOT_STEPS - self.steps_after_shot[i], 0)::SHOT_STEPS + 1])
+        return ticks, shots
+
+    def _spawn_projectiles(self, spawns):
+        if not spawns:
+            return
+        mortars = np.array([s[0] for s in spawns])
+        targets = np.array([s[1] for s in spawns])
+        k = len(spawns)
+        attrs = [self.model.type_attributes[self.calibers[m]] for m in mortars]
+        route = np.zeros((k, self.route.shape[1], 2), dtype=np.int32)
+        route[:, 0, 0], route[:, 0, 1] = self.x[mortars], self.y[mortars]
+        route[:, 1, 0], route[:, 1, 1] = self.x[targets], self.y[targets]
+
+        def column(name, dtype=float):
+            return np.array([getattr(a, name) for a in attrs], dtype=dtype)
+
+        max_health = column("max_health")
+        self._append(dict(
+            fraction=self.fraction[mortars], kind=np.full(k, PROJECTILE, dtype=np.int8),
+            status=np.zeros(k, dtype=np.int8), health=max_health.copy(), max_health=max_health,
+            speed=column("speed", np.int16), damage=column("damage"),
+            damage_range=column("damage_range", np.int32),
+            damage_chance=column("damage_chance"),
+            x=self.x[mortars].copy(), y=self.y[mortars].copy(),
+            steps_after_attack=np.zeros(k, dtype=np.int32),
+            damaged=np.zeros(k), healed=np.zeros(k),
+            healing=np.zeros(k), healing_chance=np.zeros(k),
+            healing_range=np.zeros(k, dtype=np.int32),
+            steps_after_healing=np.zeros(k, dtype=np.int32),
+            steps_after_shot=np.zeros(k, dtype=np.int32),
+            last_aim=np.full(k, -1, dtype=np.int64), last_heal=np.full(k, -1, dtype=np.int64),
+            movement=np.full(k, ROUTE, dtype=np.int8), route=route,
+            route_len=np.full(k, 2, dtype=np.int32), route_index=np.zeros(k, dtype=np.int32)))
+
+    ### movements ###
+    def _move(self):
+        for k in range(int(self.speed[self.live()].max(initial=0))):
+            movers = np.flatnonzero(self.live() & (self.speed > k))
+            medic_wait = movers[(self.kind[movers] == MEDIC)
+                                & (self.steps_after_healing[movers] < WAIT_STEPS)]
+            self.steps_after_healing[medic_wait] += 1
+            self.steps_after_attack[medic_wait] += 1
+            movers = np.setdiff1d(movers, medic_wait)
+
+            wait = movers[(self.kind[movers] != PROJECTILE)
+                          & (self.steps_after_attack[movers] < WAIT_STEPS)]
+            self.steps_after_attack[wait] += 1
+            movers = np.setdiff1d(movers, wait)
+
+            x, y = self.x[movers], self.y[movers]
+            self._move_random(movers[self.movement[movers] == RANDOM])
+            self._move_route(movers[self.movement[movers] == ROUTE])
+            self._move_path(movers[self.movement[movers] == PATH])
+            # the agents only reach the grid on `sync`, count the moves for stalemates here
+            self.model.grid.moves += int(np.count_nonzero((self.x[movers] != x) | (self.y[movers] != y)))
+            self._detonate(movers[self.kind[movers] == PROJECTILE])
+            self._check_mines(movers[self.status[movers] != DEAD])
+
+    def _move_random(self, walkers):
+        pending = walkers
+        while len(pending):
+            step = MOORE[self.rng.integers(len(MOORE), size=len(pending))]
+            new_x = self.x[pending] + step[:, 0]
+            new_y = self.y[pending] + step[:, 1]
+            ok = (new_x >= 0) & (new_x < self.width) & (new_y >= 0) & (new_y < self.height)
+            self.x[pending[ok]] = new_x[ok]
+            self.y[pending[ok]] = new_y[ok]
+            pending = pending[~ok]
+
+    def _move_route(self, walkers):
+        walkers = walkers[self.route_index[walkers] < self.route_len[walkers]]
+        target = self.route[walkers, self.route_index[walkers]]
+        self.x[walkers] += np.sign(target[:, 0] - self.x[walkers]).astype(np.int32)
+        self.y[walkers] += np.sign(target[:, 1] - self.y[walkers]).astype(np.int32)
+        reached = (self.x[walkers] == target[:, 0]) & (self.y[walkers] == target[:, 1])
+        self.route_index[walkers[reached]] += 1
+
+    def _move_path(self, walkers):
+        walkers = walkers[self.route_index[walkers] < self.route_len[walkers]]
+        if len(walkers) == 0:
+            return
+        target = self.route[walkers, self.route_index[walkers]]
+        self.x[walkers], self.y[walkers] = self.model.paths.next_cells(self.x[walkers], self.y[walkers],
+                                                                        target[:, 0], target[:, 1])
+        reached = (self.x[walkers] == target[:, 0]) & (self.y[walkers] == target[:, 1])
+        self.route_index[walkers[reached]] += 1
+
+    def _detonate(self, projectiles):
+        end = self.route[projectiles, self.route_len[projectiles] - 1]
+        arrived = projectiles[(self.x[projectiles] == end[:, 0])
+                              & (self.y[projectiles] == end[:, 1])
+                              & (self.status[projectiles] != DEAD)]
+        if len(arrived) == 0:
+            return
+        self._apply_attacks(*self._scan_targets(arrived))
+        self.health[arrived] = 0
+        self.status[arrived] = DEAD
+
+    def _check_mines(self, walkers):
+        walkers = walkers[self.kind[walkers] != PROJECTILE]
+        walkers = walkers[self.mines[self.x[walkers], self.y[walkers]] > 0]
+        if len(walkers) == 0:
+            return
+        # agents sharing a mined cell trigger its mines one by one in random order
+        key = self.x[walkers].astype(np.int64) * self.height + self.y[walkers]
+        order = np.lexsort((self.rng.random(len(walkers)), key))
+        walkers, key = walkers[order], key[order]
+        _, starts, counts = np.unique(key, return_index=True, return_counts=True)
+        rank = np.arange(len(walkers)) - np.repeat(starts, counts)
+        triggered = walkers[rank < self.mines[self.x[walkers], self.y[walkers]]]
+
+        self.health[triggered] -= MINE_DAMAGE
+        killed = triggered[self.health[triggered] <= 0]
+        self.health[killed] = 0
+        self.status[killed] = DEAD
+        self.model.mine_map.trigger_all(self.x[triggered], self.y[triggered])
+
+    ### step ###
+    def step(self):
+        if not self.compiled:
+            self.compile()
+        elif self.pending:
+            self._add_pending()
+        if 2 * np.count_nonzero(self.status == DEAD) > self.n:
+            self._compact()
+
+        n, alive = self.n, self.status != DEAD
+        healers = self._heal()
+        spawns = self._attack(np.flatnonzero(alive & ~healers & (self.kind != PROJECTILE)))
+        self._move()
+        self._spawn_projectiles(spawns)
+        self._bury(np.flatnonzero(alive & (self.status[:n] == DEAD)))
+        self.synced = False
+        self.model.stats.set_totals({name: self.alive_count(name) for name in FRACTIONS},
+                                    {name: self.total_health(name) for name in FRACTIONS})
+
+    def _attack(self, attackers):
+        """Resolve the attackers; return the projectiles the mortars fire."""
+        locked = self.last_aim[attackers]
+        locked_ok = (locked >= 0) & (self.status[np.maximum(locked, 0)] != DEAD)
+        scanning = attackers[~locked_ok]
+        mortars = scanning[self.kind[scanning] == MORTAR]
+        sources, targets = self._scan_targets(scanning[self.kind[scanning] != MORTAR])
+        self._apply_attacks(np.concatenate([attackers[locked_ok], sources]),
+                            np.concatenate([locked[locked_ok], targets]))
+        return self._mortar_fire(mortars)
+
+    def _write_back(self, i, agent):
+        """Copy row `i` to its agent; returns whether it is dead."""
+        agent.health = self.health[i]
+        agent.status = STATUSES[self.status[i]]
+        agent.damaged = self.damaged[i]
+        agent.healed = self.healed[i]
+        agent.steps_after_attack = int(self.steps_after_attack[i])
+        agent.route_index = int(self.route_index[i])
+        aim = self.last_aim[i]
+        agent.last_aim = self.agents[aim] if aim >= 0 else None
+        agent.steps_after_healing = int(self.steps_after_healing[i])
+        agent.steps_after_shot = int(self.steps_after_shot[i])
+        pos = (int(self.x[i]), int(self.y[i]))
+        if pos != agent.pos:
+            self.model.grid.move_agent(agent, pos)
+        return self.status[i] == DEAD
+
+    def _bury(self, rows):
+        """Write the rows killed this step back to their agents and hand them to the model."""
+        model = self.model
+        moves = model.grid.moves  # already counted by `_move`
+        for i in rows:
+            agent = self.agents[i]
+            if agent is None:
+                continue
+            model.grid.unindex_agent(agent)
+            self._write_back(i, agent)
+            # the model removes it after the step, the row is dropped on compaction
+            self.agents[i] = None
+            model.dead_agents.append(agent)
+        model.grid.moves = moves
+
+    def sync(self):
+        """
+        Write the array state back to the Mesa agents and the grid.
+
+        Steps only hand the dead to the model; the live agents are brought
+        up to date when something reads them (`BattleModel.sync_agents`),
+        so a run that only reads the counters never pays for it.
+        """
+        if self.synced:
+            return
+        model = self.model
+        moves = model.grid.moves  # already counted by `_move`
+        for i, agent in enumerate(self.agents):
+            if agent is not None:
+                self._write_back(i, agent)
+        model.grid.moves = moves
+        self.synced = True
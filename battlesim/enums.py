@@ -0,0 +1,59 @@
+from enum import IntEnum
+
+
+class Code(IntEnum):
+    """
+    Small-int code with its lowercase name as the text form.
+
+    Members are interned singletons, so agents compare them with `is`, and
+    their values are the integer codes of the array engine and the stream.
+    """
+
+    def __str__(self):
+        return self.name.lower()
+
+    @classmethod
+    def parse(cls, value):
+        """Member from a member, its text form ("ally") or its code."""
+        if isinstance(value, cls):
+            return value
+        if isinstance(value, str):
+            return cls[value.upper()]
+        return cls(value)
+
+
+class Fraction(Code):
+    ALLY = 0
+    ENEMY = 1
+
+
+class AgentType(Code):
+    INFANTRY = 0
+    MEDIC = 1
+    MORTAR = 2
+    PROJECTILE_120MM = 3
+
+    @property
+    def is_projectile(self):
+        return self.name.startswith("PROJECTILE_")
+
+
+class Status(Code):
+    ALIVE = 0
+    WOUNDED = 1
+    DEAD = 2
+
+
+class Movement(Code):
+    RANDOM = 0
+    ROUTE = 1
+    STAY = 2
+    STOP = 2  # alias, the scenarios use both
+    PATH = 3  # the route, along terrain-aware flow fields
+
+
+# members bound once: looking them up on the enum class is slow on hot paths
+ALLY, ENEMY = Fraction
+INFANTRY, MEDIC, MORTAR, PROJECTILE_120MM = AgentType
+ALIVE, WOUNDED, DEAD = Status
+RANDOM, ROUTE, STAY, PATH = Movement
@@ -0,0 +1,133 @@
+import multiprocessing
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+
+from .batch import create_model
+from .utils import final_stats, run_battle
+
+MODEL_PARAMS = ("n_soldiers", "n_medics", "n_mines", "seed", "case", "scenario", "engine")
+RUN_PARAMS = ("max_steps", "stop_when_decided", "stalemate_steps", "time_budget")
+
+
+class QueueFull(Exception):
+    """Raised when the job queue has no room for another job."""
+
+
+class JobCancelled(Exception):
+    """Raised inside a worker to abort a cancelled job."""
+
+
+def run_job(job_id, params, progress, cancelled):
+    """Worker entry point: run one battle, reporting the current step."""
+    # a job is running once it has a progress entry, `Future.running` is
+    # also true while it waits in the call queue of the pool
+    progress[job_id] = 0
+    if job_id in cancelled:
+        raise JobCancelled(job_id)
+    model = create_model(**{key: params[key] for key in MODEL_PARAMS if key in params})
+
+    def on_step(i):
+        progress[job_id] = i + 1
+        if job_id in cancelled:
+            raise JobCancelled(job_id)
+
+    try:
+        run = run_battle(model, on_step=on_step,
+                         **{key: params[key] for key in RUN_PARAMS if key in params})
+    finally:
+        model.close()
+    stats = final_stats(model)
+    stats["Steps"] = run["steps"]
+    stats["Stop reason"] = run["reason"]
+    return stats
+
+
+class JobQueue():
+    """
+    Bounded pool of worker processes for long-running battles.
+
+    At most `max_workers` battles run at once and at most `max_pending`
+    more wait in the queue; `submit` raises QueueFull beyond that instead
+    of blocking. Workers report progress and check for cancellation every
+    step through manager dicts shared with this process.
+    """
+
+    def __init__(self, max_workers=None, max_pending=16, max_finished=1000):
+        self.max_workers = max_workers or multiprocessing.cpu_count()
+        self.max_pending = max_pending
+        self.max_finished = max_finished
+
+        self.manager = multiprocessing.Manager()
+        self.progress = self.manager.dict()   # job id -> current step
+        self.cancelled = self.manager.dict()  # job id -> True
+        self.executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _active(self):
+        return sum(1 for job in self.jobs.values() if not job["future"].done())
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job["future"].done()]
+        for job_id in finished[:max(len(finished) - self.max_finished, 0)]:
+            del self.jobs[job_id]
+            self.progress.pop(job_id, None)
+            self.cancelled.pop(job_id, None)
+
+    def submit(self, params):
+        with self.lock:
+            if self._active() >= self.max_workers + self.max_pending:
+                raise QueueFull(f"{self.max_workers + self.max_pending} jobs already queued or running")
+            self._prune()
+            job_id = uuid.uuid4().hex
+            future = self.executor.submit(run_job, job_id, params, self.progress, self.cancelled)
+            self.jobs[job_id] = {"future": future, "params": params, "submitted": time.time()}
+        return job_id
+
+    def status(self, job_id):
+        """Status dict of a job, or None if the id is unknown."""
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        future = job["future"]
+        result = {"id": job_id,
+                  "params": job["params"],
+                  "progress": self.progress.get(job_id, 0),
+                  "max_steps": job["params"].get("max_steps", 150)}
+
+        if not future.done():
+            result["status"] = "running" if job_id in self.progress else "queued"
+        elif future.cancelled():
+            result["status"] = "cancelled"
+        else:
+            try:
+                result["result"] = future.result()
+                result["status"] = "done"
+            except (JobCancelled, CancelledError):
+                result["status"] = "cancelled"
+            except Exception as error:
+                result["status"] = "failed"
+                result["error"] = repr(error)
+        return result
+
+    def cancel(self, job_id):
+        """Cancel a queued job, or ask a running one to stop at its next step."""
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        if not job["future"].cancel() and not job["future"].done():
+            self.cancelled[job_id] = True
+        return self.status(job_id)
+
+    def shutdown(self):
+        """Stop running jobs at their next step, drop queued ones and stop the workers."""
+        with self.lock:
+            for job_id, job in self.jobs.items():
+                if not job["future"].done():
+                    self.cancelled[job_id] = True
+        # workers read the manager dicts until they exit
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.manager.shutdown()
@@ -1,7 +1,12 @@
+import os
 import numpy as np
 import scipy.ndimage
 import random
 
+from .assets import load_heights, read_heights_file
+from .chunks import save_layer
+from .mines import MineField
+
 class MapCreator():
     
     def __init__(self, size):
@@ -10,12 +15,12 @@ class MapCreator():
     def create_mine_map(self,
                         left_bottom_corner =(0,0),
                         right_top_corner=(0,0),
-                        num_mines=1):
+                        num_mines=1,
+                        seed=None):
         
-        mine_map = {}
-        for x in range(left_bottom_corner[0], right_top_corner[0]):
-            for y in range(left_bottom_corner[1], right_top_corner[1]):
-                mine_map[(x,y)] = random.randint(0, num_mines)
+        mine_map = MineField.random(self.size, self.size,
+                                    left_bottom_corner, right_top_corner,
+                                    num_mines, seed=seed)
         
         self.mine_map = mine_map
         return mine_map.copy()
@@ -40,7 +45,29 @@ class MapCreator():
         return height_map
     
     def save_heights(self, path_to_file="database/heights.txt"):
-        np.savetxt(path_to_file, self.height_map)
+        # format by extension: binary float32 .npy or text
+        if os.path.splitext(path_to_file)[1] == ".npy":
+            np.save(path_to_file, np.asarray(self.height_map, dtype=np.float32))
+        else:
+            np.savetxt(path_to_file, self.height_map)
 
     def read_heights(self, path_to_file="database/heights.txt"):
-        self.height_map = np.loadtxt(path_to_file)
\ No newline at end of file
+        # shared read-only array (memory-mapped for .npy), loaded once per file version
+        self.height_map = load_heights(path_to_file)
+
+
+def convert_heights(text_path="database/heights.txt", npy_path="database/heights.npy"):
+    """
+    Convert a height map to the memory-mappable .npy format, or to a
+    directory of chunks for sparse maps when `npy_path` has no extension.
+    """
+    height_map = np.asarray(read_heights_file(text_path), dtype=np.float32)
+    if os.path.splitext(npy_path)[1]:
+        np.save(npy_path, height_map)
+    else:
+        save_layer(height_map, npy_path)
+
+
+if __name__ == "__main__":
+    import sys
+    convert_heights(*sys.argv[1:3])
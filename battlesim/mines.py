@@ -0,0 +1,149 @@
+from collections.abc import MutableMapping
+
+import numpy as np
+
+from .chunks import CHUNK, ChunkedLayer
+
+
+class MineField(MutableMapping):
+    """
+    Dense uint8 grid of mine counts indexed as grid[x, y].
+
+    Also behaves as the old `{(x, y): count}` dict: iteration, `in` and
+    `len` only see cells that still hold mines, and deleting a key clears
+    the cell. Hot paths use `count` / `trigger` directly.
+    """
+
+    def __init__(self, grid):
+        self.grid = grid
+
+    @classmethod
+    def empty(cls, width, height):
+        return cls(np.zeros((width, height), dtype=np.uint8))
+
+    @classmethod
+    def from_dict(cls, mine_map, width, height):
+        field = cls.empty(width, height)
+        for pos, count in mine_map.items():
+            field.grid[pos] = count
+        return field
+
+    @classmethod
+    def random(cls, width, height, left_bottom_corner=(0, 0), right_top_corner=(0, 0),
+               num_mines=1, seed=None):
+        """Uniform 0..num_mines mines in every cell of the rectangle."""
+        field = cls.empty(width, height)
+        x0, y0 = max(left_bottom_corner[0], 0), max(left_bottom_corner[1], 0)
+        x1, y1 = min(right_top_corner[0], width), min(right_top_corner[1], height)
+        shape = (max(x1 - x0, 0), max(y1 - y0, 0))
+        if seed is None:
+            counts = np.random.randint(0, num_mines + 1, size=shape)
+        else:
+            counts = np.random.default_rng(seed).integers(0, num_mines + 1, size=shape)
+        field.grid[x0:x1, y0:y1] = counts
+        return field
+
+    ### fast access ###
+    def count(self, pos):
+        return self.grid[pos]
+
+    def trigger(self, pos):
+        """Remove one mine from `pos`."""
+        if self.grid[pos] > 0:
+            self.grid[pos] -= 1
+
+    def trigger_all(self, xs, ys):
+        """Remove one mine per (x, y) pair; a cell may appear as often as it has mines."""
+        np.subtract.at(self.grid, (xs, ys), 1)
+
+    def copy(self):
+        return MineField(self.grid.copy())
+
+    def as_dict(self):
+        return dict(self.items())
+
+    ### dict view ###
+    def __getitem__(self, pos):
+        count = int(self.grid[pos])
+        if count == 0:
+            raise KeyError(pos)
+        return count
+
+    def __setitem__(self, pos, count):
+        self.grid[pos] = count
+
+    def __delitem__(self, pos):
+        if self.grid[pos] == 0:
+            raise KeyError(pos)
+        self.grid[pos] = 0
+
+    def __contains__(self, pos):
+        x, y = pos
+        width, height = self.grid.shape
+        return 0 <= x < width and 0 <= y < height and self.grid[x, y] > 0
+
+    def __iter__(self):
+        xs, ys = np.nonzero(self.grid)
+        return iter(zip(xs.tolist(), ys.tolist()))
+
+    def __len__(self):
+        return int(np.count_nonzero(self.grid))
+
+
+class RandomMines():
+    """Chunk source of `ChunkedMineField.random`: each chunk is drawn from its own seeded generator."""
+
+    def __init__(self, area, num_mines, seed, chunk):
+        self.area = area
+        self.num_mines = num_mines
+        self.seed = seed
+        self.chunk = chunk
+
+    def load(self, cx, cy, shape):
+        x0, y0, x1, y1 = self.area
+        cell_x, cell_y = cx * self.chunk, cy * self.chunk
+        left, bottom = max(x0 - cell_x, 0), max(y0 - cell_y, 0)
+        right, top = min(x1 - cell_x, shape[0]), min(y1 - cell_y, shape[1])
+        if right <= left or top <= bottom or self.num_mines == 0:
+            return None
+        chunk = np.zeros(shape, dtype=np.uint8)
+        rng = np.random.default_rng([self.seed, cx, cy])
+        chunk[left:right, bottom:top] = rng.integers(0, self.num_mines + 1, size=(right - left, top - bottom))
+        return chunk
+
+
+class ChunkedMineField(MineField):
+    """
+    MineField over a ChunkedLayer, for sparse maps.
+
+    Random minefields are generated chunk by chunk when agents first look
+    at them, so a minefield over a whole theatre only costs memory where
+    the fighting is. Iterating the mines reads every chunk.
+    """
+
+    @classmethod
+    def empty(cls, width, height, chunk=CHUNK):
+        return cls(ChunkedLayer((width, height), np.uint8, chunk=chunk))
+
+    @classmethod
+    def random(cls, width, height, left_bottom_corner=(0, 0), right_top_corner=(0, 0),
+               num_mines=1, seed=None, chunk=CHUNK):
+        """Uniform 0..num_mines mines in every cell of the rectangle, drawn lazily."""
+        if seed is None:
+            seed = int(np.random.randint(2**31))
+        area = (left_bottom_corner[0], left_bottom_corner[1], right_top_corner[0], right_top_corner[1])
+        return cls(ChunkedLayer((width, height), np.uint8, chunk=chunk,
+                                source=RandomMines(area, num_mines, seed, chunk)))
+
+    def trigger_all(self, xs, ys):
+        self.grid.subtract_at(xs, ys)
+
+    def copy(self):
+        return ChunkedMineField(self.grid.copy())
+
+    def __iter__(self):
+        xs, ys = self.grid.nonzero()
+        return iter(zip(xs.tolist(), ys.tolist()))
+
+    def __len__(self):
+        return len(self.grid.nonzero()[0])
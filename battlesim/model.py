@@ -1,63 +1,243 @@
-from mesa import Model, space, time
+from collections import defaultdict
+
+from mesa import Model, time
 from mesa.datacollection import DataCollector
 
+from .agents import TYPE_ATTRIBUTES
+from .enums import WOUNDED, DEAD, MEDIC, RANDOM, ROUTE, PATH
+from .engine import VectorEngine
+from .parallel import ParallelEngine
+from .chunks import CHUNK
+from .spatial import IndexedGrid, SparseGrid
+from .mines import MineField
+from .pathing import FlowFields
+from .rng import BattleRandom
+from .stats import BattleStats
+
+ENGINES = ("mesa", "vector", "parallel")
+
 class BattleModel(Model):
 
-    def __init__(self, width, height, height_map, mine_map):
-        self.grid = space.MultiGrid(width, height, False)
+    def __init__(self, width, height, height_map, mine_map, engine="mesa", seed=None,
+                 collector="stream", agent_history=False, type_attributes=None,
+                 grid="dense", chunk=CHUNK, workers=None):
+        # one seed for every random source of the run: self.rng hands out the
+        # streams, self.random (Mesa schedule, moves and spawns) is one of them
+        self.engine = None
+        self.reseed(seed)
+
+        # "dense" is a Mesa MultiGrid, "sparse" only stores occupied chunks for very large maps
+        if grid == "dense":
+            self.grid = IndexedGrid(width, height, False)
+        elif grid == "sparse":
+            self.grid = SparseGrid(width, height, False, chunk=chunk)
+        else:
+            raise ValueError(f"Unknown grid: {grid}")
         self.schedule = time.RandomActivation(self)
         self.max_id = 0
+
+        # shared per-type attribute records, scenarios may replace some
+        self.type_attributes = type_attributes or TYPE_ATTRIBUTES
+
+        # agents killed during the current step, and dead projectiles kept for reuse
+        self.dead_agents = []
+        self.projectile_pool = defaultdict(list)
+
+        # per-phase timers and counters, see `enable_profiling`
+        self.profiler = None
         
-        self.datacollector = DataCollector(
-            
-            model_reporters={"alive allies": compute_alive_allies,
-                            "alive enemies": compute_alive_enemies,
-                            "allies total health": compute_health_allies,
-                            "enemies total health": compute_health_enemies},
-            
-            
-            agent_reporters={"Fraction": "fraction",
-                             "Status": "status",
-                             "Health": "health",
-                             "Damaged": "damaged",
-                             "Healed": "healed"}
-
-        )
+        # running per-fraction counters, always maintained
+        self.stats = BattleStats(agent_history=agent_history)
+        
+        # "stream" records the counters into arrays, "mesa" runs the Mesa DataCollector
+        if collector == "stream":
+            self.datacollector = self.stats
+        elif collector == "mesa":
+            self.datacollector = DataCollector(
+                
+                model_reporters={"alive allies": compute_alive_allies,
+                                "alive enemies": compute_alive_enemies,
+                                "allies total health": compute_health_allies,
+                                "enemies total health": compute_health_enemies},
+                
+                
+                agent_reporters={"Fraction": lambda agent: str(agent.fraction),
+                                 "Status": lambda agent: str(agent.status),
+                                 "Health": "health",
+                                 "Damaged": "damaged",
+                                 "Healed": "healed"}
+    
+            )
+        else:
+            raise ValueError(f"Unknown collector: {collector}")
         
         self.height_map = height_map
+        if not isinstance(mine_map, MineField):
+            mine_map = MineField.from_dict(mine_map, width, height)
         self.mine_map = mine_map 
+
+        # flow fields of "path" movement, built when the first path agent is placed, see `plan_paths`
+        self.paths = None
+        
+        # "mesa" steps every SoldierAgent, "vector" resolves all agents as arrays,
+        # "parallel" is "vector" with target scans split over `workers` processes
+        if engine == "mesa":
+            pass
+        elif engine == "vector":
+            self.engine = VectorEngine(self)
+        elif engine == "parallel":
+            self.engine = ParallelEngine(self, workers=workers)
+        else:
+            raise ValueError(f"Unknown engine: {engine}")
         
         
     def step(self):
+        if self.profiler is not None:
+            self.profiler.step(self)
+            return
+        self.collect()
+        self.advance()
+        self.remove_dead()
+
+    def collect(self):
+        """Record the state; collectors reading the agents get them synced first."""
+        if self.datacollector is not self.stats or self.stats.agent_history:
+            self.sync_agents()
         self.datacollector.collect(self)
-        self.schedule.step()
+
+    def advance(self):
+        """Move every agent by one step, with the Mesa schedule or the vector engine."""
+        if self.engine is None:
+            self.schedule.step()
+        else:
+            self.engine.step()
+            self.schedule.steps += 1
+            self.schedule.time += 1
+
+    def remove_dead(self):
+        """Take the agents killed this step out of the schedule and the grid.
+
+        Their final stats go to the graveyard of `self.stats`, dead
+        projectiles go to the pool that `place_agents` reuses.
+        """
+        for agent in self.dead_agents:
+            self.stats.bury(agent, self.schedule.steps)
+            self.schedule.remove(agent)
+            self.grid.remove_agent(agent)
+            if agent.is_projectile:
+                self.projectile_pool[agent.type].append(agent)
+        self.dead_agents.clear()
+
+    def plan_paths(self):
+        """Flow fields of "path" movement; the first call fixes the mines they avoid."""
+        if self.paths is None:
+            self.paths = FlowFields(self.height_map, self.mine_map.grid)
+        return self.paths
+
+    def sync_agents(self):
+        """Bring the Mesa agents up to date with the engine, before reading them."""
+        if self.engine is not None and self.engine.compiled:
+            self.engine.sync()
+
+    def reseed(self, seed=None):
+        """Restart every random stream from `seed` (a fresh one when None), see `battlesim.rng`."""
+        self.rng = BattleRandom(seed)
+        self.seed = self.rng.seed
+        self.reset_randomizer(self.rng.integer_seed("schedule"))
+        if self.engine is not None:
+            self.engine.rng = self.rng.generator("engine")
+
+    def close(self):
+        """Release the engine's resources, such as the worker processes of the parallel engine."""
+        if self.engine is not None:
+            self.engine.close()
+
+    def enable_profiling(self, slow_step_ms=None):
+        """Time every step phase and count events from now on.
+
+        Returns the `battlesim.profiling.Profiler`; steps slower than
+        `slow_step_ms` are sampled with their phase breakdown.
+        """
+        from .profiling import Profiler
+        if self.profiler is None:
+            self.profiler = Profiler(slow_step_ms=slow_step_ms)
+            self.profiler.attach(self)
+        return self.profiler
+
+    def disable_profiling(self):
+        """Stop profiling and return the profiler with the results so far."""
+        profiler, self.profiler = self.profiler, None
+        if profiler is not None:
+            profiler.detach(self)
+        return profiler
+
+    def snapshot(self):
+        """Full model state as bytes, see `battlesim.snapshot`."""
+        from .snapshot import snapshot_model
+        return snapshot_model(self)
+
+    @staticmethod
+    def restore(data):
+        from .snapshot import restore_model
+        return restore_model(data)
+
+    def can_engage(self):
+        """
+        Whether the battle can still change: a projectile is in flight, an
+        agent can still move (random walkers, unfinished routes), an armed
+        agent has a locked aim or an enemy in range, or a medic has a
+        wounded ally.
+        """
+        if self.engine is not None and self.engine.compiled:
+            return self.engine.can_engage()
+        grid = self.grid
+        agents = [agent for agent in self.schedule.agents if agent.status is not DEAD]
+        wounded, medics = set(), set()
+        for agent in agents:
+            if agent.is_projectile or agent.movement is RANDOM:
+                return True
+            if agent.movement in (ROUTE, PATH) and agent.route_index < len(agent.route):
+                return True
+            # medics look for wounded allies and keep healing their last patient
+            if agent.status is WOUNDED and agent.health < agent.max_health:
+                wounded.add(agent.fraction)
+            if agent.type is MEDIC and agent.attributes.healing > 0:
+                medics.add(agent.fraction)
+                patient = agent.last_heal
+                if patient is not None and patient.status is not DEAD and patient.health < patient.max_health:
+                    return True
+        if wounded & medics:
+            return True
+        for agent in agents:
+            attributes = agent.attributes
+            armed = attributes.caliber is not None or attributes.damage > 0 and attributes.damage_chance > 0
+            if not armed:
+                continue
+            # a locked aim is attacked wherever it is
+            if agent.last_aim is not None and agent.last_aim.status is not DEAD:
+                return True
+            if grid.any_in_range(agent.pos, attributes.damage_range, grid.enemies(agent.fraction)):
+                return True
+        return False
+
+    def progress_signature(self):
+        """Changes whenever anything happens: damage, healing, deaths, moves or shots."""
+        n_agents = self.engine.n if self.engine is not None and self.engine.compiled else len(self.schedule.agents)
+        return (tuple(self.stats.alive.items()),
+                tuple(self.stats.health.items()),
+                self.grid.moves,
+                n_agents)
 
 # model reportes
 
 def compute_alive_allies(model):
-    alive = 0
-    for agent in model.schedule.agents:
-        if agent.fraction == "ally" and agent.status != "dead" and not agent.type.startswith("projectile_"):
-            alive +=1
-    return alive
+    return model.stats.alive_count("ally")
 
 def compute_alive_enemies(model):
-    alive = 0
-    for agent in model.schedule.agents:
-        if agent.fraction == "enemy" and agent.status != "dead" and not agent.type.startswith("projectile_"):
-            alive +=1
-    return alive
+    return model.stats.alive_count("enemy")
 
 def compute_health_allies(model):
-    health = 0
-    for agent in model.schedule.agents:
-        if agent.fraction == "ally" and agent.status != "dead" and not agent.type.startswith("projectile_"):
-            health += agent.health
-    return health
+    return model.stats.total_health("ally")
 
 def compute_health_enemies(model):
-    health = 0
-    for agent in model.schedule.agents:
-        if agent.fraction == "enemy" and agent.status != "dead" and not agent.type.startswith("projectile_"):
-            health += agent.health
-    return health
\ No newline at end of file
+    return model.stats.total_health("enemy")
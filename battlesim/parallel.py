@@ -0,0 +1,274 @@
+import multiprocessing
+import os
+import threading
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .engine import DEAD, PROJECTILE, SHOT_STEPS, VectorEngine, cell_pairs
+
+PARALLEL_PAIRS = 4_000_000  # below this many attacker-agent pairs a scan is not worth the round trip
+STRIPS_PER_WORKER = 2        # strips per worker, so a slow strip does not hold up the step
+
+# agent columns the scan workers read, with `scan` marking the attackers of the scan
+SHARED_COLUMNS = (("x", np.int32), ("y", np.int32), ("fraction", np.int8), ("kind", np.int8),
+                  ("status", np.int8), ("damage_range", np.int32), ("steps_after_shot", np.int32),
+                  ("scan", np.bool_))
+# columns a row keeps until the rows are compacted; only new rows are copied for them
+STATIC_COLUMNS = ("fraction", "kind", "damage_range")
+
+
+def _layout(capacity):
+    """Offset of every shared column in a segment of `capacity` rows, and the segment size."""
+    offsets, size = {}, 0
+    for name, dtype in SHARED_COLUMNS:
+        offsets[name] = size
+        size += -(-capacity * np.dtype(dtype).itemsize // 8) * 8  # keep columns 8-byte aligned
+    return offsets, size
+
+
+def _views(buffer, capacity):
+    offsets, _ = _layout(capacity)
+    return {name: np.ndarray(capacity, dtype=dtype, buffer=buffer, offset=offsets[name])
+            for name, dtype in SHARED_COLUMNS}
+
+
+class SharedColumns():
+    """
+    The agent columns scan workers read, in one shared memory segment.
+
+    `publish` copies the rows in before every parallel scan, so workers
+    see the state of the phase without it being pickled. Positions,
+    status and reload ticks change every step and are copied every time;
+    fraction, type and range only for the rows appended since the last
+    scan, or for all of them after the engine compacted its rows. The
+    segment is replaced by one twice the size when the agents outgrow it.
+    """
+
+    def __init__(self):
+        self.shm = None
+        self.views = None
+        self.capacity = 0
+        self.rows = 0            # rows whose static columns are in the segment
+        self.compactions = None  # `engine.compactions` when they were copied
+
+    def publish(self, engine, scan):
+        """Copy the rows of `engine` in; return the (segment, capacity, rows) workers attach to."""
+        n = engine.n
+        if n > self.capacity:
+            self.close()
+            self.capacity = max(n, 2 * self.capacity, 1024)
+            self.shm = shared_memory.SharedMemory(create=True, size=_layout(self.capacity)[1])
+            self.views = _views(self.shm.buf, self.capacity)
+        start = self.rows if self.compactions == engine.compactions else 0
+        for name, _ in SHARED_COLUMNS:
+            if name == "scan":
+                self.views[name][:n] = scan
+            elif name not in STATIC_COLUMNS:
+                self.views[name][:n] = getattr(engine, name)
+            elif start < n:
+                self.views[name][start:n] = getattr(engine, name)[start:]
+        self.rows, self.compactions = n, engine.compactions
+        return self.shm.name, self.capacity, n
+
+    def close(self):
+        if self.shm is not None:
+            self.views = None  # views must go before the buffer is released
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+        self.rows = 0
+
+
+# segments attached by this scan worker process, the current one only
+_attached = {}
+
+
+def _attach(segment, capacity):
+    if segment not in _attached:
+        for name in list(_attached):
+            shm, _ = _attached.pop(name)
+            shm.close()
+        shm = shared_memory.SharedMemory(name=segment)
+        _attached[segment] = (shm, _views(shm.buf, capacity))
+    return _attached[segment][1]
+
+
+def _strip(segment, capacity, n, height, code, x0, x1, reach):
+    """
+    The columns, the scanning agents of fraction `code` with x0 <= x < x1
+    and the keys (x * height + y) of the enemy cells they can reach: only
+    enemies within `reach` columns of the strip are considered, so a scan
+    of a strip does not look at the whole map.
+    """
+    columns = {name: column[:n] for name, column in _attach(segment, capacity).items()}
+    x, fraction = columns["x"], columns["fraction"]
+    own = np.flatnonzero(columns["scan"] & (fraction == code) & (x >= x0) & (x < x1))
+    enemies = np.flatnonzero((columns["status"] != DEAD) & (columns["kind"] != PROJECTILE)
+                             & (fraction != code) & (x >= x0 - reach) & (x < x1 + reach))
+    keys = np.unique(x[enemies].astype(np.int64) * height + columns["y"][enemies])
+    return columns, own, keys
+
+
+def strip_pairs(segment, capacity, n, height, code, x0, x1, reach):
+    """Worker side of a target scan: attackers and the keys of the cells in their range, by attacker then cell."""
+    columns, own, keys = _strip(segment, capacity, n, height, code, x0, x1, reach)
+    src, cells = cell_pairs(columns["x"], columns["y"], own, columns["damage_range"][own],
+                            keys // height, keys % height)
+    return src, keys[cells]
+
+
+def strip_shots(segment, capacity, n, height, code, x0, x1, reach):
+    """Worker side of mortar fire: mortars, their reload ticks and the keys of the cells they fire at."""
+    columns, own, keys = _strip(segment, capacity, n, height, code, x0, x1, reach)
+    cell_x, cell_y = keys // height, keys % height
+    ticks, shots = np.zeros(len(own), dtype=np.int64), []
+    for k, i in enumerate(own):
+        near = np.flatnonzero(np.maximum(np.abs(cell_x - columns["x"][i]),
+                                         np.abs(cell_y - columns["y"][i])) <= columns["damage_range"][i])
+        ticks[k] = len(near)
+        shots.append(keys[near[max(SHOT_STEPS - columns["steps_after_shot"][i], 0)::SHOT_STEPS + 1]])
+    return own, ticks, shots
+
+
+# the scan worker pool of this process, shared by all its parallel engines
+_pool = None
+_pool_users = 0
+_pool_lock = threading.Lock()
+
+
+def acquire_pool(workers):
+    """The shared pool, started with `workers` processes by its first user."""
+    global _pool, _pool_users
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=workers)
+        _pool_users += 1
+        return _pool
+
+
+def release_pool():
+    """Drop one use of the shared pool, shutting it down after the last one."""
+    global _pool, _pool_users
+    with _pool_lock:
+        _pool_users -= 1
+        if _pool_users == 0:
+            _pool.shutdown(wait=True, cancel_futures=True)
+            _pool = None
+
+
+def _release(pool, columns):
+    if pool is not None:
+        release_pool()
+    columns.close()
+
+
+class ParallelEngine(VectorEngine):
+    """
+    Vector engine that splits its target scans across worker processes.
+
+    Scanning every attacker (and every mortar, for its reload ticks)
+    against every occupied enemy cell is the part of a step that grows
+    with the square of the agents. Here the attackers of a scan are cut
+    into vertical strips of about the same size, and each strip is
+    scanned by a worker against the enemies within weapon range of it,
+    reading a snapshot of the agent columns from shared memory.
+
+    This is not a domain decomposition: the main process owns every
+    agent and runs the rest of the step (healing, damage, movement,
+    mines) serially. Strips are recut from the positions of each scan,
+    so no agent migrates and no state is exchanged between workers.
+
+    Workers only find pairs. Random target picks, hit rolls and damage
+    are resolved here, on the pairs put back in the order the serial scan
+    produces, so a battle gives exactly the results of the vector engine
+    whatever the number of workers. Small scans run serially.
+
+    All parallel engines of a process share one pool, shut down when the
+    last of their models is closed. Engines in a child process, such as a
+    batch, sweep or job worker, scan serially instead of nesting a pool in
+    a pool that already uses the cores.
+    """
+
+    name = "parallel"
+
+    def __init__(self, model, workers=None):
+        super().__init__(model)
+        if multiprocessing.parent_process() is not None:
+            workers = 1
+        self.workers = workers or os.cpu_count() or 1
+        self.pool = acquire_pool(self.workers) if self.workers > 1 else None
+        self.columns = SharedColumns()
+        self._finalizer = weakref.finalize(self, _release, self.pool, self.columns)
+
+    def close(self):
+        """Release the shared pool and free the shared memory."""
+        self._finalizer()
+
+    def _strips(self, attackers):
+        """x ranges splitting `attackers` into strips of about equal size."""
+        xs = np.sort(self.x[attackers])
+        count = min(self.workers * STRIPS_PER_WORKER, len(xs))
+        bounds = xs[np.arange(1, count) * len(xs) // count].tolist()
+        edges = [0, *bounds, self.width]
+        return [(edges[i], edges[i + 1]) for i in range(len(edges) - 1) if edges[i] < edges[i + 1]]
+
+    def _parallel(self, agents):
+        return self.workers > 1 and len(agents) * self.n >= PARALLEL_PAIRS
+
+    def _submit(self, task, agents):
+        """Run `task` on every strip of `agents`, per fraction; returns (fraction, futures) pairs."""
+        scan = np.zeros(self.n, dtype=bool)
+        scan[agents] = True
+        segment = self.columns.publish(self, scan)
+        submitted = []
+        for code in np.unique(self.fraction[agents]):
+            own = agents[self.fraction[agents] == code]
+            reach = int(self.damage_range[own].max())
+            submitted.append((code, [self.pool.submit(task, *segment, self.height, int(code), x0, x1, reach)
+                                     for x0, x1 in self._strips(own)]))
+        return submitted
+
+    def _scan_targets(self, attackers):
+        if not self._parallel(attackers):
+            return super()._scan_targets(attackers)
+
+        sources, targets = [], []
+        live = (self.status != DEAD) & (self.kind != PROJECTILE)
+        for code, futures in self._submit(strip_pairs, attackers):
+            own = attackers[self.fraction[attackers] == code]
+            results = [future.result() for future in futures]
+            src = np.concatenate([result[0] for result in results])
+            keys = np.concatenate([result[1] for result in results])
+            # every attacker is in one strip, with its cells ascending: order by attacker as the serial scan
+            rank = np.empty(self.n, dtype=np.int64)
+            rank[own] = np.arange(len(own))
+            order = np.argsort(rank[src], kind="stable")
+            src, keys = src[order], keys[order]
+
+            members, cell_x, cell_y, starts, counts = self._cells(np.flatnonzero(live & (self.fraction != code)))
+            self.cells_scanned += len(own) * len(cell_x)
+            cells = np.searchsorted(cell_x * self.height + cell_y, keys)
+            pick = (self.rng.random(len(cells)) * counts[cells]).astype(np.int64)
+            sources.append(src)
+            targets.append(members[starts[cells] + pick])
+        if not sources:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return np.concatenate(sources), np.concatenate(targets)
+
+    def _mortar_shots(self, mortars, enemy_cells):
+        if not self._parallel(mortars):
+            return super()._mortar_shots(mortars, enemy_cells)
+
+        position = {int(i): k for k, i in enumerate(mortars)}
+        ticks, shots = np.zeros(len(mortars), dtype=np.int64), [None] * len(mortars)
+        for code, futures in self._submit(strip_shots, mortars):
+            _, cell_x, cell_y, _, _ = enemy_cells[code]
+            keys = cell_x * self.height + cell_y
+            for own, counts, cells in (future.result() for future in futures):
+                for i, count, shot in zip(own, counts, cells):
+                    ticks[position[int(i)]] = count
+                    shots[position[int(i)]] = np.searchsorted(keys, shot)
+        return ticks, shots
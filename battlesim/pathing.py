@@ -0,0 +1,124 @@
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import dijkstra
+
+from .assets import AssetCache, heights_fingerprint
+from .chunks import ChunkedLayer
+
+# extra cost of a move per unit of height climbed, and per mine in the cell entered;
+# a mine (80 damage) is worth a long detour, but a route through a full minefield still exists
+CLIMB_COST = 20.0
+MINE_COST = 50.0
+
+MOORE = np.array([(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)
+                  if (dx, dy) != (0, 0)])
+LENGTHS = np.hypot(MOORE[:, 0], MOORE[:, 1])
+
+FLOW_CACHE = AssetCache(max_entries=64)
+
+
+def _slices(dx, dy, width, height):
+    """Slices of the cells that have a neighbour at (dx, dy), and of those neighbours."""
+    source = (slice(max(-dx, 0), width - max(dx, 0)), slice(max(-dy, 0), height - max(dy, 0)))
+    target = (slice(max(dx, 0), width - max(-dx, 0)), slice(max(dy, 0), height - max(-dy, 0)))
+    return source, target
+
+
+def move_costs(height_map, mines):
+    """
+    Cost of every move, shape (8, width, height): entry [d, x, y] is the
+    cost of stepping from (x, y) in direction MOORE[d], inf off the map.
+    """
+    height_map = np.asarray(height_map, dtype=float)
+    width, height = height_map.shape
+    costs = np.full((len(MOORE), width, height), np.inf)
+    for d, (dx, dy) in enumerate(MOORE):
+        source, target = _slices(dx, dy, width, height)
+        climb = np.maximum(height_map[target] - height_map[source], 0)
+        costs[d][source] = LENGTHS[d] + CLIMB_COST * climb + MINE_COST * mines[target]
+    return costs
+
+
+def flow_field(costs, target):
+    """
+    Next cell towards `target` from every cell, shape (width, height, 2),
+    following the cheapest path under `costs` (from `move_costs`).
+    """
+    _, width, height = costs.shape
+    cells = np.arange(width * height).reshape(width, height)
+
+    # distances to the target: Dijkstra from it over the reversed moves
+    sources, targets, weights = [], [], []
+    for d, (dx, dy) in enumerate(MOORE):
+        source, neighbour = _slices(dx, dy, width, height)
+        sources.append(cells[source].ravel())
+        targets.append(cells[neighbour].ravel())
+        weights.append(costs[d][source].ravel())
+    graph = coo_matrix((np.concatenate(weights), (np.concatenate(targets), np.concatenate(sources))),
+                       shape=(width * height, width * height)).tocsr()
+    distance = dijkstra(graph, indices=target[0] * height + target[1]).reshape(width, height)
+
+    # every cell steps to the neighbour with the cheapest move plus remaining distance
+    through = np.full(costs.shape, np.inf)
+    for d, (dx, dy) in enumerate(MOORE):
+        source, neighbour = _slices(dx, dy, width, height)
+        through[d][source] = costs[d][source] + distance[neighbour]
+    best = MOORE[np.argmin(through, axis=0)]
+    field = np.stack(np.meshgrid(np.arange(width), np.arange(height), indexing="ij"), axis=-1) + best
+    field[target] = target
+    field[~np.isfinite(distance)] = np.stack(np.nonzero(~np.isfinite(distance)), axis=-1)  # unreachable: stay
+    field = field.astype(np.int32)
+    field.setflags(write=False)
+    return field
+
+
+class FlowFields():
+    """
+    Terrain-aware paths of one model, one flow field per waypoint.
+
+    The cost of a move grows with the height climbed and the mines in the
+    cell entered. Mines are the ones known when the model was built:
+    fields do not change as mines go off, so every agent heading to a
+    waypoint reads the same field for the whole battle. Fields are cached
+    per process by (height map, known mines, waypoint), so models of the
+    same map and minefield share them; a move is one array lookup.
+    """
+
+    def __init__(self, height_map, mines):
+        self.height_map = height_map
+        self.mines = mines.copy()
+        self.key = None
+        self.fields = {}
+
+    def _key(self):
+        if self.key is None:
+            self.key = (heights_fingerprint(np.asarray(self.height_map)), heights_fingerprint(self.mines))
+        return self.key
+
+    def field(self, target):
+        """Flow field towards `target` (x, y), indexed as field[x, y] -> next (x, y)."""
+        target = (int(target[0]), int(target[1]))
+        field = self.fields.get(target)
+        if field is None:
+            if isinstance(self.mines, ChunkedLayer) or isinstance(self.height_map, ChunkedLayer):
+                raise ValueError("path movement needs a dense map, sparse maps support route movement")
+            key = self._key()
+            costs = lambda: FLOW_CACHE.get(("costs",) + key, lambda: move_costs(self.height_map, self.mines))
+            field = FLOW_CACHE.get(("field",) + key + (target,), lambda: flow_field(costs(), target))
+            self.fields[target] = field
+        return field
+
+    def next_cell(self, pos, target):
+        """Cell to step to from `pos` on the way to `target`."""
+        x, y = self.field(target)[pos]
+        return (int(x), int(y))
+
+    def next_cells(self, x, y, target_x, target_y):
+        """Vectorized `next_cell`: one lookup per distinct target."""
+        next_x, next_y = x.copy(), y.copy()
+        keys, group = np.unique(target_x.astype(np.int64) * self.mines.shape[1] + target_y, return_inverse=True)
+        for k, key in enumerate(keys):
+            members = np.flatnonzero(group == k)
+            step = self.field(divmod(int(key), self.mines.shape[1]))[x[members], y[members]]
+            next_x[members], next_y[members] = step[:, 0], step[:, 1]
+        return next_x, next_y
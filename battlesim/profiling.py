@@ -0,0 +1,250 @@
+import threading
+from bisect import bisect_left
+from collections import defaultdict, deque
+from time import perf_counter
+
+from .agents import SoldierAgent
+
+# upper bounds (seconds) of the histogram buckets
+STEP_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+SIMULATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class ProfiledAgent(SoldierAgent):
+    """
+    SoldierAgent that times its phases on `model.profiler`.
+
+    Profiled models switch the class of their agents to this one, so
+    unprofiled models run the plain methods without any check.
+    """
+    __slots__ = ()
+
+    def attack(self):
+        profiler = self.model.profiler
+        if not self.is_projectile:
+            profiler.count("attacks")
+        profiler.timed("attack", SoldierAgent.attack, self)
+
+    def heal_wounded(self):
+        return self.model.profiler.timed("heal", SoldierAgent.heal_wounded, self)
+
+    def move(self):
+        self.model.profiler.timed("move", SoldierAgent.move, self)
+
+    def check_mines(self):
+        self.model.profiler.timed("mines", SoldierAgent.check_mines, self)
+
+    def trigger_mine(self):
+        if not self.is_projectile:
+            self.model.profiler.count("mines_triggered")
+        SoldierAgent.trigger_mine(self)
+
+
+class Profiler():
+    """
+    Per-phase timers, event counters and slow-step samples of one model.
+
+    Phase times are exclusive: time spent in a nested phase (targeting
+    inside attack, mines inside move) only counts for the nested one.
+    Phases: collect, heal, attack, targeting, move, mines, spawn and sync
+    (vector engine), remove_dead, render (when the caller times frames)
+    and schedule/engine for the rest of the step. Counters: attacks
+    (attacker turns), cells_scanned (cells looked at by neighbourhood
+    queries), projectiles_spawned and mines_triggered.
+    """
+
+    def __init__(self, slow_step_ms=None, max_samples=100):
+        self.slow_step_ms = slow_step_ms
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.counters = defaultdict(int)
+        self.steps = 0
+        self.step_seconds = 0.0
+        self.step_buckets = [0] * (len(STEP_BUCKETS) + 1)
+        self.slow_steps = deque(maxlen=max_samples)
+        self.nested = 0.0
+        self.wrapped = []
+
+    ### measuring ###
+    def timed(self, phase, function, *args):
+        """Call `function(*args)`, adding its time to `phase`."""
+        outer, self.nested = self.nested, 0.0
+        start = perf_counter()
+        try:
+            return function(*args)
+        finally:
+            elapsed = perf_counter() - start
+            self.seconds[phase] += elapsed - self.nested
+            self.calls[phase] += 1
+            self.nested = outer + elapsed
+
+    def count(self, event, n=1):
+        self.counters[event] += n
+
+    def step(self, model):
+        """One `BattleModel.step`, timed phase by phase."""
+        before = dict(self.seconds) if self.slow_step_ms is not None else None
+        start = perf_counter()
+        self.timed("collect", model.collect)
+        engine = model.engine
+        if engine is None:
+            self.timed("schedule", model.advance)
+        else:
+            scanned = engine.cells_scanned
+            self.timed("engine", model.advance)
+            self.count("cells_scanned", engine.cells_scanned - scanned)
+        self.timed("remove_dead", model.remove_dead)
+        elapsed = perf_counter() - start
+
+        self.steps += 1
+        self.step_seconds += elapsed
+        self.step_buckets[bisect_left(STEP_BUCKETS, elapsed)] += 1
+        if before is not None and 1000 * elapsed >= self.slow_step_ms:
+            self.slow_steps.append({
+                "step": model.schedule.steps,
+                "ms": 1000 * elapsed,
+                "agents": model.schedule.get_agent_count(),
+                "phases": {phase: 1000 * (seconds - before.get(phase, 0.0))
+                           for phase, seconds in self.seconds.items()
+                           if seconds != before.get(phase, 0.0)}})
+
+    ### attaching ###
+    def _wrap(self, owner, name, phase, counter=None):
+        """Replace `owner.name` by a timed (and counted) instance attribute."""
+        method = getattr(owner, name)
+
+        def wrapper(*args):
+            if counter is not None:
+                counter(*args)
+            if phase is None:
+                return method(*args)
+            return self.timed(phase, method, *args)
+
+        setattr(owner, name, wrapper)
+        self.wrapped.append((owner, name))
+
+    def attach(self, model):
+        grid = model.grid
+        self._wrap(grid, "cells_in_range", "targeting",
+                   lambda pos, radius, fractions: self.count("cells_scanned", grid.scan_size(radius, fractions)))
+        for agent in self._agents(model):
+            agent.__class__ = ProfiledAgent
+
+        engine = model.engine
+        if engine is not None:
+            self._wrap(model.mine_map, "trigger_all", None,
+                       lambda xs, ys: self.count("mines_triggered", len(xs)))
+            self._wrap(engine, "_check_mines", "mines")
+            self._wrap(engine, "_heal", "heal")
+            self._wrap(engine, "_attack", "attack", lambda attackers: self.count("attacks", len(attackers)))
+            self._wrap(engine, "_scan_targets", "targeting")
+            self._wrap(engine, "_move", "move")
+            self._wrap(engine, "_spawn_projectiles", "spawn",
+                       lambda spawns: self.count("projectiles_spawned", len(spawns)))
+            self._wrap(engine, "_bury", "sync")
+
+    def detach(self, model):
+        for owner, name in self.wrapped:
+            owner.__dict__.pop(name, None)
+        self.wrapped.clear()
+        for agent in self._agents(model):
+            agent.__class__ = SoldierAgent
+
+    @staticmethod
+    def _agents(model):
+        yield from model.schedule.agents
+        yield from model.dead_agents
+        for pool in model.projectile_pool.values():
+            yield from pool
+
+    def add_agent(self, agent):
+        """Called by `register_agent` for agents placed while profiling."""
+        agent.__class__ = ProfiledAgent
+        if agent.is_projectile:
+            self.count("projectiles_spawned")
+
+    ### results ###
+    def report(self):
+        """Everything measured so far as a JSON-ready dict, times in milliseconds."""
+        phases = sorted(self.seconds, key=self.seconds.get, reverse=True)
+        return {"steps": self.steps,
+                "step_ms": 1000 * self.step_seconds,
+                "mean_step_ms": 1000 * self.step_seconds / self.steps if self.steps else 0.0,
+                "phases": {phase: {"ms": 1000 * self.seconds[phase], "calls": self.calls[phase]}
+                           for phase in phases},
+                "counters": dict(self.counters),
+                "slow_steps": list(self.slow_steps)}
+
+
+### Prometheus ###
+def format_metric(name, kind, description, samples):
+    """
+    One metric in the Prometheus text format. `samples` are (suffix,
+    labels, value) tuples, e.g. ("_bucket", {"le": "0.1"}, 3).
+    """
+    lines = [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+    for suffix, labels, value in samples:
+        label_text = ",".join(f'{key}="{value}"' for key, value in labels.items())
+        lines.append(f"{name}{suffix}{{{label_text}}} {value}" if label_text else f"{name}{suffix} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def _histogram(bounds, counts, total):
+    samples, cumulative = [], 0
+    for bound, count in zip(bounds + (float("inf"),), counts):
+        cumulative += count
+        samples.append(("_bucket", {"le": "+Inf" if bound == float("inf") else str(bound)}, cumulative))
+    samples.append(("_sum", {}, total))
+    samples.append(("_count", {}, cumulative))
+    return samples
+
+
+class Metrics():
+    """Process-wide totals of finished simulations and their profilers."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.simulations = 0
+        self.simulation_seconds = 0.0
+        self.simulation_buckets = [0] * (len(SIMULATION_BUCKETS) + 1)
+        self.steps = 0
+        self.step_seconds = 0.0
+        self.step_buckets = [0] * (len(STEP_BUCKETS) + 1)
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.counters = defaultdict(int)
+
+    def observe_simulation(self, seconds, profiler=None):
+        with self.lock:
+            self.simulations += 1
+            self.simulation_seconds += seconds
+            self.simulation_buckets[bisect_left(SIMULATION_BUCKETS, seconds)] += 1
+            if profiler is None:
+                return
+            self.steps += profiler.steps
+            self.step_seconds += profiler.step_seconds
+            self.step_buckets = [a + b for a, b in zip(self.step_buckets, profiler.step_buckets)]
+            for phase, seconds in profiler.seconds.items():
+                self.seconds[phase] += seconds
+                self.calls[phase] += profiler.calls[phase]
+            for event, n in profiler.counters.items():
+                self.counters[event] += n
+
+    def render(self):
+        with self.lock:
+            return "".join([
+                format_metric("battlesim_simulation_seconds", "histogram",
+                              "Wall time of finished simulations.",
+                              _histogram(SIMULATION_BUCKETS, self.simulation_buckets, self.simulation_seconds)),
+                format_metric("battlesim_step_seconds", "histogram",
+                              "Wall time of the steps of profiled simulations.",
+                              _histogram(STEP_BUCKETS, self.step_buckets, self.step_seconds)),
+                format_metric("battlesim_phase_seconds_total", "counter",
+                              "Exclusive time spent in each step phase of profiled simulations.",
+                              [("", {"phase": phase}, seconds) for phase, seconds in sorted(self.seconds.items())]),
+                format_metric("battlesim_phase_calls_total", "counter",
+                              "Calls of each step phase of profiled simulations.",
+                              [("", {"phase": phase}, calls) for phase, calls in sorted(self.calls.items())]),
+                format_metric("battlesim_events_total", "counter",
+                              "Events counted in profiled simulations.",
+                              [("", {"event": event}, n) for event, n in sorted(self.counters.items())])])
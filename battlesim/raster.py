@@ -0,0 +1,156 @@
+import os
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+from .enums import DEAD, ALLY
+
+RASTER_SCALER = 4  # pixels per cell, close to the size of the matplotlib frames
+
+# marker radius in cells per sqrt(health), and half the line width of + and x,
+# matching the scatter sizes (points^2) of `draw_teritory`
+MARKER_RADIUS = 0.19
+LINE_WIDTH = 0.28
+
+# BGR, as cv2 encodes them; named like the matplotlib colors of `Visualizer._get_color`
+COLORS = {"blue": (255, 0, 0), "red": (0, 0, 255), "yellow": (0, 255, 255),
+          "orange": (0, 165, 255), "purple": (128, 0, 128)}
+MINE_ALPHA = 0.8
+
+# marker by type code (infantry, medic, mortar, projectile), drawn in this order like the scatter calls
+MARKERS = ("o", "+", "s", "x")
+
+FORMATS = {"png": (".png", [cv2.IMWRITE_PNG_COMPRESSION, 1,
+                            cv2.IMWRITE_PNG_STRATEGY, cv2.IMWRITE_PNG_STRATEGY_RLE]),
+           "jpeg": (".jpg", [cv2.IMWRITE_JPEG_QUALITY, 90]),
+           "jpg": (".jpg", [cv2.IMWRITE_JPEG_QUALITY, 90]),
+           "webp": (".webp", [cv2.IMWRITE_WEBP_QUALITY, 90])}
+
+
+def agent_arrays(model):
+    """Positions, health, fraction and type codes (3 for projectiles) of the live agents."""
+    engine = model.engine
+    if engine is not None and engine.compiled and not engine.pending:
+        live = engine.status != DEAD
+        return {"x": engine.x[live], "y": engine.y[live], "health": engine.health[live],
+                "fraction": engine.fraction[live], "kind": engine.kind[live]}
+    model.sync_agents()
+    agents = [agent for agent in model.schedule.agents if agent.status is not DEAD]
+    pos = np.array([agent.pos for agent in agents], dtype=np.int32).reshape(-1, 2)
+    return {"x": pos[:, 0], "y": pos[:, 1],
+            "health": np.array([agent.health for agent in agents], dtype=float),
+            "fraction": np.array([agent.fraction for agent in agents], dtype=np.int8),
+            "kind": np.array([3 if agent.is_projectile else agent.type for agent in agents], dtype=np.int8)}
+
+
+@lru_cache(maxsize=None)
+def _stencil(marker, radius, line):
+    """Row and column offsets of the pixels of a marker."""
+    dy, dx = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+    if marker == "o":
+        mask = dx * dx + dy * dy <= radius * radius + radius
+    elif marker == "s":
+        mask = np.ones_like(dx, dtype=bool)
+    elif marker == "+":
+        mask = (np.abs(dx) <= line) | (np.abs(dy) <= line)
+    else:
+        mask = np.abs(np.abs(dx) - np.abs(dy)) <= line
+    return dy[mask], dx[mask]
+
+
+class Rasterizer():
+    """
+    Draws territory frames straight into a reused BGR buffer.
+
+    Gives the picture of `draw_teritory` (background with heights, mines
+    and agents sized by health) without matplotlib: markers are stamped
+    with vectorized indexing, one batch per marker and radius.
+    """
+
+    def __init__(self, scaler=RASTER_SCALER):
+        self.scaler = scaler
+        self.buffer = None
+        self.source = None
+        self.layer = None
+
+    def _base(self, layer):
+        # the cached layers are RGB, the buffer is BGR for cv2
+        if self.source is not layer:
+            self.source = layer
+            self.layer = np.ascontiguousarray(layer[:, :, ::-1])
+            self.buffer = np.empty_like(self.layer)
+        np.copyto(self.buffer, self.layer)
+        return self.buffer
+
+    def _stamp(self, rows, cols, radii, colors, marker, alpha=None):
+        buffer = self.buffer
+        height, width = buffer.shape[:2]
+        line = int(round(LINE_WIDTH * self.scaler))
+        for radius in np.unique(radii)[::-1]:  # big markers first, small ones stay visible
+            members = np.flatnonzero(radii == radius)
+            dy, dx = _stencil(marker, int(radius), line)
+            r = rows[members, None] + dy[None, :]
+            c = cols[members, None] + dx[None, :]
+            inside = (r >= 0) & (r < height) & (c >= 0) & (c < width)
+            color = np.broadcast_to(colors[members, None, :], r.shape + (3,))[inside]
+            r, c = r[inside], c[inside]
+            if alpha is None:
+                buffer[r, c] = color
+            else:
+                buffer[r, c] = (alpha * color + (1 - alpha) * buffer[r, c]).astype(np.uint8)
+
+    def draw(self, layer, frame, show_mines=True):
+        """
+        Frame from `Visualizer.frame` drawn over `layer` (the cached
+        terrain or background at this scaler); returns the BGR buffer,
+        which the next call overwrites.
+        """
+        self._base(layer)
+        scaler, height = self.scaler, frame["height"]
+
+        mines = frame["mines"]
+        if show_mines:
+            mine_x, mine_y = np.nonzero(mines)
+            if len(mine_x):
+                radii = np.rint(0.5 * MARKER_RADIUS * scaler * np.sqrt(5 * mines[mine_x, mine_y])).astype(int)
+                colors = np.tile(np.array(COLORS["purple"], dtype=np.uint8), (len(mine_x), 1))
+                self._stamp((height - 1 - mine_y) * scaler, mine_x * scaler, radii, colors, "o", MINE_ALPHA)
+
+        rows = (height - 1 - frame["y"].astype(np.int64)) * scaler
+        cols = frame["x"].astype(np.int64) * scaler
+        radii = np.rint(MARKER_RADIUS * scaler * np.sqrt(np.maximum(frame["health"], 0))).astype(np.int64)
+        projectile = frame["kind"] >= 3
+        marker = np.where(projectile, 3, frame["kind"]).astype(np.int64)
+        color = 2 * projectile + (frame["fraction"] != int(ALLY))
+
+        # agents in one cell often look the same: stamp each distinct marker once, the last one drawn
+        key = (((rows * self.buffer.shape[1] + cols) * 4 + marker) * 4 + color) * (radii.max(initial=0) + 1) + radii
+        _, last = np.unique(key[::-1], return_index=True)
+        keep = np.sort(len(key) - 1 - last)
+        rows, cols, radii, marker, color = rows[keep], cols[keep], radii[keep], marker[keep], color[keep]
+
+        palette = np.array([COLORS[name] for name in ("blue", "red", "yellow", "orange")], dtype=np.uint8)
+        for code, shape in enumerate(MARKERS):
+            members = np.flatnonzero(marker == code)
+            if len(members):
+                self._stamp(rows[members], cols[members], radii[members], palette[color[members]], shape)
+        return self.buffer
+
+
+def encode(image, format="png"):
+    """BGR image as PNG, JPEG or WebP bytes."""
+    extension, params = FORMATS[format.lower()]
+    ok, data = cv2.imencode(extension, image, params)
+    if not ok:
+        raise ValueError(f"Could not encode a {format} frame")
+    return data.tobytes()
+
+
+def write_frame(image, path):
+    """Write an encoded frame, replacing `path` at once so readers never see half a file."""
+    format = os.path.splitext(path)[1].lstrip(".") or "png"
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as file:
+        file.write(encode(image, format))
+    os.replace(temporary, path)
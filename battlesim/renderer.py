@@ -0,0 +1,94 @@
+import atexit
+import queue
+import multiprocessing
+
+import numpy as np
+
+
+def _render_loop(frames):
+    from .raster import Rasterizer, write_frame
+    from .visualizer import raster_layer
+
+    rasterizer = Rasterizer()
+    layers = {}  # (image path, terrain key) -> static layer, built once per map
+    while True:
+        item = frames.get()
+        if item is None:
+            break
+        frame, image_path, output_path = item
+        key = (image_path, frame["terrain_key"])
+        if "height_map" in frame:
+            layers[key] = raster_layer(image_path, frame, rasterizer.scaler)
+        layer = layers.get(key)
+        if layer is None:
+            continue
+        mines = np.zeros((frame["width"], frame["height"]), dtype=frame["mine_count"].dtype)
+        mines[frame["mine_x"], frame["mine_y"]] = frame["mine_count"]
+        frame["mines"] = mines
+        write_frame(rasterizer.draw(layer, frame), output_path)
+
+
+class FrameRenderer():
+    """
+    Renders territory frames in a background process.
+
+    `submit` never blocks: snapshots go to a bounded queue and are dropped
+    when the renderer falls behind, so rendering never slows `model.step()`.
+    Frames carry the agents and the mined cells of their step only; the
+    height map of a map goes along with its first frame and the process
+    keeps the layer drawn from it. The process is stopped at exit.
+    """
+
+    def __init__(self, image_path="database/image.png", max_queue=2):
+        self.image_path = image_path
+        self.frames = multiprocessing.Queue(maxsize=max_queue)
+        # frames still in the pipe at exit are dropped instead of waited for
+        self.frames.cancel_join_thread()
+        self.process = multiprocessing.Process(target=_render_loop,
+                                               args=(self.frames,),
+                                               daemon=True)
+        self.process.start()
+        self.layers = set()  # (image path, terrain key) the process has the layer of
+        self.submitted = 0
+        self.dropped = 0
+        self.closed = False
+        atexit.register(self.close)
+
+    def submit(self, frame, output_path="database/teritory.png", image_path=None):
+        """
+        Queue a `Visualizer.frame` drawn over `image_path` (by default the
+        renderer's); the file format follows the extension (png, jpg, webp).
+        """
+        image_path = image_path or self.image_path
+        key = (image_path, frame["terrain_key"])
+        item = {name: value for name, value in frame.items() if name not in ("height_map", "mines")}
+        if key not in self.layers:
+            item["height_map"] = np.asarray(frame["height_map"])
+        mines = frame["mines"]
+        item["mine_x"], item["mine_y"] = np.nonzero(mines)
+        item["mine_count"] = mines[item["mine_x"], item["mine_y"]]
+        try:
+            self.frames.put_nowait((item, image_path, output_path))
+            self.layers.add(key)
+            self.submitted += 1
+        except queue.Full:
+            self.dropped += 1
+
+    def is_alive(self):
+        return self.process.is_alive()
+
+    def close(self, timeout=5):
+        """Stop the process; frames still queued may be dropped."""
+        if self.closed:
+            return
+        self.closed = True
+        atexit.unregister(self.close)
+        try:
+            self.frames.put_nowait(None)
+            self.process.join(timeout)
+        except queue.Full:
+            pass
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(timeout)
+        self.frames.close()
@@ -0,0 +1,452 @@
+"""
+Battle replays: a compact step-by-step record of a run in one `.npz` file.
+
+    python -m battlesim.replay info replay.npz
+    python -m battlesim.replay render replay.npz battle.mp4 [--fps 10] [--every 1] [--workers N]
+
+The file is a zip of `.npy` members written chunk by chunk while the
+battle runs. Each chunk holds a keyframe (the full state of its first
+step) and, for every following step, only the units that appeared,
+changed or died, the projectiles in flight, the mine cells that changed
+and the per-fraction totals. Members are read lazily, so seeking to a step
+decodes one chunk.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import zipfile
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from .assets import heights_fingerprint
+from .enums import DEAD, Fraction
+from .raster import RASTER_SCALER, Rasterizer
+from .spatial import SparseGrid
+from .utils import run_battle
+
+REPLAY_VERSION = 1
+CHUNK_STEPS = 64
+PROJECTILE = 3  # type code of projectiles in frames
+
+UNIT_DTYPES = {"id": np.int64, "x": np.uint16, "y": np.uint16, "health": np.float32,
+               "status": np.uint8, "fraction": np.uint8, "kind": np.uint8}
+CHANGING = ("x", "y", "health", "status")
+PROJECTILE_DTYPES = {"x": np.uint16, "y": np.uint16, "health": np.float32, "fraction": np.uint8}
+DELTA_DTYPES = {name: UNIT_DTYPES[name] for name in ("id",) + CHANGING}
+TABLE_DTYPES = {name: UNIT_DTYPES[name] for name in ("id", "fraction", "kind")}
+MINE_DTYPES = {"x": np.uint16, "y": np.uint16, "count": np.uint8}
+FRACTIONS = tuple(Fraction)
+
+VIDEO_CODECS = {".mp4": "mp4v", ".avi": "MJPG"}
+
+
+def _columns(dtypes, **values):
+    return {name: np.asarray(values[name], dtype=dtype) for name, dtype in dtypes.items()}
+
+
+def _take(columns, index):
+    return {name: values[index] for name, values in columns.items()}
+
+
+def _concat(parts, dtypes):
+    return {name: np.concatenate([part[name] for part in parts]).astype(dtype, copy=False)
+            if parts else np.empty(0, dtype=dtype) for name, dtype in dtypes.items()}
+
+
+def _offsets(parts):
+    return np.concatenate([[0], np.cumsum([len(part["x"]) for part in parts])]).astype(np.int64)
+
+
+### recording ###
+class ReplayRecorder():
+    """
+    Records a battle into a replay file, one `record()` per step.
+
+    Memory is bounded by one chunk of `chunk_steps` steps: full chunks are
+    compressed into the file as soon as they are complete. The file is
+    written next to `path` and moved into place by `close`.
+    """
+
+    def __init__(self, path, model, chunk_steps=CHUNK_STEPS, meta=None):
+        if isinstance(model.grid, SparseGrid):
+            raise ValueError("Replays store whole-map layers, sparse maps cannot be recorded")
+        self.path = path
+        self.model = model
+        self.chunk_steps = chunk_steps
+        self.meta = dict(meta or {})
+        self.temporary = f"{path}.{os.getpid()}.tmp"
+        self.zip = zipfile.ZipFile(self.temporary, "w", compression=zipfile.ZIP_DEFLATED)
+        self.chunks = []  # first step of every written chunk
+        self.chunk = None
+        self.previous = None
+        self.previous_mines = None
+        self.rows, self.row_ids = None, None  # unit ids of the vector engine rows
+        self._write("height_map", np.asarray(model.height_map, dtype=np.float32))
+        self.record()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, kind, error, traceback):
+        if error is None:
+            self.close()
+        else:
+            self.zip.close()
+            os.remove(self.temporary)
+
+    def _write(self, name, array):
+        with self.zip.open(name + ".npy", "w", force_zip64=True) as file:
+            np.lib.format.write_array(file, np.asarray(array), allow_pickle=False)
+
+    def _engine_ids(self, engine):
+        # recomputed only when rows were appended or compacted
+        if self.rows is not engine.agents or len(self.row_ids) != engine.n:
+            self.rows = engine.agents
+            self.row_ids = np.array([agent.unique_id if agent is not None else -1 for agent in engine.agents],
+                                    dtype=np.int64)
+        return self.row_ids
+
+    def _state(self):
+        """Live units sorted by id, and the projectiles in flight."""
+        model = self.model
+        engine = model.engine
+        if engine is not None and engine.compiled and not engine.pending:
+            live = engine.status != DEAD
+            unit, flying = live & (engine.kind < PROJECTILE), live & (engine.kind >= PROJECTILE)
+            units = _columns(UNIT_DTYPES, id=self._engine_ids(engine)[unit], x=engine.x[unit], y=engine.y[unit],
+                             health=engine.health[unit], status=engine.status[unit],
+                             fraction=engine.fraction[unit], kind=engine.kind[unit])
+            projectiles = _columns(PROJECTILE_DTYPES, x=engine.x[flying], y=engine.y[flying],
+                                   health=engine.health[flying], fraction=engine.fraction[flying])
+        else:
+            model.sync_agents()
+            agents = [agent for agent in model.schedule.agents if agent.status is not DEAD]
+            units = [agent for agent in agents if not agent.is_projectile]
+            flying = [agent for agent in agents if agent.is_projectile]
+            units = _columns(UNIT_DTYPES, id=[agent.unique_id for agent in units],
+                             x=[agent.pos[0] for agent in units], y=[agent.pos[1] for agent in units],
+                             health=[agent.health for agent in units], status=[agent.status for agent in units],
+                             fraction=[agent.fraction for agent in units], kind=[agent.type for agent in units])
+            projectiles = _columns(PROJECTILE_DTYPES, x=[agent.pos[0] for agent in flying],
+                                   y=[agent.pos[1] for agent in flying],
+                                   health=[agent.health for agent in flying],
+                                   fraction=[agent.fraction for agent in flying])
+        return _take(units, np.argsort(units["id"], kind="stable")), projectiles
+
+    def record(self):
+        """Record the current step of the model."""
+        model = self.model
+        units, projectiles = self._state()
+        mines = model.mine_map.grid
+        totals = ([model.stats.alive_count(fraction) for fraction in FRACTIONS],
+                  [model.stats.total_health(fraction) for fraction in FRACTIONS])
+
+        if self.chunk is None:
+            self.chunk = {"steps": [], "key": units, "mines": mines.copy(), "deltas": [], "new": [],
+                          "projectiles": [], "mine_changes": [], "alive": [], "health": []}
+            delta = _take(units, slice(0, 0))
+            changes = {"x": np.empty(0, np.uint16), "y": np.empty(0, np.uint16), "count": np.empty(0, np.uint8)}
+        else:
+            delta, new = _diff(self.previous, units)
+            self.chunk["new"].append(new)
+            cells = np.nonzero(mines != self.previous_mines)
+            changes = {"x": cells[0].astype(np.uint16), "y": cells[1].astype(np.uint16),
+                       "count": mines[cells].astype(np.uint8)}
+
+        chunk = self.chunk
+        chunk["steps"].append(model.schedule.steps)
+        chunk["deltas"].append(delta)
+        chunk["projectiles"].append(projectiles)
+        chunk["mine_changes"].append(changes)
+        chunk["alive"].append(totals[0])
+        chunk["health"].append(totals[1])
+        self.previous = units
+        self.previous_mines = mines.copy()
+        if len(chunk["steps"]) >= self.chunk_steps:
+            self._flush()
+
+    def on_step(self, i):
+        """`run_battle` callback."""
+        self.record()
+
+    def _flush(self):
+        chunk, self.chunk = self.chunk, None
+        if chunk is None:
+            return
+        prefix = f"c{len(self.chunks):05d}/"
+        arrays = {"steps": np.array(chunk["steps"], dtype=np.int64),
+                  "key_mines": chunk["mines"],
+                  "alive": np.array(chunk["alive"], dtype=np.int32),
+                  "health": np.array(chunk["health"], dtype=np.float32),
+                  "d_offsets": _offsets(chunk["deltas"]),
+                  "p_offsets": _offsets(chunk["projectiles"]),
+                  "m_offsets": _offsets(chunk["mine_changes"])}
+        arrays.update({f"key_{name}": values for name, values in chunk["key"].items()})
+        arrays.update({f"d_{name}": values for name, values in _concat(chunk["deltas"], DELTA_DTYPES).items()})
+        arrays.update({f"n_{name}": values for name, values in _concat(chunk["new"], TABLE_DTYPES).items()})
+        arrays.update({f"p_{name}": values for name, values in _concat(chunk["projectiles"], PROJECTILE_DTYPES).items()})
+        arrays.update({f"m_{name}": values for name, values in _concat(chunk["mine_changes"], MINE_DTYPES).items()})
+        for name, values in arrays.items():
+            self._write(prefix + name, values)
+        self.chunks.append(chunk["steps"][0])
+        self.last_step = chunk["steps"][-1]
+
+    def close(self, **meta):
+        """Write the last chunk and the index, and move the file into place."""
+        self._flush()
+        model = self.model
+        self.meta.update(meta)
+        self._write("meta", np.array(json.dumps({
+            **self.meta,
+            "version": REPLAY_VERSION,
+            "width": model.grid.width,
+            "height": model.grid.height,
+            "chunk_steps": self.chunk_steps,
+            "chunks": self.chunks,
+            "first_step": self.chunks[0],
+            "last_step": self.last_step}, default=str)))
+        self.zip.close()
+        os.replace(self.temporary, self.path)
+
+
+def _diff(previous, current):
+    """
+    Delta rows from `previous` to `current` units (both sorted by id): new
+    and changed units, and the units gone since, as dead. Also returns the
+    id, fraction and type of the new units.
+    """
+    index = np.searchsorted(previous["id"], current["id"])
+    found = index < len(previous["id"])
+    found[found] = previous["id"][index[found]] == current["id"][found]
+    changed = ~found
+    for name in CHANGING:
+        changed[found] |= current[name][found] != previous[name][index[found]]
+    gone = _take(previous, ~np.isin(previous["id"], current["id"], assume_unique=True))
+    gone["status"] = np.full(len(gone["id"]), int(DEAD), dtype=np.uint8)
+    gone["health"] = np.zeros(len(gone["id"]), dtype=np.float32)
+    delta = _concat([_take(current, changed), gone], DELTA_DTYPES)
+    return delta, {name: current[name][~found] for name in TABLE_DTYPES}
+
+
+def record_battle(model, path, chunk_steps=CHUNK_STEPS, meta=None, **run_kwargs):
+    """Run a battle with `run_battle`, recording it to `path`; returns the run result."""
+    with ReplayRecorder(path, model, chunk_steps=chunk_steps, meta=meta) as recorder:
+        run = run_battle(model, on_step=recorder.on_step, **run_kwargs)
+        recorder.meta["result"] = run
+    return run
+
+
+### reading ###
+class Replay():
+    """
+    Random access to the steps of a replay file.
+
+    Only the chunk of the requested step is decoded; reading the steps in
+    order applies one delta per step.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = np.load(path)
+        self.meta = json.loads(self.file["meta"].item())
+        self.height_map = self.file["height_map"]
+        self.terrain_key = heights_fingerprint(self.height_map)
+        self.lock = threading.Lock()
+        self.loaded = None  # (chunk index, arrays)
+        self.cursor = None  # (chunk index, position, units, mines)
+
+    @property
+    def first_step(self):
+        return self.meta["first_step"]
+
+    @property
+    def last_step(self):
+        return self.meta["last_step"]
+
+    def steps(self):
+        """Every recorded step, in order."""
+        return np.concatenate([self.file[f"c{k:05d}/steps"] for k in range(len(self.meta["chunks"]))])
+
+    def _chunk(self, k):
+        if self.loaded is None or self.loaded[0] != k:
+            prefix = f"c{k:05d}/"
+            self.loaded = (k, {name[len(prefix):]: self.file[name]
+                               for name in self.file.files if name.startswith(prefix)})
+        return self.loaded[1]
+
+    def _seek(self, step):
+        if not self.first_step <= step <= self.last_step:
+            raise IndexError(f"Step {step} is outside the replay ({self.first_step}-{self.last_step})")
+        k = bisect_right(self.meta["chunks"], step) - 1
+        chunk = self._chunk(k)
+        position = int(np.searchsorted(chunk["steps"], step, side="right")) - 1
+
+        # continue from the cursor when reading forward within a chunk
+        if self.cursor is not None and self.cursor[0] == k and self.cursor[1] <= position:
+            _, at, units, mines = self.cursor
+        else:
+            at = 0
+            units = {name: chunk[f"key_{name}"].copy() for name in UNIT_DTYPES}
+            mines = chunk["key_mines"].copy()
+        if at < position:
+            table = {name: np.concatenate([chunk[f"key_{name}"], chunk[f"n_{name}"]]) for name in TABLE_DTYPES}
+            order = np.argsort(table["id"], kind="stable")
+            table = _take(table, order)
+            for j in range(at + 1, position + 1):
+                units = _apply(units, _take_range(chunk, "d", DELTA_DTYPES, j), table)
+                changes = _take_range(chunk, "m", MINE_DTYPES, j)
+                mines[changes["x"], changes["y"]] = changes["count"]
+        self.cursor = (k, position, units, mines)
+        return chunk, position, units, mines
+
+    def frame(self, step):
+        """
+        State at `step` (the last recorded step at or before it) in the
+        form of `Visualizer.frame`, with unit ids, statuses and totals.
+        """
+        with self.lock:
+            chunk, position, units, mines = self._seek(step)
+            projectiles = _take_range(chunk, "p", PROJECTILE_DTYPES, position)
+            mines = mines.copy()
+        return {"step": int(chunk["steps"][position]),
+                "width": self.meta["width"],
+                "height": self.meta["height"],
+                "height_map": self.height_map,
+                "terrain_key": self.terrain_key,
+                "mines": mines,
+                "x": np.concatenate([units["x"], projectiles["x"]]),
+                "y": np.concatenate([units["y"], projectiles["y"]]),
+                "health": np.concatenate([units["health"], projectiles["health"]]),
+                "fraction": np.concatenate([units["fraction"], projectiles["fraction"]]),
+                "kind": np.concatenate([units["kind"], np.full(len(projectiles["x"]), PROJECTILE, dtype=np.uint8)]),
+                "id": units["id"],
+                "status": units["status"],
+                "alive": {str(fraction): int(n) for fraction, n in zip(FRACTIONS, chunk["alive"][position])},
+                "total_health": {str(fraction): float(h) for fraction, h in zip(FRACTIONS, chunk["health"][position])}}
+
+    def close(self):
+        self.file.close()
+
+
+def _take_range(chunk, prefix, dtypes, j):
+    start, end = chunk[f"{prefix}_offsets"][j:j + 2]
+    return {name: chunk[f"{prefix}_{name}"][start:end] for name in dtypes}
+
+
+def _apply(units, delta, table):
+    """Units after one step of deltas; `table` gives the fraction and type of new ids."""
+    dead = delta["status"] == int(DEAD)
+    units = _take(units, ~np.isin(units["id"], delta["id"][dead]))
+    delta = _take(delta, ~dead)
+    index = np.searchsorted(units["id"], delta["id"])
+    found = index < len(units["id"])
+    found[found] = units["id"][index[found]] == delta["id"][found]
+    for name in CHANGING:
+        units[name][index[found]] = delta[name][found]
+    if found.all():
+        return units
+    new = _take(delta, ~found)
+    static = np.searchsorted(table["id"], new["id"])
+    new["fraction"], new["kind"] = table["fraction"][static], table["kind"][static]
+    units = _concat([units, new], UNIT_DTYPES)
+    return _take(units, np.argsort(units["id"], kind="stable"))
+
+
+### rendering ###
+_open_replays = {}  # per worker process
+
+
+def _render_steps(job):
+    path, steps, scaler = job
+    from .visualizer import raster_layer
+    replay = _open_replays.get(path)
+    if replay is None:
+        replay = _open_replays[path] = Replay(path)
+    rasterizer = Rasterizer(scaler)
+    image = replay.meta.get("image") or "database/image.png"
+    frames = []
+    for step in steps:
+        frame = replay.frame(int(step))
+        frames.append(rasterizer.draw(raster_layer(image, frame, scaler), frame).copy())
+    return frames
+
+
+def render_replay(path, output, fps=10, every=1, scaler=RASTER_SCALER, max_workers=None):
+    """
+    Render a replay to a video (`.mp4`, `.avi`) or an animated `.gif`.
+
+    Frames are rasterized chunk by chunk in a process pool and written in
+    order; at most two chunks per worker are in flight. GIFs are encoded
+    at the end, so their frames are kept in memory.
+    """
+    replay = Replay(path)
+    steps = replay.steps()[::every]
+    chunk_of = np.searchsorted(replay.meta["chunks"], steps, side="right")
+    jobs = [(path, steps[chunk_of == k], scaler) for k in np.unique(chunk_of)]
+    height, width = replay.meta["height"] * scaler, replay.meta["width"] * scaler
+    replay.close()
+
+    extension = os.path.splitext(output)[1].lower()
+    if extension == ".gif":
+        animation = cv2.Animation()
+        frames = []
+        write = frames.append
+    else:
+        writer = cv2.VideoWriter(output, cv2.VideoWriter_fourcc(*VIDEO_CODECS.get(extension, "mp4v")),
+                                 fps, (width, height))
+        if not writer.isOpened():
+            raise ValueError(f"Cannot write video {output}")
+        write = writer.write
+
+    max_workers = max_workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=min(max_workers, max(len(jobs), 1))) as executor:
+        pending = []
+        for job in jobs:
+            pending.append(executor.submit(_render_steps, job))
+            if len(pending) >= 2 * max_workers:
+                for frame in pending.pop(0).result():
+                    write(frame)
+        for future in pending:
+            for frame in future.result():
+                write(frame)
+
+    if extension == ".gif":
+        animation.frames = frames
+        animation.durations = [int(1000 / fps)] * len(frames)
+        if not cv2.imwriteanimation(output, animation):
+            raise ValueError(f"Cannot write animation {output}")
+    else:
+        writer.release()
+    return len(steps)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m battlesim.replay", description=__doc__.split("\n")[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+    info = commands.add_parser("info", help="print the index of a replay")
+    info.add_argument("replay")
+    render = commands.add_parser("render", help="render a replay to MP4, AVI or GIF")
+    render.add_argument("replay")
+    render.add_argument("output")
+    render.add_argument("--fps", type=float, default=10)
+    render.add_argument("--every", type=int, default=1, help="render every n-th recorded step")
+    render.add_argument("--scaler", type=int, default=RASTER_SCALER, help="pixels per cell")
+    render.add_argument("--workers", type=int, default=None)
+
+    args = parser.parse_args(argv)
+    if args.command == "info":
+        print(json.dumps(Replay(args.replay).meta, indent=2))
+        return 0
+    n = render_replay(args.replay, args.output, fps=args.fps, every=args.every,
+                      scaler=args.scaler, max_workers=args.workers)
+    print(f"{n} frames written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
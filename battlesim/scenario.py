@@ -0,0 +1,304 @@
+import copy
+import hashlib
+import json
+import os
+from typing import NamedTuple
+
+import numpy as np
+
+from .agents import SoldierAgent, TypeAttributes, build_type_attributes, register_block
+from .assets import AssetCache, file_digest
+from .chunks import CHUNK
+from .enums import AgentType, Fraction, Movement
+
+SCENARIO_DIR = os.path.join(os.path.dirname(__file__), "scenarios")
+CASE_ALIASES = {1: "demo", 2: "test"}  # the numbered cases of add_agents_to_model
+
+SCENARIO_KEYS = ("id", "description", "params", "map", "mines", "attributes", "units")
+UNIT_KEYS = ("fraction", "type", "count", "movement", "route", "pos", "area")
+
+# how the agents of a block are placed
+POINT, AREA, ANYWHERE = 0, 1, 2
+
+SCENARIO_CACHE = AssetCache(max_entries=64)
+
+
+class ScenarioError(ValueError):
+    """Raised when a scenario does not validate."""
+
+
+class CompiledScenario(NamedTuple):
+    """
+    A validated scenario with resolved parameters, ready to place.
+
+    Units are expanded into blocks (one per unit and spawn point) given as
+    arrays, so placing thousands of agents is a single pass.
+    """
+    key: str
+    id: str
+    params: dict
+    width: int
+    height: int
+    heights: str
+    image: str
+    mines_area: tuple
+    mines_per_cell: int
+    attributes: dict
+    blocks: dict
+    routes: list
+    grid: str = "dense"
+    chunk: int = CHUNK
+
+
+### loading ###
+def scenario_ids():
+    """Ids of the built-in scenarios."""
+    return sorted(os.path.splitext(name)[0] for name in os.listdir(SCENARIO_DIR)
+                  if os.path.splitext(name)[1] in (".json", ".yaml", ".yml"))
+
+
+def _read_file(path):
+    with open(path) as file:
+        if os.path.splitext(path)[1] in (".yaml", ".yml"):
+            try:
+                import yaml
+            except ImportError:
+                raise ScenarioError("YAML scenarios need PyYAML (pip install pyyaml)")
+            return yaml.safe_load(file)
+        return json.load(file)
+
+
+def load_scenario(source):
+    """
+    Scenario dict from a built-in id ("small_battle", or 1 and 2 for the
+    old numbered cases), a JSON/YAML file path, JSON text or a dict.
+    """
+    if isinstance(source, dict):
+        return copy.deepcopy(source)
+    source = CASE_ALIASES.get(source, source)
+    if not isinstance(source, str):
+        raise ScenarioError(f"Unknown scenario: {source!r}")
+    if source.lstrip().startswith("{"):
+        try:
+            return json.loads(source)
+        except json.JSONDecodeError as error:
+            raise ScenarioError(f"Invalid scenario JSON: {error}")
+    for extension in (".json", ".yaml", ".yml"):
+        path = os.path.join(SCENARIO_DIR, source + extension)
+        if os.path.exists(path):
+            return _read_file(path)
+    if os.path.exists(source):
+        return _read_file(source)
+    raise ScenarioError(f"Unknown scenario: {source!r}, built-in: {', '.join(scenario_ids())}")
+
+
+### validation ###
+def _check(condition, where, message):
+    if not condition:
+        raise ScenarioError(f"{where}: {message}")
+
+
+def _is_int(value):
+    return isinstance(value, (int, np.integer)) and not isinstance(value, bool)
+
+
+def _point(value, where, width, height):
+    _check(isinstance(value, (list, tuple)) and len(value) == 2 and all(map(_is_int, value)),
+           where, f"expected [x, y], got {value!r}")
+    _check(0 <= value[0] < width and 0 <= value[1] < height,
+           where, f"{list(value)} is outside the {width}x{height} map")
+    return (int(value[0]), int(value[1]))
+
+
+def _rectangle(value, where, width, height):
+    _check(isinstance(value, (list, tuple)) and len(value) == 2,
+           where, f"expected [[x0, y0], [x1, y1]], got {value!r}")
+    (x0, y0), (x1, y1) = [_point(corner, where, width + 1, height + 1) for corner in value]
+    _check(x0 < x1 and y0 < y1, where, "the first corner must be below and left of the second")
+    return (x0, y0, x1, y1)
+
+
+def _enum(enum, value, where):
+    try:
+        return enum.parse(value)
+    except (KeyError, ValueError, TypeError, AttributeError):
+        names = ", ".join(name.lower() for name in enum.__members__)
+        raise ScenarioError(f"{where}: unknown value {value!r}, expected one of {names}")
+
+
+def _count(value, params, where):
+    """An integer, a parameter name, or a parameter name divided by an integer ("n_soldiers/2")."""
+    if _is_int(value):
+        count = int(value)
+    else:
+        _check(isinstance(value, str), where, f"expected an integer or a parameter name, got {value!r}")
+        name, _, divisor = value.partition("/")
+        name, divisor = name.strip(), divisor.strip()
+        _check(name in params, where, f"unknown parameter {name!r}")
+        _check(not divisor or divisor.isdigit() and int(divisor) > 0, where, f"bad divisor in {value!r}")
+        count = int(params[name]) // int(divisor or 1)
+    _check(count >= 0, where, f"negative count {count}")
+    return count
+
+
+def _attributes(value, where):
+    if isinstance(value, str):
+        _check(os.path.exists(value), where, f"attribute file {value!r} not found")
+        value = _read_file(value)
+    _check(isinstance(value, dict), where, "expected a type -> attributes mapping or a file path")
+    for name, attrs in value.items():
+        _enum(AgentType, name, f"{where}.{name}")
+        _check(isinstance(attrs, dict), f"{where}.{name}", "expected a mapping")
+        fields = (set(attrs) | set(attrs.get("special", {}))) - {"special"}
+        unknown = fields - (set(TypeAttributes._fields) - {"is_projectile"})
+        _check(not unknown, f"{where}.{name}", f"unknown attributes {sorted(unknown)}")
+    return build_type_attributes(value)
+
+
+def compile_scenario(spec, params=None):
+    """
+    Validate a scenario dict and compile it with `params` overriding its
+    declared parameters (other keys are ignored). Compiled scenarios are
+    cached by the hash of their content.
+    """
+    _check(isinstance(spec, dict), "scenario", "expected a mapping")
+    declared = spec.get("params", {})
+    _check(isinstance(declared, dict), "params", "expected a mapping")
+    params = {name: (params or {}).get(name, default) for name, default in declared.items()}
+    for name, value in params.items():
+        _check(_is_int(value), f"params.{name}", f"expected an integer, got {value!r}")
+
+    # an attribute table given as a file is keyed by its content
+    files = [file_digest(spec["attributes"])] if isinstance(spec.get("attributes"), str) else []
+    key = hashlib.sha256(json.dumps([spec, params, files], sort_keys=True, default=str).encode()).hexdigest()
+    return SCENARIO_CACHE.get(key, lambda: _compile(spec, params, key))
+
+
+def _compile(spec, params, key):
+    unknown = set(spec) - set(SCENARIO_KEYS)
+    _check(not unknown, "scenario", f"unknown keys {sorted(unknown)}")
+
+    world = spec.get("map", {})
+    _check(isinstance(world, dict), "map", "expected a mapping")
+    width, height = world.get("width", 100), world.get("height", 100)
+    _check(_is_int(width) and _is_int(height) and width > 0 and height > 0,
+           "map", "width and height must be positive integers")
+    grid, chunk = world.get("grid", "dense"), world.get("chunk", CHUNK)
+    _check(grid in ("dense", "sparse"), "map.grid", f"expected dense or sparse, got {grid!r}")
+    _check(_is_int(chunk) and chunk > 0, "map.chunk", "expected a positive integer")
+
+    mines = spec.get("mines", {})
+    _check(isinstance(mines, dict), "mines", "expected a mapping")
+    mines_area = _rectangle(mines.get("area", [[0, 0], [width, height]]), "mines.area", width, height)
+    mines_per_cell = _count(mines.get("per_cell", 0), params, "mines.per_cell")
+
+    attributes = None
+    if spec.get("attributes") is not None:
+        attributes = _attributes(spec["attributes"], "attributes")
+
+    units = spec.get("units")
+    _check(isinstance(units, list) and units, "units", "expected a non-empty list")
+    columns = {name: [] for name in ("fraction", "type", "movement", "route", "count", "spawn", "area")}
+    routes, route_ids = [], {}
+    for i, unit in enumerate(units):
+        where = f"units[{i}]"
+        _check(isinstance(unit, dict), where, "expected a mapping")
+        unknown = set(unit) - set(UNIT_KEYS)
+        _check(not unknown, where, f"unknown keys {sorted(unknown)}")
+        _check("pos" not in unit or "area" not in unit, where, "give either pos or area")
+
+        fraction = _enum(Fraction, unit.get("fraction"), f"{where}.fraction")
+        kind = _enum(AgentType, unit.get("type"), f"{where}.type")
+        movement = _enum(Movement, unit.get("movement", "stay"), f"{where}.movement")
+        count = _count(unit.get("count", 1), params, f"{where}.count")
+
+        route = tuple(_point(point, f"{where}.route", width, height) for point in unit.get("route") or ())
+        _check(route or movement not in (Movement.ROUTE, Movement.PATH),
+               f"{where}.route", f"{movement} movement needs a route")
+        _check(grid == "dense" or movement is not Movement.PATH,
+               f"{where}.movement", "path movement needs a dense map, use route on sparse maps")
+        route_id = route_ids.setdefault(route, len(routes))
+        if route_id == len(routes):
+            routes.append(list(route))
+
+        # one block per spawn point, `count` agents each
+        if "area" in unit:
+            spawns = [(AREA, _rectangle(unit["area"], f"{where}.area", width, height))]
+        elif "pos" in unit:
+            pos = unit["pos"]
+            points = pos if pos and isinstance(pos[0], (list, tuple)) else [pos]
+            spawns = [(POINT, _point(point, f"{where}.pos", width, height) * 2) for point in points]
+        else:
+            spawns = [(ANYWHERE, (0, 0, width, height))]
+        for spawn, area in spawns:
+            for name, value in (("fraction", fraction), ("type", kind), ("movement", movement),
+                                ("route", route_id), ("count", count), ("spawn", spawn), ("area", area)):
+                columns[name].append(value)
+
+    blocks = {name: np.array(values, dtype=np.int64) for name, values in columns.items()}
+    blocks["area"] = blocks["area"].reshape(-1, 4)
+    return CompiledScenario(key=key,
+                            id=str(spec.get("id", key[:12])),
+                            params=params,
+                            width=width,
+                            height=height,
+                            heights=world.get("heights"),
+                            image=world.get("image"),
+                            mines_area=mines_area,
+                            mines_per_cell=mines_per_cell,
+                            attributes=attributes,
+                            blocks=blocks,
+                            routes=routes,
+                            grid=grid,
+                            chunk=chunk)
+
+
+### placement ###
+def spawn_positions(model, compiled):
+    """Cells of every agent, drawing random spawns from `model.random`."""
+    blocks = compiled.blocks
+    counts = blocks["count"]
+    spawn = np.repeat(blocks["spawn"], counts)
+    area = np.repeat(blocks["area"], counts, axis=0)
+    x, y = area[:, 0].copy(), area[:, 1].copy()
+    for i in np.flatnonzero(spawn != POINT):
+        x0, y0, x1, y1 = area[i].tolist()
+        x[i] = model.random.randrange(x0, x1)
+        y[i] = model.random.randrange(y0, y1)
+    return x, y
+
+
+def place_scenario(model, compiled):
+    """
+    Place every unit of a compiled scenario, one block at a time.
+
+    The agents of a block share one params dict and are registered with
+    the schedule, the grid and the stats in one call; a vector engine that
+    has no agents yet gets its arrays from the blocks instead of reading
+    them back from the agents.
+    """
+    if compiled.attributes is not None:
+        model.type_attributes = compiled.attributes
+    blocks = compiled.blocks
+    x, y = spawn_positions(model, compiled)
+    positions = list(zip(x.tolist(), y.tolist()))
+
+    engine = model.engine
+    fresh = engine is not None and not engine.compiled and not model.schedule.get_agent_count()
+
+    first, unique_id = 0, model.max_id + 1
+    for fraction, kind, movement, route, count in zip(blocks["fraction"].tolist(), blocks["type"].tolist(),
+                                                      blocks["movement"].tolist(), blocks["route"].tolist(),
+                                                      blocks["count"].tolist()):
+        params = {"fraction": Fraction(fraction),
+                  "type": AgentType(kind),
+                  "movement": Movement(movement),
+                  "route": compiled.routes[route]}
+        agents = [SoldierAgent(i, params, model) for i in range(unique_id, unique_id + count)]
+        register_block(model, agents, positions[first:first + count])
+        first += count
+        unique_id += count
+    model.max_id += first
+    if fresh:
+        engine.compile(engine.block_columns(blocks, compiled.routes, x, y))
+    return first
@@ -0,0 +1,186 @@
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .agents import SoldierAgent, place_agents
+from .enums import DEAD
+from .chunks import CHUNK, ChunkedLayer, as_layer
+from .mines import ChunkedMineField, MineField
+from .model import BattleModel
+from .spatial import SparseGrid
+from .pathing import FlowFields
+from .utils import final_stats, run_battle
+
+AGENT_REFERENCES = ("model", "pos", "last_aim", "last_heal")
+
+
+def _agent_state(agent):
+    state = {key: getattr(agent, key) for key in SoldierAgent.__slots__ if key not in AGENT_REFERENCES}
+    state["pos"] = agent.pos
+    state["last_aim"] = agent.last_aim.unique_id if agent.last_aim is not None else None
+    state["last_heal"] = agent.last_heal.unique_id if agent.last_heal is not None else None
+    return state
+
+
+def _restore_agent(state, model):
+    agent = SoldierAgent.__new__(SoldierAgent)
+    for key, value in state.items():
+        setattr(agent, key, value)
+    agent.model = model
+    return agent
+
+
+def snapshot_model(model):
+    """
+    Serialize the full state of a BattleModel to bytes.
+
+    Covers agents (in schedule order, plus the dead ones the stats keep
+    for their history), grid buckets, the mine grid, the
+    stats, the step counter and the states of `model.random`, `model.rng`
+    (with its pre-drawn combat uniforms) and the vector engine generator,
+    so a restored model continues exactly like the original.
+    """
+    model.sync_agents()
+    agents = list(model.schedule.agents)
+    state = {
+        "width": model.grid.width,
+        "height": model.grid.height,
+        "height_map": as_layer(model.height_map),
+        "grid": "sparse" if isinstance(model.grid, SparseGrid) else "dense",
+        "chunk": getattr(model.grid, "chunk", CHUNK),
+        "mines": model.mine_map.grid.copy(),
+        "known_mines": model.paths.mines if model.paths is not None else None,
+        "max_id": model.max_id,
+        "type_attributes": model.type_attributes,
+        "steps": model.schedule.steps,
+        "time": model.schedule.time,
+        "moves": model.grid.moves,
+        "agents": [_agent_state(agent) for agent in agents],
+        "buried": [_agent_state(agent) for agent in model.stats.agents.values() if agent.status is DEAD],
+        # cell contents in their current order, which targeting depends on
+        "buckets": {fraction: {pos: [agent.unique_id for agent in cell] for pos, cell in cells.items()}
+                    for fraction, cells in model.grid.buckets.items()},
+        "stats": {key: value for key, value in model.stats.__dict__.items() if key != "agents"},
+        "stats_agents": list(model.stats.agents),
+        "collector": "stream" if model.datacollector is model.stats else "mesa",
+        "random": model.random.getstate(),
+        "rng": model.rng,
+        "engine": None,
+    }
+
+    engine = model.engine
+    if engine is not None:
+        arrays = {key: value for key, value in engine.__dict__.items()
+                  if isinstance(value, np.ndarray) and key not in ("height_map", "mines")}
+        state["engine"] = {"name": engine.name,
+                           "compiled": engine.compiled,
+                           "rng": engine.rng.bit_generator.state,
+                           "arrays": arrays if engine.compiled else {},
+                           "n": getattr(engine, "n", 0),
+                           "calibers": getattr(engine, "calibers", {}),
+                           "pending": [agent.unique_id for agent in getattr(engine, "pending", [])],
+                           "rows": [agent.unique_id if agent is not None else None
+                                    for agent in getattr(engine, "agents", [])]}
+    return pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def restore_model(data):
+    """Rebuild a fresh BattleModel from `snapshot_model` bytes."""
+    state = pickle.loads(data)
+    engine_state = state["engine"]
+    model = BattleModel(width=state["width"],
+                        height=state["height"],
+                        height_map=state["height_map"],
+                        mine_map=(ChunkedMineField if isinstance(state["mines"], ChunkedLayer)
+                                  else MineField)(state["mines"].copy()),
+                        engine="mesa" if engine_state is None else engine_state.get("name", "vector"),
+                        collector=state["collector"],
+                        type_attributes=state["type_attributes"],
+                        grid=state.get("grid", "dense"),
+                        chunk=state.get("chunk", CHUNK))
+    model.max_id = state["max_id"]
+    known_mines = state.get("known_mines", state["mines"])
+    if known_mines is not None:
+        model.paths = FlowFields(model.height_map, known_mines)
+    model.schedule.steps = state["steps"]
+    model.schedule.time = state["time"]
+
+    # agents, without re-running __init__
+    by_id = {}
+    for agent_state in state["buried"]:
+        agent = _restore_agent(agent_state, model)
+        by_id[agent.unique_id] = agent
+    for agent_state in state["agents"]:
+        agent = _restore_agent(agent_state, model)
+        agent.pos = None
+        by_id[agent.unique_id] = agent
+        model.schedule.add(agent)
+        model.grid.place_agent(agent, agent_state["pos"])
+    for agent in by_id.values():
+        agent.last_aim = by_id.get(agent.last_aim)
+        agent.last_heal = by_id.get(agent.last_heal)
+
+    model.grid.buckets.clear()
+    for fraction, cells in state["buckets"].items():
+        model.grid.buckets[fraction] = {pos: [by_id[i] for i in ids] for pos, ids in cells.items()}
+    model.grid.moves = state["moves"]
+
+    model.stats.__dict__.update(state["stats"])
+    model.stats.agents = {i: by_id[i] for i in state["stats_agents"]}
+
+    model.random.setstate(state["random"])
+    model.rng = state["rng"]
+    model.seed = model.rng.seed
+
+    if engine_state is not None:
+        engine = model.engine
+        engine.rng.bit_generator.state = engine_state["rng"]
+        if engine_state["compiled"]:
+            engine.__dict__.update(engine_state["arrays"])
+            engine.n = engine_state["n"]
+            engine.calibers = engine_state["calibers"]
+            engine.agents = [by_id.get(i) if i is not None else None for i in engine_state["rows"]]
+            engine.width, engine.height = model.grid.width, model.grid.height
+            engine.height_map = as_layer(model.height_map)
+            engine.mines = model.mine_map.grid
+            engine.pending = [by_id[i] for i in engine_state["pending"]]
+            engine.compiled = True
+    return model
+
+
+def run_branch(data, max_steps=150, seed=None, add=(), **run_kwargs):
+    """
+    Restore a snapshot, optionally reseed and add agents, run the rest.
+
+    Args:
+        data: Bytes from `snapshot_model`.
+        max_steps: Total step budget, including the steps in the snapshot.
+        seed: Optional. Reseeds every random source so branches diverge.
+        add: Agents to add, as dicts with `params`, `n` and optional `pos`
+            as in `place_agents`.
+    """
+    model = restore_model(data)
+    if seed is not None:
+        model.reseed(seed)
+    for group in add:
+        place_agents(model=model, n_soldiers=group["n"], params=group["params"], pos=group.get("pos"))
+
+    run = run_battle(model, max_steps=max(max_steps - model.schedule.steps, 0), **run_kwargs)
+    stats = final_stats(model)
+    stats["Steps"] = model.schedule.steps
+    stats["Stop reason"] = run["reason"]
+    return stats
+
+
+def _run_branch_job(job):
+    data, branch = job
+    return run_branch(data, **branch)
+
+
+def run_branches(data, branches, max_workers=None):
+    """Run many branches of one snapshot in a process pool, in order."""
+    max_workers = max_workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=min(max_workers, max(len(branches), 1))) as executor:
+        return list(executor.map(_run_branch_job, [(data, branch) for branch in branches]))
@@ -0,0 +1,197 @@
+from collections import defaultdict
+from functools import lru_cache
+from mesa import space
+
+from .chunks import CHUNK
+from .enums import Fraction, DEAD
+
+
+class IndexedGrid(space.MultiGrid):
+    """MultiGrid with a spatial index of live, non-projectile agents.
+
+    Agents are bucketed per fraction by occupied cell. The buckets are
+    updated incrementally on place/move/remove and when an agent dies, so
+    range queries only visit occupied cells instead of every cell of the
+    neighbourhood.
+    """
+
+    def __init__(self, width, height, torus):
+        super().__init__(width, height, torus)
+        self.buckets = defaultdict(dict)  # fraction -> {pos: [agents]}
+        self.moves = 0  # running count of agent moves, used to detect stalemates
+
+    ### index maintenance ###
+    def index_agent(self, agent):
+        if agent.status is DEAD or agent.is_projectile:
+            return
+        self.buckets[agent.fraction].setdefault(agent.pos, []).append(agent)
+
+    def unindex_agent(self, agent):
+        cells = self.buckets[agent.fraction]
+        cell = cells.get(agent.pos)
+        if cell is None or agent not in cell:
+            return
+        cell.remove(agent)
+        if not cell:
+            del cells[agent.pos]
+
+    def place_agent(self, agent, pos):
+        super().place_agent(agent, pos)
+        self.index_agent(agent)
+
+    def place_agents(self, agents, positions):
+        """`place_agent` for new agents, one cell extension per occupied cell."""
+        cells = {}
+        for agent, pos in zip(agents, positions):
+            cells.setdefault(pos, []).append(agent)
+        for pos, new in cells.items():
+            super().place_agent(new[0], pos)
+            self[pos].extend(new[1:])
+            for agent in new:
+                agent.pos = pos
+                self.index_agent(agent)
+
+    def remove_agent(self, agent):
+        self.unindex_agent(agent)
+        super().remove_agent(agent)
+
+    def move_agent(self, agent, pos):
+        super().move_agent(agent, pos)
+        self.moves += 1
+
+    ### queries ###
+    def cells_in_range(self, pos, radius, fractions):
+        """Occupied cells of `fractions` within Chebyshev `radius` of `pos`.
+
+        Returns (cell, agents) pairs in the same x-major order as
+        `get_neighborhood`. Small radii look cells up directly, large ones
+        scan only the occupied cells, so a mortar with radius 99 costs
+        O(live enemies) instead of O(map area).
+        """
+        x, y = pos
+        found = {}
+        for fraction in fractions:
+            cells = self.buckets[Fraction.parse(fraction)]
+            if (2 * radius + 1) ** 2 < len(cells):
+                candidates = (cell for cell in self.get_neighborhood(
+                    pos, moore=True, include_center=True, radius=radius) if cell in cells)
+            else:
+                candidates = (cell for cell in cells
+                              if abs(cell[0] - x) <= radius and abs(cell[1] - y) <= radius)
+            for cell in candidates:
+                found.setdefault(cell, []).extend(cells[cell])
+        return sorted(found.items())
+
+    def any_in_range(self, pos, radius, fractions):
+        """Whether an occupied cell of `fractions` lies within Chebyshev `radius` of `pos`."""
+        x, y = pos
+        return any(abs(cell[0] - x) <= radius and abs(cell[1] - y) <= radius
+                   for fraction in fractions for cell in self.buckets[Fraction.parse(fraction)])
+
+    def scan_size(self, radius, fractions):
+        """Number of cells `cells_in_range` looks at for `radius` and `fractions`."""
+        return sum(min((2 * radius + 1) ** 2, len(self.buckets[Fraction.parse(fraction)]))
+                   for fraction in fractions)
+
+    def enemies(self, fraction):
+        fraction = Fraction.parse(fraction)
+        return [other for other in self.buckets if other is not fraction]
+
+
+class ChunkedMultiGrid(space.MultiGrid):
+    """MultiGrid that only materializes occupied chunks.
+
+    Cell contents live in {chunk: {cell: [agents]}} dicts; empty cells and
+    chunks are dropped, so memory follows the occupied area instead of
+    the map area. Iterating the grid visits occupied cells only.
+    """
+
+    def __init__(self, width, height, torus, chunk=CHUNK):
+        self.width = width
+        self.height = height
+        self.torus = torus
+        self.num_cells = width * height
+        self.chunk = chunk
+        self.chunks = {}
+        self._empties_built = False
+
+    def _key(self, pos):
+        return (pos[0] // self.chunk, pos[1] // self.chunk)
+
+    def place_agent(self, agent, pos):
+        cells = self.chunks.setdefault(self._key(pos), {})
+        cell = cells.setdefault(pos, [])
+        if agent.pos is None or agent not in cell:
+            cell.append(agent)
+            agent.pos = pos
+
+    def remove_agent(self, agent):
+        pos = agent.pos
+        key = self._key(pos)
+        cells = self.chunks[key]
+        cells[pos].remove(agent)
+        if not cells[pos]:
+            del cells[pos]
+            if not cells:
+                del self.chunks[key]
+        agent.pos = None
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def _offsets(moore, include_center, radius):
+        return tuple((dx, dy) for dx in range(-radius, radius + 1) for dy in range(-radius, radius + 1)
+                     if (moore or abs(dx) + abs(dy) <= radius) and (include_center or (dx, dy) != (0, 0)))
+
+    def get_neighborhood(self, pos, moore, include_center=False, radius=1):
+        # same cells and order as MultiGrid, without its cache of every cell's neighbourhood
+        if self.out_of_bounds(pos):
+            raise Exception("The `pos` tuple passed is out of bounds.")
+        x, y = pos
+        offsets = self._offsets(moore, include_center, radius)
+        if radius <= x < self.width - radius and radius <= y < self.height - radius:
+            return tuple([(x + dx, y + dy) for dx, dy in offsets])
+        neighborhood = {}
+        for dx, dy in offsets:
+            new_x, new_y = x + dx, y + dy
+            if self.torus:
+                new_x, new_y = new_x % self.width, new_y % self.height
+            if 0 <= new_x < self.width and 0 <= new_y < self.height:
+                neighborhood[(new_x, new_y)] = True
+        if not include_center:
+            neighborhood.pop(pos, None)
+        return tuple(neighborhood)
+
+    def _cell(self, pos):
+        return self.chunks.get(self._key(pos), {}).get(pos, [])
+
+    def iter_cell_list_contents(self, cell_list):
+        if isinstance(cell_list, tuple) and len(cell_list) == 2 and isinstance(cell_list[0], int):
+            cell_list = [cell_list]
+        for pos in cell_list:
+            yield from self._cell(pos)
+
+    def get_cell_list_contents(self, cell_list):
+        return list(self.iter_cell_list_contents(cell_list))
+
+    def is_cell_empty(self, pos):
+        return not self._cell(pos)
+
+    def __getitem__(self, pos):
+        return self._cell(pos)
+
+    def coord_iter(self):
+        for cells in self.chunks.values():
+            for pos, cell in cells.items():
+                yield cell, pos
+
+    def __iter__(self):
+        for cells in self.chunks.values():
+            yield from cells.values()
+
+
+class SparseGrid(IndexedGrid, ChunkedMultiGrid):
+    """IndexedGrid over chunked storage, for maps far larger than their armies."""
+
+    def __init__(self, width, height, torus, chunk=CHUNK):
+        super().__init__(width, height, torus)
+        self.chunk = chunk
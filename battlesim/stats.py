@@ -0,0 +1,166 @@
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+from .enums import Fraction, Status, ALLY, ENEMY, DEAD
+
+MODEL_VARS = ("alive allies", "alive enemies", "allies total health", "enemies total health")
+GRAVEYARD_VARS = ("Step", "AgentID", "Fraction", "Type", "Damaged", "Healed")
+STATUSES = tuple(str(status) for status in Status)
+
+
+class BattleStats():
+    """
+    Streaming replacement for the Mesa DataCollector.
+
+    Keeps running per-fraction counters (keyed by `Fraction`) of live non-projectile agents
+    (number alive, total health) that the agents update on spawn, damage,
+    healing and death, so reading them is O(1). `collect` appends the
+    counters to preallocated per-step arrays; per-agent history is
+    optional and also goes to preallocated arrays. Agents removed from
+    the model when they die leave one row in the graveyard, and are only
+    kept after that when their history is recorded, so memory follows the
+    live agents.
+    """
+
+    def __init__(self, agent_history=False, capacity=256):
+        self.alive = defaultdict(int)
+        self.health = defaultdict(float)
+        self.agent_history = agent_history
+
+        self.steps = 0
+        self.model_vars = np.zeros((capacity, len(MODEL_VARS)))
+
+        # tracked agents by id, in the order of their history columns (step x agent)
+        self.agents = {}
+        self.agent_vars = {name: np.zeros((capacity if agent_history else 0, 0))
+                           for name in ("Status", "Health", "Damaged", "Healed")}
+
+        # (step, id, fraction, type, damaged, healed) of every dead non-projectile agent
+        self.graveyard = []
+
+    ### counters ###
+    @staticmethod
+    def _tracked(agent):
+        return not agent.is_projectile
+
+    def add_agent(self, agent):
+        if not self._tracked(agent):
+            return
+        self.agents[agent.unique_id] = agent
+        if agent.status is not DEAD:
+            self.alive[agent.fraction] += 1
+            self.health[agent.fraction] += agent.health
+
+    def add_agents(self, agents):
+        """`add_agent` for many agents, counted once per fraction."""
+        health = defaultdict(list)
+        for agent in agents:
+            if self._tracked(agent):
+                self.agents[agent.unique_id] = agent
+                if agent.status is not DEAD:
+                    health[agent.fraction].append(agent.health)
+        for fraction, values in health.items():
+            self.alive[fraction] += len(values)
+            self.health[fraction] += sum(values)
+
+    def change_health(self, agent, delta):
+        if self._tracked(agent) and agent.status is not DEAD:
+            self.health[agent.fraction] += delta
+
+    def remove_agent(self, agent):
+        """Called when an agent dies, before its health is zeroed."""
+        if self._tracked(agent) and agent.status is not DEAD:
+            self.alive[agent.fraction] -= 1
+            self.health[agent.fraction] -= agent.health
+
+    def bury(self, agent, step):
+        """Record the final stats of a dead agent leaving the model."""
+        if self._tracked(agent):
+            self.graveyard.append((step, agent.unique_id, agent.fraction, agent.type,
+                                   agent.damaged, agent.healed))
+            if not self.agent_history:
+                self.agents.pop(agent.unique_id, None)
+
+    def set_totals(self, alive, health):
+        """Overwrite the counters, for engines that recompute them in bulk."""
+        self.alive.update({Fraction.parse(key): value for key, value in alive.items()})
+        self.health.update({Fraction.parse(key): value for key, value in health.items()})
+
+    def alive_count(self, fraction):
+        return self.alive[Fraction.parse(fraction)]
+
+    def total_health(self, fraction):
+        # rounding hides float drift of the running sum
+        return round(self.health[Fraction.parse(fraction)], 9)
+
+    ### history ###
+    def _grow(self):
+        self.model_vars = np.concatenate([self.model_vars, np.zeros_like(self.model_vars)])
+        if self.agent_history:
+            for name, values in self.agent_vars.items():
+                self.agent_vars[name] = np.concatenate([values, np.zeros_like(values)])
+
+    def collect(self, model):
+        if self.steps == len(self.model_vars):
+            self._grow()
+        self.model_vars[self.steps] = (self.alive_count(ALLY),
+                                       self.alive_count(ENEMY),
+                                       self.total_health(ALLY),
+                                       self.total_health(ENEMY))
+        if self.agent_history:
+            self._collect_agents()
+        self.steps += 1
+
+    def _collect_agents(self):
+        n = len(self.agents)
+        width = self.agent_vars["Health"].shape[1]
+        if n > width:
+            extra = max(n - width, width)
+            for name, values in self.agent_vars.items():
+                self.agent_vars[name] = np.pad(values, ((0, 0), (0, extra)))
+
+        step = self.steps
+        for column, agent in enumerate(self.agents.values()):
+            self.agent_vars["Status"][step, column] = agent.status
+            self.agent_vars["Health"][step, column] = agent.health
+            self.agent_vars["Damaged"][step, column] = agent.damaged
+            self.agent_vars["Healed"][step, column] = agent.healed
+
+    ### DataCollector compatible output ###
+    def get_model_vars_dataframe(self):
+        return pd.DataFrame(self.model_vars[:self.steps], columns=list(MODEL_VARS))
+
+    def get_agent_vars_dataframe(self):
+        """Agent history, or only the current state of the live agents when history is off."""
+        agents = list(self.agents.values())
+        n = len(agents)
+        if self.agent_history and self.steps:
+            steps = np.repeat(np.arange(self.steps), n)
+            values = {name: self.agent_vars[name][:self.steps, :n].ravel()
+                      for name in self.agent_vars}
+        else:
+            steps = np.full(n, self.steps)
+            values = {"Status": [int(a.status) for a in agents],
+                      "Health": [a.health for a in agents],
+                      "Damaged": [a.damaged for a in agents],
+                      "Healed": [a.healed for a in agents]}
+        ids = [a.unique_id for a in agents]
+        fractions = [str(a.fraction) for a in agents]
+        index = pd.MultiIndex.from_arrays([steps, np.tile(ids, len(steps) // max(n, 1))],
+                                          names=["Step", "AgentID"])
+        data = pd.DataFrame({"Fraction": np.tile(fractions, len(steps) // max(n, 1)),
+                             "Status": np.asarray(STATUSES, dtype=object)[np.asarray(values["Status"], dtype=int)],
+                             "Health": values["Health"],
+                             "Damaged": values["Damaged"],
+                             "Healed": values["Healed"]},
+                            index=index)
+        return data
+
+    def get_graveyard_dataframe(self):
+        """One row per dead agent: the step it was removed at and its final stats."""
+        data = pd.DataFrame(self.graveyard, columns=list(GRAVEYARD_VARS))
+        data["Fraction"] = data["Fraction"].map(str)
+        data["Type"] = data["Type"].map(str)
+        return data
@@ -0,0 +1,149 @@
+import base64
+import json
+import logging
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from .enums import Fraction
+from .raster import agent_arrays
+from .utils import run_battle
+
+logger = logging.getLogger(__name__)
+
+FRACTIONS = tuple(str(fraction) for fraction in Fraction)
+TYPES = ("infantry", "medic", "mortar", "projectile")
+
+
+def _pack(values, dtype):
+    """Little-endian binary array as base64 text."""
+    return base64.b64encode(np.asarray(values, dtype=dtype).tobytes()).decode("ascii")
+
+
+def unpack(text, dtype):
+    return np.frombuffer(base64.b64decode(text), dtype=dtype)
+
+
+def encode_frame(model, step, agents=False):
+    """
+    Compact per-step frame: alive counts and health totals per fraction,
+    optionally every agent packed as base64 little-endian arrays
+    (uint16 x/y, float32 health, uint8 fraction/type codes).
+    """
+    stats = model.stats
+    frame = {"step": step,
+             "alive": {fraction: stats.alive_count(fraction) for fraction in FRACTIONS},
+             "health": {fraction: stats.total_health(fraction) for fraction in FRACTIONS}}
+    if agents:
+        live = agent_arrays(model)
+        frame["agents"] = pack_agents(live["x"], live["y"], live["health"], live["fraction"], live["kind"])
+    return frame
+
+
+def pack_agents(x, y, health, fraction, kind):
+    """Agent columns in the packed form of `encode_frame`."""
+    return {"n": len(x),
+            "x": _pack(x, "<u2"),
+            "y": _pack(y, "<u2"),
+            "health": _pack(health, "<f4"),
+            "fraction": _pack(fraction, "u1"),
+            "type": _pack(kind, "u1")}
+
+
+def decode_agents(frame):
+    """Inverse of the agent packing in `encode_frame`."""
+    packed = frame["agents"]
+    return {"x": unpack(packed["x"], "<u2"),
+            "y": unpack(packed["y"], "<u2"),
+            "health": unpack(packed["health"], "<f4"),
+            "fraction": unpack(packed["fraction"], "u1"),
+            "type": unpack(packed["type"], "u1")}
+
+
+class BattleBroadcast():
+    """
+    Runs one battle in a background thread and publishes throttled frames.
+
+    The simulation never waits for viewers: at most `fps` frames per second
+    are published (plus the final one) and every viewer always gets the
+    latest frame, skipping any it was too slow to read. If the battle
+    fails, the final frame carries the `error` instead of the `result`.
+    """
+
+    def __init__(self, model, fps=10, agents=True, **run_kwargs):
+        self.id = uuid.uuid4().hex
+        self.model = model
+        self.interval = 1 / fps if fps > 0 else 0
+        self.agents = agents
+        self.run_kwargs = run_kwargs
+
+        self.frame = None
+        self.version = 0
+        self.finished = False
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.condition = threading.Condition()
+        self.last_publish = 0.0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def _publish(self, step, final=False):
+        if self.error is not None:
+            frame = {"step": step, "error": self.error}
+        else:
+            frame = encode_frame(self.model, step, agents=self.agents)
+            if final:
+                frame["result"] = self.result
+        with self.condition:
+            self.frame = frame
+            self.version += 1
+            self.finished = final
+            if final:
+                self.finished_at = time.time()
+            self.condition.notify_all()
+
+    def _on_step(self, i):
+        now = time.perf_counter()
+        if now - self.last_publish >= self.interval:
+            self.last_publish = now
+            self._publish(i + 1)
+
+    def _run(self):
+        try:
+            self.result = run_battle(self.model, on_step=self._on_step, **self.run_kwargs)
+        except Exception as error:
+            logger.exception("Battle %s failed", self.id)
+            self.error = f"{type(error).__name__}: {error}"
+        finally:
+            self.model.close()
+        self._publish(self.model.schedule.steps, final=True)
+
+    def frames(self, timeout=30):
+        """Yield the latest frame each time a new one is published."""
+        seen = 0
+        while True:
+            with self.condition:
+                if self.version == seen and not self.finished:
+                    self.condition.wait(timeout)
+                if self.version == seen:
+                    if self.finished:
+                        return
+                    continue
+                seen = self.version
+                frame, finished = self.frame, self.finished
+            yield frame
+            if finished:
+                return
+
+    def sse(self):
+        """Frames as a Server-Sent Events stream, a failure as an `error` event."""
+        yield f"event: battle\ndata: {json.dumps({'id': self.id})}\n\n"
+        for frame in self.frames():
+            event = "event: error\n" if "error" in frame else ""
+            yield f"{event}data: {json.dumps(frame)}\n\n"
@@ -0,0 +1,351 @@
+"""
+Adaptive parameter sweeps: the smallest force that wins with a given probability.
+
+    python -m battlesim.sweep run spec.json --checkpoint sweep.json [--workers N]
+    python -m battlesim.sweep show sweep.json
+
+A spec names a scenario, the values to try for its parameters and a target
+win probability, e.g. the minimum `n_soldiers` for every `n_medics` that
+wins `small_battle` with 90% probability given `n_mines`=3:
+
+    {"scenario": "small_battle", "search": "n_soldiers",
+     "params": {"n_soldiers": [10, 15, ..., 100], "n_medics": [0, 1, 2]},
+     "fixed": {"n_mines": 3}, "target": 0.9}
+
+The `search` parameter (by default the first one) is searched, assuming
+more of it never hurts; every combination of the others is a separate
+slice. Each slice first tries every `coarse_step`-th value, then only the
+values between neighbours whose outcomes differ. Every configuration starts
+with `initial_replications` battles and doubles them while the confidence
+interval of its win rate still contains the target, up to
+`max_replications`, so replications go to the configurations near the
+decision boundary. Intervals are Wilson score intervals, recomputed after
+every round without correction for the repeated looks. Every battle has its
+own seed derived from the sweep seed, the configuration and the
+replication, so a sweep gives the same answer however many workers run it
+and however often it is interrupted; results are checkpointed to a JSON
+file as they arrive and `run` continues from it.
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from math import sqrt
+from statistics import NormalDist
+
+import numpy as np
+
+from .batch import run_replication
+from .scenario import compile_scenario, load_scenario
+
+SWEEP_VERSION = 1
+SWEEP_PARAMS = ("n_soldiers", "n_medics", "n_mines", "n_mortars")
+OBJECTIVES = {"allies_win": lambda stats: stats["Number of enemies alive"] == 0 and stats["Number of allies alive"] > 0,
+              "enemies_win": lambda stats: stats["Number of allies alive"] == 0 and stats["Number of enemies alive"] > 0}
+DEFAULTS = {"scenario": "small_battle", "search": None, "fixed": {}, "objective": "allies_win", "target": 0.9, "confidence": 0.95,
+            "initial_replications": 8, "max_replications": 128, "coarse_step": 4,
+            "seed": 0, "engine": "vector", "max_steps": 150}
+CHECKPOINT_SECONDS = 2.0  # at most one checkpoint write per interval while battles finish
+
+
+class SweepError(ValueError):
+    """Raised when a sweep spec or checkpoint is invalid."""
+
+
+def _check(condition, where, message):
+    if not condition:
+        raise SweepError(f"{where}: {message}")
+
+
+def _is_int(value):
+    return isinstance(value, (int, np.integer)) and not isinstance(value, bool)
+
+
+def validate_spec(spec):
+    """Spec with defaults filled in; raises SweepError (or ScenarioError for the scenario)."""
+    _check(isinstance(spec, dict), "sweep", "expected a mapping")
+    unknown = set(spec) - set(DEFAULTS) - {"params"}
+    _check(not unknown, "sweep", f"unknown keys {sorted(unknown)}")
+    spec = {**DEFAULTS, **spec}
+
+    params = spec.get("params")
+    _check(isinstance(params, dict) and params, "params", "expected a non-empty name -> values mapping")
+    for name, values in params.items():
+        _check(name in SWEEP_PARAMS, f"params.{name}", f"unknown parameter, expected one of {', '.join(SWEEP_PARAMS)}")
+        _check(isinstance(values, list) and values and all(_is_int(v) and v >= 0 for v in values),
+               f"params.{name}", "expected a non-empty list of non-negative integers")
+    # the searched parameter first: JSON objects may not keep their order
+    search = spec["search"] if spec["search"] is not None else next(iter(params))
+    _check(search in params, "search", "expected one of the swept parameters")
+    spec["search"] = search
+    spec["params"] = {name: sorted(set(int(v) for v in params[name]))
+                      for name in [search] + [name for name in params if name != search]}
+    _check(isinstance(spec["fixed"], dict), "fixed", "expected a mapping")
+    for name, value in spec["fixed"].items():
+        _check(name in SWEEP_PARAMS and name not in params, f"fixed.{name}", "unknown or swept parameter")
+        _check(_is_int(value) and value >= 0, f"fixed.{name}", "expected a non-negative integer")
+
+    _check(spec["objective"] in OBJECTIVES, "objective", f"expected one of {', '.join(OBJECTIVES)}")
+    for name in ("target", "confidence"):
+        _check(isinstance(spec[name], (int, float)) and 0 < spec[name] < 1, name, "expected a number in (0, 1)")
+    for name in ("initial_replications", "max_replications", "coarse_step", "max_steps"):
+        _check(_is_int(spec[name]) and spec[name] > 0, name, "expected a positive integer")
+    _check(spec["initial_replications"] <= spec["max_replications"],
+           "initial_replications", "more than max_replications")
+    _check(_is_int(spec["seed"]), "seed", "expected an integer")
+    _check(spec["engine"] in ("mesa", "vector"), "engine", "expected mesa or vector")
+
+    # the scenario must accept the parameters
+    scenario = load_scenario(spec["scenario"])
+    compile_scenario(scenario, dict(spec["fixed"], **{name: values[0] for name, values in spec["params"].items()}))
+    return spec
+
+
+def spec_key(spec):
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+
+
+def wilson_interval(wins, runs, confidence):
+    """Wilson score interval of a win rate."""
+    if runs == 0:
+        return (0.0, 1.0)
+    z = NormalDist().inv_cdf(1 - (1 - confidence) / 2)
+    p = wins / runs
+    denominator = 1 + z * z / runs
+    centre = (p + z * z / (2 * runs)) / denominator
+    half = z * sqrt(p * (1 - p) / runs + z * z / (4 * runs * runs)) / denominator
+    return (max(0.0, centre - half), min(1.0, centre + half))
+
+
+def replication_seed(seed, config_index, replication):
+    """Seed of one battle, independent of the order battles are run in."""
+    return int(np.random.SeedSequence([seed, config_index, replication]).generate_state(1)[0])
+
+
+def _replicate(job):
+    key, replication, objective, kwargs = job
+    return key, replication, bool(OBJECTIVES[objective](run_replication(**kwargs)))
+
+
+class Sweep():
+    """
+    One adaptive sweep, resumable from its checkpoint file.
+
+    `outcomes` maps every configuration key to {replication: won}; the
+    rounds, decisions and answer are all derived from it, so loading the
+    checkpoint is all a resumed sweep needs.
+    """
+
+    def __init__(self, spec, checkpoint=None):
+        self.spec = validate_spec(spec)
+        self.key = spec_key(self.spec)
+        self.checkpoint = checkpoint
+        self.axis, *self.others = list(self.spec["params"])
+        self.configs = [dict(zip(self.spec["params"], values))
+                        for values in itertools.product(*self.spec["params"].values())]
+        self.index = {self.config_key(config): i for i, config in enumerate(self.configs)}
+        self.outcomes = {}
+        self.status = "created"
+        self.saved_at = 0.0
+        if checkpoint is not None and os.path.exists(checkpoint):
+            self._load()
+
+    @classmethod
+    def resume(cls, checkpoint):
+        """The sweep of a checkpoint file, ready to `run` again."""
+        with open(checkpoint) as file:
+            state = json.load(file)
+        return cls(state["spec"], checkpoint=checkpoint)
+
+    @staticmethod
+    def config_key(config):
+        return ",".join(f"{name}={value}" for name, value in sorted(config.items()))
+
+    ### checkpoints ###
+    def _load(self):
+        with open(self.checkpoint) as file:
+            state = json.load(file)
+        if state.get("version") != SWEEP_VERSION or state.get("key") != self.key:
+            raise SweepError(f"checkpoint: {self.checkpoint} belongs to another sweep")
+        self.outcomes = {key: {int(replication): won for replication, won in outcomes.items()}
+                         for key, outcomes in state["outcomes"].items()}
+        self.status = state.get("status", "interrupted")
+
+    def save(self):
+        """Write the checkpoint, replacing the file at once so it is never half written."""
+        if self.checkpoint is None:
+            return
+        temporary = f"{self.checkpoint}.{os.getpid()}.tmp"
+        with open(temporary, "w") as file:
+            json.dump({"version": SWEEP_VERSION, "key": self.key, "spec": self.spec, "status": self.status,
+                       "outcomes": self.outcomes}, file)
+        os.replace(temporary, self.checkpoint)
+        self.saved_at = time.monotonic()
+
+    ### decisions ###
+    def stats(self, key):
+        outcomes = self.outcomes.get(key, {})
+        runs, wins = len(outcomes), sum(outcomes.values())
+        low, high = wilson_interval(wins, runs, self.spec["confidence"])
+        target = self.spec["target"]
+        if runs and low >= target:
+            decision = "above"
+        elif runs and high < target:
+            decision = "below"
+        else:
+            decision = "undecided"
+        return {"runs": runs, "wins": wins, "win_rate": wins / runs if runs else None,
+                "interval": [low, high], "decision": decision,
+                "settled": decision != "undecided" or runs >= self.spec["max_replications"]}
+
+    def _slices(self):
+        """Configuration keys of every slice, in order of the searched parameter."""
+        values = self.spec["params"][self.axis]
+        for rest in itertools.product(*(self.spec["params"][name] for name in self.others)):
+            fixed = dict(zip(self.others, rest))
+            yield fixed, [self.config_key({self.axis: value, **fixed}) for value in values]
+
+    def _active(self, keys):
+        """
+        Indices of the slice worth running: every coarse_step-th value, plus
+        the values between neighbours that settled on different decisions.
+        Returns (active indices, True when all of them are settled).
+        """
+        step = self.spec["coarse_step"]
+        active = set(range(0, len(keys), step)) | {len(keys) - 1}
+        while True:
+            stats = {i: self.stats(keys[i]) for i in active}
+            if not all(s["settled"] for s in stats.values()):
+                return sorted(active), False
+            ordered = sorted(active)
+            added = set()
+            for i, j in zip(ordered, ordered[1:]):
+                if j - i > 1 and stats[i]["decision"] != stats[j]["decision"]:
+                    added.update(range(i + 1, j))
+            if not added:
+                return ordered, True
+            active |= added
+
+    def next_jobs(self):
+        """Battles of the next round: unsettled active configurations double their replications."""
+        jobs = []
+        base = {"scenario": self.spec["scenario"], "engine": self.spec["engine"], "max_steps": self.spec["max_steps"]}
+        for fixed, keys in self._slices():
+            active, settled = self._active(keys)
+            if settled:
+                continue
+            for i in active:
+                key = keys[i]
+                stats = self.stats(key)
+                if stats["settled"]:
+                    continue
+                goal = self.spec["initial_replications"]
+                while goal <= stats["runs"]:
+                    goal *= 2
+                goal = min(goal, self.spec["max_replications"])
+                config = self.configs[self.index[key]]
+                for replication in range(goal):
+                    if replication in self.outcomes.get(key, {}):
+                        continue
+                    seed = replication_seed(self.spec["seed"], self.index[key], replication)
+                    jobs.append((key, replication, self.spec["objective"],
+                                 dict(base, **self.spec["fixed"], **config, seed=seed)))
+        return jobs
+
+    ### running ###
+    def record(self, key, replication, won):
+        self.outcomes.setdefault(key, {})[replication] = won
+        if time.monotonic() - self.saved_at >= CHECKPOINT_SECONDS:
+            self.save()
+
+    def run(self, max_workers=None, stop=None, on_progress=None):
+        """
+        Run rounds until every slice is settled, in a process pool.
+
+        `stop` is an optional threading.Event: when set, queued battles are
+        dropped, the checkpoint is written and the sweep returns as
+        "interrupted". `on_progress(sweep)` is called after every battle.
+        """
+        self.status = "running"
+        max_workers = max_workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            while True:
+                jobs = self.next_jobs()
+                if not jobs:
+                    break
+                pending = {executor.submit(_replicate, job) for job in jobs}
+                while pending:
+                    done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self.record(*future.result())
+                        if on_progress is not None:
+                            on_progress(self)
+                    if stop is not None and stop.is_set():
+                        for future in pending:
+                            future.cancel()
+                        self.status = "interrupted"
+                        self.save()
+                        return self.summary()
+                self.save()
+        self.status = "done"
+        self.save()
+        return self.summary()
+
+    ### results ###
+    def summary(self):
+        """Progress, every configuration run so far and the answer per slice."""
+        configs, answer = [], []
+        for fixed, keys in self._slices():
+            active, settled = self._active(keys)
+            found = None
+            for i in active:
+                stats = self.stats(keys[i])
+                config = self.configs[self.index[keys[i]]]
+                configs.append({"params": config, **{k: v for k, v in stats.items() if k != "settled"}})
+                if found is None and stats["decision"] == "above":
+                    found = {self.axis: config[self.axis], "win_rate": stats["win_rate"],
+                             "interval": stats["interval"]}
+            answer.append({**fixed, **(found or {self.axis: None}), "settled": settled})
+        simulations = sum(len(outcomes) for outcomes in self.outcomes.values())
+        return {"status": self.status,
+                "search": self.axis,
+                "target": self.spec["target"],
+                "answer": answer,
+                "simulations": simulations,
+                "brute_force_simulations": len(self.configs) * self.spec["max_replications"],
+                "configs": configs,
+                "spec": self.spec}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m battlesim.sweep", description=__doc__.split("\n")[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="run a sweep, continuing from its checkpoint if there is one")
+    run.add_argument("spec", help="JSON file of the sweep spec")
+    run.add_argument("--checkpoint", required=True, help="JSON file the progress is saved to")
+    run.add_argument("--workers", type=int, default=None)
+    show = commands.add_parser("show", help="print the current results of a checkpoint")
+    show.add_argument("checkpoint")
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        with open(args.spec) as file:
+            sweep = Sweep(json.load(file), checkpoint=args.checkpoint)
+
+        def progress(sweep):
+            print(f"\r{sum(len(outcomes) for outcomes in sweep.outcomes.values())} battles", end="", file=sys.stderr)
+
+        summary = sweep.run(max_workers=args.workers, on_progress=progress)
+        print(file=sys.stderr)
+    else:
+        summary = Sweep.resume(args.checkpoint).summary()
+    print(json.dumps({key: value for key, value in summary.items() if key not in ("configs", "spec")}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
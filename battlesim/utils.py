@@ -3,6 +3,8 @@ import seaborn as sns
 import time
 from IPython.display import display, clear_output
 
+from .enums import ALLY, ENEMY
+
 
 def show_online(visualizer):
     fig = visualizer.plot_teritory()
@@ -11,27 +13,73 @@ def show_online(visualizer):
     plt.close(fig)
 
 def any_team_exist(model):
-    dataframe = model.datacollector.get_model_vars_dataframe()
-    if dataframe.empty:
-        return True
-    elif 0 in dataframe.iloc[-1, :2].values:
-        return False
-    else:
-        return True
+    # O(1) read of the running counters
+    return model.stats.alive_count(ALLY) > 0 and model.stats.alive_count(ENEMY) > 0
+
+def run_battle(model, max_steps=150, stop_when_decided=True, stalemate_steps=None,
+               time_budget=None, on_step=None):
+    """
+    Step the model until the battle is over.
+
+    Args:
+        model: The model instance.
+        max_steps: Upper bound on the number of steps.
+        stop_when_decided: Stop as soon as one fraction has no live agents
+            ("decided"), or when nothing happened in a step and
+            `model.can_engage()` finds that nothing can happen any more:
+            no projectile in flight, no agent left to move, no locked aim
+            or enemy in range of an armed agent and no wounded ally of a
+            medic ("out_of_reach").
+        stalemate_steps: Optional, off by default. Stop after this many
+            consecutive steps in which `model.progress_signature()` did not
+            change: no kill, damage, healing, move or new projectile, even
+            if the agents could still fight.
+        time_budget: Optional wall-clock budget in seconds.
+        on_step: Optional callback called with the step index after each step.
+
+    Returns:
+        Dict with the number of steps run and the reason the run ended:
+        "decided", "out_of_reach", "stalemate", "time_budget" or "max_steps".
+    """
+    start = time.perf_counter()
+    steps, unchanged, signature = 0, 0, None
+    while True:
+        if stop_when_decided and not any_team_exist(model):
+            reason = "decided"
+            break
+        if steps >= max_steps:
+            reason = "max_steps"
+            break
+        if time_budget is not None and time.perf_counter() - start >= time_budget:
+            reason = "time_budget"
+            break
+
+        model.step()
+        if on_step is not None:
+            on_step(steps)
+        steps += 1
+
+        if stalemate_steps or stop_when_decided:
+            current = model.progress_signature()
+            unchanged = unchanged + 1 if current == signature else 0
+            signature = current
+            if stalemate_steps and unchanged >= stalemate_steps:
+                reason = "stalemate"
+                break
+            # what `can_engage` reads only changes with the signature, one check per quiet spell is enough
+            if stop_when_decided and unchanged == 1 and not model.can_engage():
+                reason = "out_of_reach"
+                break
+    return {"steps": steps, "reason": reason}
 
 def run_simulation(model, visualizer, max_steps=500, show=False, sleep_time=0.1):
-    i = 0
-    if show:
-        while i < max_steps and any_team_exist(model):
-            model.step()
+    def on_step(i):
+        if show:
             show_online(visualizer)
             time.sleep(sleep_time)
-            i += 1
-    else:
-        while i < max_steps and any_team_exist(model):
-            model.step()
-            i += 1
-    print(f"Numb of iterations: {i}")
+
+    result = run_battle(model, max_steps=max_steps, on_step=on_step)
+    print(f"Numb of iterations: {result['steps']}")
 
 
 
@@ -61,6 +109,7 @@ def final_plots(model):
     axs[0, 1].set_xlim(0)
 
     # Get agent vars dataframe
+    model.sync_agents()
     data = model.datacollector.get_agent_vars_dataframe()
 
     # Last step results
@@ -86,15 +135,11 @@ def final_plots(model):
 # Final plots
 def final_stats(model):
 
-    # Get model vars dataframe
-    try:
-        data = model.datacollector.get_model_vars_dataframe().iloc[-1,:]
-    except:
-        return 0
-
-    result = {"Number of allies alive": float(data[0]),
-              "Number of enemies alive": float(data[1]),
-              "Allies health": int(data[2]),
-              "Enemies health": int(data[3])}
+    # O(1) read of the running counters
+    stats = model.stats
+    result = {"Number of allies alive": float(stats.alive_count("ally")),
+              "Number of enemies alive": float(stats.alive_count("enemy")),
+              "Allies health": int(stats.total_health("ally")),
+              "Enemies health": int(stats.total_health("enemy"))}
     
     return result
\ No newline at end of file
@@ -1,32 +1,42 @@
+import numpy as np
 import matplotlib.pyplot as plt
 import scipy.ndimage
-import cv2
+
+from .assets import heights_fingerprint, load_background, load_terrain
+from .enums import ALLY, ENEMY, INFANTRY, MEDIC, MORTAR
+from .raster import RASTER_SCALER, Rasterizer, agent_arrays, encode
+from .spatial import SparseGrid
 
 class Visualizer():
     
     def __init__(self, model, image_path):
+        if isinstance(model.grid, SparseGrid):
+            raise ValueError("Sparse maps cannot be drawn whole, their layers are only loaded where agents are")
     
         self.model = model
         self.height = model.grid.height
         self.width = model.grid.width
-        self.image = self.read_image(image_path)
+        self.image_path = image_path
         self.scaler = 10
+        self.image = self.read_image(image_path)
+        
+        # static layers come from the process-wide asset cache
+        self.terrain_key = heights_fingerprint(model.height_map)
+        self.terrain = load_terrain(image_path, model.height_map,
+                                    self.scaler, fingerprint=self.terrain_key)
+        self.rasterizer = None
     
     def read_image(self, image_path):
-        image = cv2.imread(image_path)
-        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        image = cv2.resize(image, dsize=(10*self.width, 10*self.height),
-                                    interpolation=cv2.INTER_CUBIC)
-        return image
+        return read_image(image_path, self.width, self.height, self.scaler)
 
     @staticmethod
     def _get_color(agent):
-        if agent.fraction == "ally":
-            if agent.type.startswith("projectile_"):
+        if agent.fraction is ALLY:
+            if agent.is_projectile:
                 return "yellow"
             return "blue"
-        elif agent.fraction == "enemy":
-            if agent.type.startswith("projectile_"):
+        elif agent.fraction is ENEMY:
+            if agent.is_projectile:
                 return "orange"
             return "red"
         return "white"
@@ -41,65 +51,120 @@ class Visualizer():
             marker=arguments.get("marker")
         )
     
-    def _add_agent_arguments(self, agent, arguments):
-        x_transformed = int(agent.pos[0] * self.scaler)
-        y_transformed = int((self.height - 1 - agent.pos[1]) * self.scaler)
-    
-        arguments["xs"].append(x_transformed)
-        arguments["ys"].append(y_transformed)
-        arguments["ss"].append(agent.health)
-        arguments["colors"].append(self._get_color(agent))
-        
-          
+    def snapshot(self):
+        """Copy of everything a frame needs, detached from the live model."""
+        self.model.sync_agents()
+        return {"width": self.width,
+                "height": self.height,
+                "height_map": self.model.height_map,
+                "terrain_key": self.terrain_key,
+                "mines": self.model.mine_map.grid.copy(),
+                "agents": [(agent.type, agent.pos[0], agent.pos[1], agent.health, self._get_color(agent))
+                           for agent in self.model.schedule.agents]}
     
+    def frame(self):
+        """Like `snapshot`, with the agents as arrays for the `Rasterizer`."""
+        return {"width": self.width,
+                "height": self.height,
+                "height_map": self.model.height_map,
+                "terrain_key": self.terrain_key,
+                "mines": self.model.mine_map.grid.copy(),
+                **agent_arrays(self.model)}
+
+    def raster(self, show_heights = True, show_mines = True, scaler=RASTER_SCALER):
+        """The territory as a BGR array, drawn without matplotlib in a few milliseconds."""
+        if self.rasterizer is None or self.rasterizer.scaler != scaler:
+            self.rasterizer = Rasterizer(scaler)
+        frame = self.frame()
+        return self.rasterizer.draw(raster_layer(self.image_path, frame, scaler, show_heights),
+                                    frame, show_mines=show_mines)
+
+    def render(self, format="png", show_heights = True, show_mines = True, scaler=RASTER_SCALER):
+        """The territory encoded as PNG, JPEG or WebP bytes."""
+        return encode(self.raster(show_heights, show_mines, scaler), format)
+
     def plot_teritory(self, show_heights = True, show_mines = True):
         
         fig, ax = plt.subplots()
-        
-        ax.imshow(self.image) # trick to show white
-        
-        if show_heights == True:
-            zoomed_heiths =  scipy.ndimage.zoom(self.model.height_map.round(1),
-                                 (self.scaler, self.scaler),
-                                 order=1)
-            ax.imshow(zoomed_heiths, cmap="gray", alpha=0.4)
+        draw_teritory(ax, self.image, self.snapshot(), self.scaler,
+                      show_heights=show_heights, show_mines=show_mines,
+                      terrain=self.terrain)
+        plt.close()
             
-        if show_mines == True and len(self.model.mine_map)!=0:
-
-            mine_xs, mine_ys = zip(*self.model.mine_map.keys())
-            mine_xs = [int(x * self.scaler) for x in mine_xs]
-            mine_ys = [int((self.height - 1 - y) * self.scaler) for y in mine_ys]
-            mine_sizes = [5*value for value in self.model.mine_map.values()]  # Adjust size as needed
-
-            ax.scatter(mine_xs,
-                       mine_ys,
-                       color='purple',
-                       s=mine_sizes,
-                       marker='.',
-                       alpha=0.8)
+        return fig
+
+
+def raster_layer(image_path, frame, scaler=RASTER_SCALER, show_heights=True):
+    """Cached static layer under a raster frame: terrain, or the bare background."""
+    if show_heights:
+        return load_terrain(image_path, frame["height_map"], scaler, fingerprint=frame["terrain_key"])
+    return load_background(image_path, frame["width"], frame["height"], scaler)
+
+
+def read_image(image_path, width, height, scaler=10):
+    return load_background(image_path, width, height, scaler)
+
+
+def _add_agent_arguments(arguments, x, y, health, color, height, scaler):
+    arguments["xs"].append(int(x * scaler))
+    arguments["ys"].append(int((height - 1 - y) * scaler))
+    arguments["ss"].append(health)
+    arguments["colors"].append(color)
+
+
+def draw_teritory(ax, image, snapshot, scaler=10, show_heights = True, show_mines = True,
+                  terrain=None):
+    """Draw a snapshot from `Visualizer.snapshot` onto a matplotlib axis.
+
+    `terrain` is the cached heights-over-background layer; when given it
+    replaces drawing the image and zooming the height map on every frame.
+    """
+    height = snapshot["height"]
+    
+    if show_heights == True and terrain is not None:
+        ax.imshow(terrain)
+    else:
+        ax.imshow(image) # trick to show white
+    
+    if show_heights == True and terrain is None:
+        zoomed_heiths =  scipy.ndimage.zoom(snapshot["height_map"].round(1),
+                             (scaler, scaler),
+                             order=1)
+        ax.imshow(zoomed_heiths, cmap="gray", alpha=0.4)
         
-        # show soldiers
-        infantry_scatter_arguments = {"xs":[], "ys":[], "ss":[], "colors":[]}
-        medic_scatter_arguments = {"xs":[], "ys":[], "ss":[], "colors":[], "marker": "+"}
-        mortar_scatter_arguments = {"xs":[], "ys":[], "ss":[], "colors":[], "marker": "s"}
-        projectile_scatter_arguments = {"xs":[], "ys":[], "ss":[], "colors":[], "marker": "x"}
-        for agent in self.model.schedule.agents:
-            if agent.type == "infantry":
-                self._add_agent_arguments(agent, infantry_scatter_arguments)
-            elif agent.type == "medic":
-                self._add_agent_arguments(agent, medic_scatter_arguments)
-            elif agent.type == "mortar":
-                self._add_agent_arguments(agent, mortar_scatter_arguments)
-            elif agent.type.startswith("projectile_"):
-                self._add_agent_arguments(agent, projectile_scatter_arguments)
-            
+    mine_positions = np.nonzero(snapshot["mines"])
+    if show_mines == True and len(mine_positions[0])!=0:
+
+        mine_xs = mine_positions[0] * scaler
+        mine_ys = (height - 1 - mine_positions[1]) * scaler
+        mine_sizes = 5 * snapshot["mines"][mine_positions].astype(int)  # Adjust size as needed
+
+        ax.scatter(mine_xs,
+                   mine_ys,
+                   color='purple',
+                   s=mine_sizes,
+                   marker='.',
+                   alpha=0.8)
+    
+    # show soldiers
+    infantry_scatter_arguments = {"xs":[], "ys":[], "ss":[], "colors":[]}
+    medic_scatter_arguments = {"xs":[], "ys":[], "ss":[], "colors":[], "marker": "+"}
+    mortar_scatter_arguments = {"xs":[], "ys":[], "ss":[], "colors":[], "marker": "s"}
+    projectile_scatter_arguments = {"xs":[], "ys":[], "ss":[], "colors":[], "marker": "x"}
+    for agent_type, x, y, health, color in snapshot["agents"]:
+        if agent_type is INFANTRY:
+            _add_agent_arguments(infantry_scatter_arguments, x, y, health, color, height, scaler)
+        elif agent_type is MEDIC:
+            _add_agent_arguments(medic_scatter_arguments, x, y, health, color, height, scaler)
+        elif agent_type is MORTAR:
+            _add_agent_arguments(mortar_scatter_arguments, x, y, health, color, height, scaler)
+        elif agent_type.is_projectile:
+            _add_agent_arguments(projectile_scatter_arguments, x, y, health, color, height, scaler)
         
-        self._plot_agents(ax, infantry_scatter_arguments)
-        self._plot_agents(ax, medic_scatter_arguments)
-        self._plot_agents(ax, mortar_scatter_arguments)
-        self._plot_agents(ax, projectile_scatter_arguments)     
-        ax.set_xticks([])
-        ax.set_yticks([])
-        plt.close()
-            
-        return fig
\ No newline at end of file
+    
+    Visualizer._plot_agents(ax, infantry_scatter_arguments)
+    Visualizer._plot_agents(ax, medic_scatter_arguments)
+    Visualizer._plot_agents(ax, mortar_scatter_arguments)
+    Visualizer._plot_agents(ax, projectile_scatter_arguments)     
+    ax.set_xticks([])
+    ax.set_yticks([])
@@ -1,6 +1,17 @@
+import sys
+import json
+import threading
+import urllib.request
+
 import pygame
 import time
 
+from battlesim.stream import decode_agents
+
+# colors as in Visualizer._get_color, by fraction then projectile or not
+COLORS = {(0, False): "blue", (0, True): "yellow",
+          (1, False): "red", (1, True): "orange"}
+
 def show_map():
     pygame.init()
     window_size = (360, 360)
@@ -36,5 +47,60 @@ def show_map():
 
     pygame.quit()
 
+
+def read_stream(url, latest):
+    """Keep the latest frame of a /stream_simulation or /stream/<id> SSE stream."""
+    with urllib.request.urlopen(url) as response:
+        for line in response:
+            line = line.decode().strip()
+            if line.startswith("data:"):
+                frame = json.loads(line[5:])
+                if "error" in frame:
+                    print(f"Battle failed: {frame['error']}")
+                elif "agents" in frame:
+                    latest["frame"] = frame
+
+
+def show_stream(url, map_size=100):
+    pygame.init()
+    window_size = (360, 360)
+    screen = pygame.display.set_mode(window_size, pygame.RESIZABLE)
+    pygame.display.set_caption("Agent-Based Simulation")
+
+    latest = {"frame": None}
+    threading.Thread(target=read_stream, args=(url, latest), daemon=True).start()
+
+    running = True
+    while running:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type == pygame.VIDEORESIZE:
+                window_size = event.size
+                screen = pygame.display.set_mode(window_size, pygame.RESIZABLE)
+
+        screen.fill("darkolivegreen")
+        frame = latest["frame"]
+        if frame is not None:
+            agents = decode_agents(frame)
+            scale_x = window_size[0] / map_size
+            scale_y = window_size[1] / map_size
+            for x, y, health, fraction, agent_type in zip(agents["x"], agents["y"], agents["health"],
+                                                          agents["fraction"], agents["type"]):
+                color = COLORS[(int(fraction), agent_type == 3)]
+                center = (int((x + 0.5) * scale_x), int((map_size - 0.5 - y) * scale_y))
+                pygame.draw.circle(screen, color, center, max(1, int(health ** 0.5 / 3)))
+            pygame.display.set_caption(f"Agent-Based Simulation, step {frame['step']}")
+        pygame.display.flip()
+
+        time.sleep(0.05)  # Short pause
+
+    pygame.quit()
+
 if __name__ == '__main__':
-    show_map()
+    # python online-map.py [stream url], e.g.
+    # http://127.0.0.1:5000/stream_simulation?n_soldiers=60&fps=10
+    if len(sys.argv) > 1:
+        show_stream(sys.argv[1])
+    else:
+        show_map()
@@ -0,0 +1,11 @@
+import os
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(autouse=True)
+def repo_root(monkeypatch):
+    """Scenarios name their maps relative to the repository root."""
+    monkeypatch.chdir(ROOT)
@@ -0,0 +1,13 @@
+from battlesim.chunks import ChunkedLayer
+from battlesim.utils import final_stats
+
+
+def battle_state(model):
+    """Everything two runs of a battle should agree on: the agents, the mines and the totals."""
+    model.sync_agents()
+    agents = sorted((agent.unique_id, agent.pos, round(float(agent.health), 9), str(agent.status))
+                    for agent in model.schedule.agents)
+    mines = model.mine_map.grid
+    if isinstance(mines, ChunkedLayer):
+        mines = mines.to_array()
+    return agents, mines.tolist(), final_stats(model), model.schedule.steps
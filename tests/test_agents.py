@@ -0,0 +1,30 @@
+import pytest
+
+from battlesim.batch import create_model
+from battlesim.enums import DEAD, INFANTRY
+
+
+def test_agents_have_slots_and_share_their_type_record():
+    model = create_model(20, 2, seed=1)
+    agents = list(model.schedule.agents)
+    assert not any(hasattr(agent, "__dict__") for agent in agents)
+    with pytest.raises(AttributeError):
+        agents[0].rank = "private"
+    infantry = [agent for agent in agents if agent.type is INFANTRY]
+    assert len({id(agent.attributes) for agent in infantry}) == 1
+    assert infantry[0].max_health == infantry[0].attributes.max_health
+
+
+def test_dead_agents_leave_the_model_and_projectiles_are_reused():
+    model = create_model(30, 0, 0, seed=2, n_mortars=2)
+    projectiles, shots = {}, set()
+    for _ in range(60):
+        model.step()
+        for agent in model.schedule.agents:
+            if agent.is_projectile:
+                projectiles[id(agent)] = agent
+                shots.add(agent.unique_id)
+        assert all(agent.status is not DEAD for agent in model.schedule.agents)
+        assert all(agent.status is not DEAD for agents, _ in model.grid.coord_iter() for agent in agents)
+    assert len(shots) > len(projectiles) > 0
+    assert sum(len(pool) for pool in model.projectile_pool.values()) <= len(projectiles)
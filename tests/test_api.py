@@ -0,0 +1,108 @@
+import json
+
+import pytest
+
+import api
+from battlesim.jobs import JobQueue
+
+from .test_jobs import wait_for
+
+
+@pytest.fixture
+def client():
+    return api.app.test_client()
+
+
+@pytest.mark.parametrize("method, url", [
+    ("get", "/run_simulation?engine=bogus&render=false"),
+    ("get", "/stream_simulation?engine=bogus"),
+    ("get", "/run_batch?engine=bogus"),
+    ("post", "/simulations?engine=bogus"),
+])
+def test_unknown_engine_is_a_400(client, method, url):
+    response = getattr(client, method)(url)
+    assert response.status_code == 400
+    assert "engine must be one of mesa, vector, parallel, got 'bogus'" in response.get_json()["error"]
+
+
+def test_vector_run_reports_its_stats(client):
+    response = client.get("/run_simulation?engine=vector&render=false&n_soldiers=10&seed=1")
+    assert response.status_code == 200
+    stats = response.get_json()
+    assert stats["Stop reason"] in ("decided", "max_steps")
+    assert stats["Steps"] <= 150
+
+
+@pytest.mark.parametrize("replications", ["0", "-3", "100000", "ten"])
+def test_batch_size_is_bounded(client, replications):
+    response = client.get(f"/run_batch?replications={replications}")
+    assert response.status_code == 400
+    assert "replications" in response.get_json()["error"]
+
+
+@pytest.mark.parametrize("body, message", [
+    ({"n_soldiers": "many"}, "n_soldiers"),
+    ({"max_steps": 1.5}, "max_steps"),
+    ({"n_mines": True}, "n_mines"),
+    ({"seed": "abc"}, "seed"),
+    ({"time_budget": "soon"}, "time_budget"),
+    ({"scenario": "nope"}, "Unknown scenario: 'nope'"),
+])
+def test_bad_simulation_parameters_are_a_400(client, body, message):
+    response = client.post("/simulations", json=body)
+    assert response.status_code == 400
+    assert message in response.get_json()["error"]
+    assert api.job_queue is None  # refused before any job was queued
+
+
+def test_simulation_jobs_run_and_overflow_is_a_429(client, monkeypatch):
+    queue = JobQueue(max_workers=1, max_pending=0)
+    monkeypatch.setattr(api, "job_queue", queue)
+    try:
+        response = client.post("/simulations", json={"n_soldiers": 10, "seed": 1, "engine": "vector",
+                                                     "max_steps": 1000, "early_stop": False})
+        assert response.status_code == 202
+        job_id = response.get_json()["id"]
+        assert client.post("/simulations", json={}).status_code == 429
+
+        wait_for(queue, job_id, "done")
+        status = client.get(f"/simulations/{job_id}").get_json()
+        assert status["status"] == "done" and status["progress"] == 1000
+        assert status["result"]["Steps"] == 1000
+        assert client.delete(f"/simulations/{job_id}").get_json()["status"] == "done"
+        assert client.get("/simulations/nope").status_code == 404
+        assert client.delete("/simulations/nope").status_code == 404
+    finally:
+        queue.shutdown()
+
+
+def test_seeded_runs_are_served_from_the_cache(client, monkeypatch):
+    monkeypatch.setattr(api, "result_cache", api.ResultCache())
+    url = "/run_simulation?engine=vector&render=false&n_soldiers=10&seed=5"
+    first = client.get(url).get_json()
+    assert client.get(url).get_json() == first
+    assert client.get(url.replace("seed=5", "seed=6")).status_code == 200
+    cache = client.get("/cache").get_json()
+    assert (cache["hits"], cache["misses"], cache["entries"]) == (1, 2, 2)
+
+
+def test_scenarios_are_listed(client):
+    response = client.get("/scenarios")
+    assert response.status_code == 200
+    assert "small_battle" in response.get_data(as_text=True)
+
+
+@pytest.mark.parametrize("world, status", [
+    ({"heights": "/etc/passwd"}, 400),
+    ({"image": "database/missing.png"}, 400),
+    ({"heights": "database/heights.txt", "image": "database/image.png"}, 200),
+])
+def test_inline_scenarios_only_use_built_in_map_files(client, world, status):
+    scenario = {"id": "inline", "map": dict({"width": 100, "height": 100}, **world),
+                "units": [{"fraction": "ally", "type": "infantry", "count": 2, "pos": [10, 10]},
+                          {"fraction": "enemy", "type": "infantry", "count": 2, "pos": [12, 10]}]}
+    response = client.get("/run_simulation", query_string={"scenario": json.dumps(scenario), "render": "false"})
+    assert response.status_code == status
+    if status == 400:
+        assert "inline scenarios can only use the map files" in response.get_json()["error"]
+        assert client.post("/sweeps", json={"scenario": scenario}).status_code == 400
@@ -0,0 +1,64 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from battlesim import assets
+from battlesim.assets import AssetCache, heights_fingerprint, load_heights, load_terrain
+
+
+def test_cache_loads_once_and_evicts_the_least_recent_entry():
+    cache = AssetCache(max_entries=2)
+    loads = []
+
+    def loader(key):
+        return lambda: loads.append(key) or key.upper()
+
+    assert cache.get("a", loader("a")) == "A"
+    assert cache.get("b", loader("b")) == "B"
+    assert cache.get("a", loader("a")) == "A"  # hit, "b" is now the oldest
+    cache.get("c", loader("c"))
+    assert list(cache.entries) == ["a", "c"]
+    assert loads == ["a", "b", "c"]
+
+
+def test_height_map_is_read_again_only_when_its_file_changes(tmp_path):
+    path = str(tmp_path / "heights.txt")
+    shutil.copy("database/heights.txt", path)
+    first = load_heights(path)
+    assert load_heights(path) is first
+    assert not first.flags.writeable
+    assert heights_fingerprint(first)[0] == "file"
+
+    heights = np.loadtxt(path)
+    heights[0, 0] += 1
+    np.savetxt(path, heights)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    second = load_heights(path)
+    assert second is not first
+    assert second[0, 0] == first[0, 0] + 1
+    assert heights_fingerprint(second) != heights_fingerprint(first)
+
+
+def test_fingerprint_of_a_writable_map_follows_its_content():
+    height_map = np.zeros((4, 4))
+    before = heights_fingerprint(height_map)
+    height_map[1, 1] = 2
+    assert heights_fingerprint(height_map) != before
+    assert heights_fingerprint(height_map.copy()) == heights_fingerprint(height_map)
+
+
+def test_warm_terrain_layer_needs_no_disk_or_resampling(monkeypatch):
+    height_map = load_heights("database/heights.txt")
+    layer = load_terrain("database/image.png", height_map)
+
+    def fail(*args, **kwargs):
+        pytest.fail("static layer rebuilt")
+
+    monkeypatch.setattr(assets.cv2, "imread", fail)
+    monkeypatch.setattr(assets.scipy.ndimage, "zoom", fail)
+    monkeypatch.setattr(assets.np, "loadtxt", fail)
+    assert load_heights("database/heights.txt") is height_map
+    assert load_terrain("database/image.png", height_map) is layer
@@ -0,0 +1,19 @@
+from battlesim.batch import replication_seeds, run_batch
+
+
+def test_batch_is_reproducible_and_independent_of_the_pool_size():
+    kwargs = dict(n_soldiers=10, n_medics=1, n_mines=0, replications=4, seed=42, max_steps=30, engine="vector")
+    first = run_batch(max_workers=1, **kwargs)
+    second = run_batch(max_workers=2, **kwargs)
+    assert first == second
+    assert first["seeds"] == replication_seeds(42, 4)
+    assert len(first["replications"]) == 4
+
+
+def test_aggregate_summarizes_every_stat():
+    result = run_batch(n_soldiers=10, n_mines=0, replications=3, seed=1, max_workers=1, max_steps=20)
+    alive = [stats["Number of allies alive"] for stats in result["replications"]]
+    aggregate = result["aggregate"]["Number of allies alive"]
+    assert aggregate["mean"] == sum(alive) / 3
+    assert aggregate["quantiles"]["0.5"] == sorted(alive)[1]
+    assert set(result["aggregate"]) == set(result["replications"][0])
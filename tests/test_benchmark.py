@@ -0,0 +1,43 @@
+import json
+
+import pytest
+
+from battlesim.benchmark import bench_step, compare, main, scaled_scenario
+from battlesim.scenario import compile_scenario
+
+BASE = {"benchmarks": {"step": {"agents": 50, "step_ms": 10.0, "steps_per_s": 100.0},
+                       "api": {"requests_per_s": 20.0, "p95_ms": 50.0}}}
+NEW = {"benchmarks": {"step": {"agents": 500, "step_ms": 12.0, "steps_per_s": 105.0},
+                      "api": {"requests_per_s": 10.0}}}
+
+
+def test_compare_signs_changes_so_that_positive_is_better():
+    rows = {(name, metric): (change, regressed) for name, metric, _, _, change, regressed in compare(BASE, NEW)}
+    assert set(rows) == {("step", "step_ms"), ("step", "steps_per_s"), ("api", "requests_per_s")}
+    assert rows["step", "step_ms"] == (pytest.approx(-0.2), True)
+    assert rows["step", "steps_per_s"] == (pytest.approx(0.05), False)
+    assert rows["api", "requests_per_s"] == (pytest.approx(-0.5), True)
+    assert not any(regressed for *_, regressed in compare(BASE, NEW, threshold=0.6))
+
+
+def test_compare_command_fails_on_regressions(tmp_path, capsys):
+    paths = []
+    for name, results in (("base", BASE), ("new", NEW)):
+        paths.append(tmp_path / f"{name}.json")
+        paths[-1].write_text(json.dumps(results))
+    assert main(["compare", str(paths[0]), str(paths[1])]) == 1
+    assert "2 regression(s) beyond 10%" in capsys.readouterr().out
+    assert main(["compare", str(paths[0]), str(paths[0])]) == 0
+
+
+@pytest.mark.parametrize("n_agents", [10, 400])
+def test_scaled_scenarios_keep_their_proportions(n_agents):
+    compiled = compile_scenario(scaled_scenario("big_battle", n_agents))
+    assert abs(int(compiled.blocks["count"].sum()) - n_agents) <= len(compiled.blocks["count"])
+    assert (compiled.blocks["count"] > 0).all()
+
+
+def test_step_benchmark_reports_its_metrics():
+    result = bench_step("small_battle", "vector", 50, steps=3)
+    assert result["agents"] == 50 and result["steps"] == 3
+    assert result["step_ms"] > 0 and result["agent_steps_per_s"] > result["steps_per_s"] > 0
@@ -0,0 +1,96 @@
+import threading
+import time
+
+import pytest
+
+from battlesim.cache import ResultCache
+
+
+def _together(n, target):
+    """Run `target` in `n` threads released at once; returns their results."""
+    barrier = threading.Barrier(n)
+    results = [None] * n
+
+    def run(i):
+        barrier.wait()
+        results[i] = target()
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    return results
+
+
+def test_concurrent_misses_share_one_computation():
+    cache = ResultCache()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        # finish only once the other threads are waiting for this computation
+        deadline = time.monotonic() + 5
+        while cache.stats()["shared"] < 7 and time.monotonic() < deadline:
+            time.sleep(0.001)
+        return {"allies": 3}
+
+    results = _together(8, lambda: cache.get_or_compute("key", compute))
+    assert results == [{"allies": 3}] * 8
+    assert len(calls) == 1
+    stats = cache.stats()
+    assert (stats["misses"], stats["shared"], stats["inflight"]) == (1, 7, 0)
+
+
+def test_failed_computation_reaches_waiters_and_is_retried():
+    cache = ResultCache()
+    started, release = threading.Event(), threading.Event()
+
+    def fail():
+        started.set()
+        release.wait(5)
+        raise RuntimeError("battle crashed")
+
+    errors = []
+
+    def leader():
+        try:
+            cache.get_or_compute("key", fail)
+        except RuntimeError as error:
+            errors.append(error)
+
+    thread = threading.Thread(target=leader)
+    thread.start()
+    started.wait(5)
+
+    def waiter():
+        try:
+            cache.get_or_compute("key", lambda: "not called")
+        except RuntimeError as error:
+            errors.append(error)
+
+    waiting = threading.Thread(target=waiter)
+    waiting.start()
+    while not cache.stats()["shared"]:
+        time.sleep(0.001)
+    release.set()
+    thread.join(5)
+    waiting.join(5)
+    assert [str(error) for error in errors] == ["battle crashed"] * 2
+    assert cache.stats()["inflight"] == 0
+    assert cache.get_or_compute("key", lambda: 42) == 42
+
+
+def test_disk_tier_survives_a_new_cache(tmp_path):
+    path = str(tmp_path / "results.sqlite")
+    ResultCache(db_path=path).get_or_compute("key", lambda: [1, 2])
+    cache = ResultCache(db_path=path)
+    assert cache.get_or_compute("key", lambda: pytest.fail("recomputed")) == [1, 2]
+    assert cache.stats()["disk_hits"] == 1
+
+
+def test_memory_tier_evicts_the_least_recent_key():
+    cache = ResultCache(max_entries=2)
+    for key in "abc":
+        cache.get_or_compute(key, lambda: key)
+    assert list(cache.memory) == ["b", "c"]
@@ -0,0 +1,73 @@
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+from battlesim.batch import create_model
+from battlesim.chunks import ChunkedLayer, open_layer, save_layer
+from battlesim.scenario import load_scenario
+from battlesim.spatial import SparseGrid
+from battlesim.utils import run_battle
+
+from .helpers import battle_state
+
+
+@pytest.fixture
+def heights():
+    array = np.random.default_rng(5).random((50, 40)).astype(np.float32)
+    array[:32, :16] = 0  # one chunk that only holds the fill
+    return array
+
+
+def test_saved_layer_opens_chunk_by_chunk(heights, tmp_path):
+    directory = str(tmp_path / "layer")
+    save_layer(heights, directory, chunk=16)
+    assert not os.path.exists(os.path.join(directory, "0_0.npy"))
+
+    layer = open_layer(directory)
+    assert layer.shape == heights.shape and layer.dtype == heights.dtype and not layer.chunks
+    assert layer[20, 20] == heights[20, 20] and set(layer.chunks) == {(1, 1)}
+    assert layer.nbytes == 0  # memory-mapped
+    np.testing.assert_array_equal(layer.to_array(), heights)
+
+    # writes go to a private copy of the chunk, the file stays as saved
+    layer[20, 20] = 7
+    assert layer[20, 20] == 7 and layer.nbytes == 16 * 16 * 4
+    assert open_layer(directory)[20, 20] == heights[20, 20]
+
+    copied = pickle.loads(pickle.dumps(layer))
+    assert copied[20, 20] == 7
+    np.testing.assert_array_equal(copied[np.arange(50), 3], heights[:, 3])
+
+
+def test_layer_indexing_matches_a_dense_array():
+    rng = np.random.default_rng(1)
+    dense = np.zeros((70, 45), dtype=np.uint8)
+    layer = ChunkedLayer(dense.shape, np.uint8, chunk=16)
+    x, y = rng.integers(0, 70, 200), rng.integers(0, 45, 200)
+    dense[x, y] = 3
+    layer[x, y] = 3
+    layer.subtract_at(x[:50], y[:50])
+    np.subtract.at(dense, (x[:50], y[:50]), 1)
+
+    np.testing.assert_array_equal(layer.to_array(), dense)
+    np.testing.assert_array_equal(layer[x, y], dense[x, y])
+    assert sorted(zip(*layer.nonzero())) == sorted(zip(*np.nonzero(dense)))
+    assert layer[69, 44] == dense[69, 44]
+    assert layer.nbytes < dense.nbytes * 16  # untouched chunks take no memory
+    assert ChunkedLayer((10000, 10000), np.uint8)[5000, 5000] == 0
+
+
+@pytest.mark.parametrize("engine", ["mesa", "vector"])
+def test_sparse_grid_battle_matches_the_dense_one(engine):
+    # without mines, which sparse maps draw chunk by chunk
+    states = []
+    for grid in ("dense", "sparse"):
+        spec = load_scenario("small_battle_route")
+        spec["map"] = dict(spec["map"], grid=grid, chunk=16)
+        model = create_model(30, 3, 0, seed=6, engine=engine, scenario=spec)
+        assert isinstance(model.grid, SparseGrid) == (grid == "sparse")
+        run_battle(model, max_steps=60, stop_when_decided=False)
+        states.append(battle_state(model))
+    assert states[0] == states[1]
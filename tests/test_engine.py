@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from battlesim.batch import create_model
+from battlesim.utils import run_battle
+
+from .helpers import battle_state
+
+# one ally and one enemy in range of each other, hitting every time
+DUEL = {"id": "duel",
+        "map": {"width": 30, "height": 30},
+        "attributes": {"infantry": {"max_health": 1000, "damage": 7, "damage_range": 3, "damage_chance": 1.0}},
+        "units": [{"fraction": "ally", "type": "infantry", "movement": "stay", "pos": [10, 10]},
+                  {"fraction": "enemy", "type": "infantry", "movement": "stay", "pos": [12, 11]}]}
+
+# two columns marching along their routes, out of range of each other
+MARCH = {"id": "march",
+         "map": {"width": 60, "height": 60},
+         "units": [{"fraction": "ally", "type": "infantry", "count": 4, "movement": "route",
+                    "route": [[5, 50], [20, 50]], "pos": [5, 5]},
+                   {"fraction": "enemy", "type": "medic", "count": 3, "movement": "route",
+                    "route": [[55, 10], [55, 50]], "pos": [50, 5]}]}
+
+
+@pytest.mark.parametrize("scenario", [DUEL, MARCH], ids=["duel", "march"])
+def test_mesa_and_vector_agree_without_random_draws(scenario):
+    states = []
+    for engine in ("mesa", "vector"):
+        model = create_model(seed=1, engine=engine, scenario=scenario, n_mines=0)
+        run_battle(model, max_steps=25)
+        states.append(battle_state(model))
+    assert states[0] == states[1]
+
+
+def test_vector_engine_matches_mesa_agents_after_lazy_sync():
+    model = create_model(60, 4, 3, seed=5, engine="vector", scenario="small_battle")
+    run_battle(model, max_steps=40)
+    engine = model.engine
+    model.sync_agents()
+    rows = [i for i, agent in enumerate(engine.agents) if agent is not None]
+    assert rows
+    for i in rows:
+        agent = engine.agents[i]
+        assert agent.pos == (engine.x[i], engine.y[i])
+        assert agent.health == engine.health[i]
+        assert agent.status.value == engine.status[i]
+
+
+def test_block_columns_match_the_columns_read_from_the_agents():
+    model = create_model(20, 3, 1, seed=2, engine="vector", scenario="small_battle", n_mortars=2)
+    engine = model.engine
+    assert engine.compiled
+    agents = list(model.schedule.agents)
+    expected = engine._columns(agents, {id(agent): i for i, agent in enumerate(agents)})
+    for name, values in expected.items():
+        if name == "route":
+            width = min(values.shape[1], engine.route.shape[1])
+            np.testing.assert_array_equal(engine.route[:, :width], values[:, :width])
+        else:
+            assert engine.__dict__[name].dtype == values.dtype, name
+            np.testing.assert_array_equal(engine.__dict__[name], values, err_msg=name)
@@ -0,0 +1,39 @@
+import numpy as np
+
+from battlesim.assets import read_heights_file
+from battlesim.batch import create_model
+from battlesim.map_creator import MapCreator, convert_heights
+from battlesim.utils import final_stats, run_battle
+
+
+def test_converted_map_is_memory_mapped_with_the_same_heights(tmp_path):
+    path = str(tmp_path / "heights.npy")
+    convert_heights("database/heights.txt", path)
+    text, binary = read_heights_file("database/heights.txt"), read_heights_file(path)
+    assert isinstance(binary, np.memmap)
+    assert not binary.flags.writeable
+    np.testing.assert_allclose(binary, text, rtol=1e-6)
+
+
+def test_format_follows_the_extension(tmp_path):
+    heights = np.random.default_rng(0).random((20, 20))
+    creator = MapCreator(size=20)
+    for name, binary in (("heights.txt", False), ("heights.npy", True)):
+        path = str(tmp_path / name)
+        creator.height_map = heights
+        creator.save_heights(path)
+        creator.read_heights(path)
+        assert isinstance(creator.height_map, np.memmap) == binary
+        np.testing.assert_allclose(creator.height_map, heights, rtol=1e-6)
+
+
+def test_battle_on_the_binary_map_matches_the_text_map(tmp_path):
+    path = str(tmp_path / "heights.npy")
+    # float64 keeps the heights, and so the damage, exactly as parsed from text
+    np.save(path, np.loadtxt("database/heights.txt"))
+    results = []
+    for heights in ("database/heights.txt", path):
+        model = create_model(20, 2, 1, seed=9, engine="vector", heights_path=heights)
+        run_battle(model, max_steps=40)
+        results.append(final_stats(model))
+    assert results[0] == results[1]
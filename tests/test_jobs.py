@@ -0,0 +1,58 @@
+import time
+
+import pytest
+
+from battlesim.jobs import JobCancelled, JobQueue, QueueFull, run_job
+
+# runs until cancelled
+ENDLESS = {"n_soldiers": 100, "n_mines": 0, "seed": 1, "engine": "vector",
+           "max_steps": 10**6, "stop_when_decided": False}
+SHORT = {"n_soldiers": 10, "seed": 1, "engine": "vector", "max_steps": 5, "stop_when_decided": False}
+
+
+def wait_for(queue, job_id, *statuses, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status = queue.status(job_id)
+        if status["status"] in statuses:
+            return status
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} still {status['status']}")
+
+
+@pytest.fixture
+def queue():
+    queue = JobQueue(max_workers=1, max_pending=1)
+    yield queue
+    queue.shutdown()
+
+
+def test_run_job_reports_progress_and_stops_when_cancelled():
+    progress = {}
+    stats = run_job("a", SHORT, progress, cancelled={})
+    assert progress == {"a": 5}
+    assert stats["Steps"] == 5 and stats["Stop reason"] == "max_steps"
+
+    with pytest.raises(JobCancelled):
+        run_job("b", SHORT, progress, cancelled={"b": True})
+
+
+def test_queue_runs_bounds_and_cancels_jobs(queue):
+    running = queue.submit(ENDLESS)
+    assert wait_for(queue, running, "running")["max_steps"] == 10**6
+    queued = queue.submit(SHORT)
+    assert queue.status(queued)["status"] == "queued"
+    with pytest.raises(QueueFull):
+        queue.submit(SHORT)
+
+    # the pool may already have taken the queued job, then it stops on start
+    queue.cancel(queued)
+    queue.cancel(running)
+    assert wait_for(queue, running, "cancelled", "failed")["status"] == "cancelled"
+    assert wait_for(queue, queued, "cancelled", "failed", "done")["status"] == "cancelled"
+    assert queue.status(running)["progress"] > 0
+
+    done = wait_for(queue, queue.submit(SHORT), "done")
+    assert done["progress"] == 5
+    assert done["result"]["Steps"] == 5
+    assert queue.status("nope") is None and queue.cancel("nope") is None
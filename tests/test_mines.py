@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from battlesim.mines import MineField
+
+
+def test_seeded_field_is_reproducible_and_confined_to_its_rectangle():
+    field = MineField.random(30, 20, (5, 2), (15, 12), num_mines=3, seed=4)
+    again = MineField.random(30, 20, (5, 2), (15, 12), num_mines=3, seed=4)
+    np.testing.assert_array_equal(field.grid, again.grid)
+    assert field.grid.dtype == np.uint8 and field.grid.shape == (30, 20)
+    assert field.grid.max() <= 3 and field.grid[5:15, 2:12].sum() > 0
+    field.grid[5:15, 2:12] = 0
+    assert not field.grid.any()
+
+
+def test_triggering_removes_one_mine_at_a_time():
+    field = MineField.empty(10, 10)
+    field[(3, 4)] = 2
+    field.trigger((3, 4))
+    assert field.count((3, 4)) == 1
+    field.trigger((3, 4))
+    field.trigger((3, 4))  # nothing left to trigger
+    assert field.count((3, 4)) == 0
+
+    field[(1, 1)] = 3
+    field.trigger_all(np.array([1, 1]), np.array([1, 1]))
+    assert field.count((1, 1)) == 1
+
+
+def test_copy_is_independent():
+    field = MineField.random(10, 10, (0, 0), (10, 10), num_mines=2, seed=1)
+    copy = field.copy()
+    copy.grid[:] = 0
+    assert field.grid.any()
+
+
+def test_dict_view_sees_only_mined_cells():
+    mines = {(2, 3): 1, (7, 0): 4}
+    field = MineField.from_dict(mines, 10, 10)
+    assert field.as_dict() == mines
+    assert len(field) == 2 and (2, 3) in field and (2, 4) not in field and (12, 3) not in field
+    assert field[(7, 0)] == 4
+    with pytest.raises(KeyError):
+        field[(0, 0)]
+    del field[(2, 3)]
+    assert dict(field) == {(7, 0): 4}
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+import battlesim.parallel as parallel
+from battlesim.batch import create_model
+from battlesim.enums import DEAD
+from battlesim.parallel import SHARED_COLUMNS, SharedColumns
+from battlesim.utils import run_battle
+
+from .helpers import battle_state
+
+
+@pytest.mark.parametrize("workers", [2, 3])
+def test_parallel_engine_gives_the_vector_results(monkeypatch, workers):
+    monkeypatch.setattr(parallel, "PARALLEL_PAIRS", 0)  # split every scan, however small
+    states = []
+    for engine in ("vector", "parallel"):
+        model = create_model(40, 4, 2, seed=11, engine=engine, scenario="big_battle", workers=workers)
+        try:
+            run_battle(model, max_steps=60)
+            states.append(battle_state(model))
+        finally:
+            model.close()
+    assert states[0] == states[1]
+    assert parallel._pool is None
+
+
+def test_parallel_scan_counts_the_pairs_of_the_serial_scan(monkeypatch):
+    monkeypatch.setattr(parallel, "PARALLEL_PAIRS", 0)
+    counters = []
+    for engine in ("vector", "parallel"):
+        model = create_model(30, 2, 1, seed=3, engine=engine, workers=2)
+        profiler = model.enable_profiling()
+        try:
+            run_battle(model, max_steps=30)
+        finally:
+            model.close()
+        counters.append(profiler.report()["counters"])
+    assert counters[0]["cells_scanned"] > 0
+    assert counters[0] == counters[1]
+
+
+def test_shared_columns_copy_static_columns_for_new_rows_only():
+    model = create_model(30, 3, seed=2, engine="vector")
+    model.step()
+    engine = model.engine
+    columns = SharedColumns()
+    try:
+        scan = np.ones(engine.n, dtype=bool)
+        _, _, n = columns.publish(engine, scan)
+        for name, _ in SHARED_COLUMNS:
+            np.testing.assert_array_equal(columns.views[name][:n], scan if name == "scan" else getattr(engine, name))
+
+        # static columns of published rows are not copied again, the others are
+        engine.kind[0] += 1
+        engine.x[0] += 1
+        columns.publish(engine, scan)
+        assert columns.views["kind"][0] == engine.kind[0] - 1 and columns.views["x"][0] == engine.x[0]
+
+        # compacting renumbers the rows, so all of them are copied
+        engine.status[::2] = DEAD
+        engine._compact()
+        _, _, n = columns.publish(engine, scan[:engine.n])
+        for name in ("fraction", "kind", "damage_range"):
+            np.testing.assert_array_equal(columns.views[name][:n], getattr(engine, name))
+    finally:
+        columns.close()
+        model.close()
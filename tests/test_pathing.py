@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from battlesim.batch import create_model
+from battlesim.enums import ALLY
+from battlesim.pathing import FlowFields
+
+
+def _walk(paths, start, target, limit=200):
+    cells = [start]
+    while cells[-1] != target and len(cells) < limit:
+        cells.append(paths.next_cell(cells[-1], target))
+    return cells
+
+
+def test_flat_map_paths_are_shortest():
+    paths = FlowFields(np.zeros((30, 30)), np.zeros((30, 30), dtype=int))
+    cells = _walk(paths, (2, 3), (20, 10))
+    assert cells[-1] == (20, 10)
+    assert len(cells) - 1 == 18  # Chebyshev distance
+
+
+@pytest.mark.parametrize("layer", ["heights", "mines"])
+def test_paths_go_around_hills_and_mines(layer):
+    wall = np.zeros((30, 30), dtype=int)
+    wall[15, :] = 1
+    wall[15, 25] = 0  # the only gap
+    heights, mines = (wall * 10, np.zeros_like(wall)) if layer == "heights" else (np.zeros((30, 30)), wall)
+    cells = _walk(FlowFields(heights, mines), (5, 5), (25, 5))
+    assert cells[-1] == (25, 5)
+    assert (15, 25) in cells
+    assert not any(wall[cell] for cell in cells)
+
+
+def test_vectorized_lookup_matches_single_steps_and_fields_are_shared():
+    rng = np.random.default_rng(2)
+    heights, mines = rng.random((40, 40)), rng.integers(0, 2, (40, 40))
+    paths = FlowFields(heights, mines)
+    x, y = rng.integers(0, 40, 50), rng.integers(0, 40, 50)
+    target_x, target_y = rng.choice([3, 30], 50), rng.choice([7, 35], 50)
+    next_x, next_y = paths.next_cells(x, y, target_x, target_y)
+    assert list(zip(next_x.tolist(), next_y.tolist())) == \
+        [paths.next_cell(pos, target) for pos, target in zip(zip(x, y), zip(target_x, target_y))]
+    assert FlowFields(heights, mines.copy()).field((3, 7)) is paths.field((3, 7))
+
+
+@pytest.mark.parametrize("engine", ["mesa", "vector"])
+def test_default_scenarios_with_terrain_follow_flow_fields(engine):
+    model = create_model(20, 0, 0, seed=1, engine=engine, scenario="small_battle")
+    assert model.paths is not None
+    for _ in range(11):  # agents wait 10 steps before their first move
+        model.step()
+    model.sync_agents()
+    allies = [agent for agent in model.schedule.agents if agent.fraction is ALLY]
+    assert {agent.pos for agent in allies} <= {model.paths.next_cell((50, 20), (40, 90)),
+                                               model.paths.next_cell((50, 20), (60, 90))}
+
+    route = create_model(20, 0, 0, seed=1, engine=engine, scenario="small_battle_route")
+    assert route.paths is None
@@ -0,0 +1,57 @@
+import pytest
+
+import api
+from battlesim.batch import create_model
+from battlesim.profiling import Metrics
+from battlesim.utils import run_battle
+
+from .helpers import battle_state
+
+
+@pytest.mark.parametrize("engine", ["mesa", "vector"])
+def test_profiling_measures_without_changing_the_battle(engine):
+    plain = create_model(30, 3, 2, seed=4, engine=engine, n_mortars=1)
+    run_battle(plain, max_steps=20, stop_when_decided=False)
+
+    model = create_model(30, 3, 2, seed=4, engine=engine, n_mortars=1)
+    profiler = model.enable_profiling(slow_step_ms=0)
+    run_battle(model, max_steps=20, stop_when_decided=False)
+    assert model.disable_profiling() is profiler
+    assert battle_state(model) == battle_state(plain)
+
+    report = profiler.report()
+    assert report["steps"] == 20 and len(report["slow_steps"]) == 20
+    assert {"attack", "targeting", "move", "remove_dead"} <= set(report["phases"])
+    assert report["step_ms"] >= sum(phase["ms"] for phase in report["phases"].values()) * 0.99
+    assert report["counters"]["attacks"] > 0 and report["counters"]["cells_scanned"] > 0
+    assert report["phases"]["remove_dead"]["calls"] == 20
+
+
+def test_metrics_render_cumulative_histograms_and_totals():
+    metrics = Metrics()
+    model = create_model(10, seed=1, engine="vector")
+    profiler = model.enable_profiling()
+    run_battle(model, max_steps=5, stop_when_decided=False)
+    metrics.observe_simulation(0.2, profiler)
+    metrics.observe_simulation(100.0)
+
+    lines = metrics.render().splitlines()
+    assert "# TYPE battlesim_simulation_seconds histogram" in lines
+    buckets = [int(line.split()[-1]) for line in lines if line.startswith("battlesim_simulation_seconds_bucket")]
+    assert buckets == sorted(buckets) and buckets[-1] == 2
+    assert "battlesim_simulation_seconds_count 2" in lines
+    assert "battlesim_step_seconds_count 5" in lines
+    assert f'battlesim_phase_calls_total{{phase="remove_dead"}} 5' in lines
+
+
+def test_timing_breakdown_and_metrics_endpoint():
+    client = api.app.test_client()
+    stats = client.get("/run_simulation?engine=vector&render=false&n_soldiers=10&timing=true").get_json()
+    timing = stats["Timing"]
+    assert timing["steps"] == stats["Steps"]
+    assert timing["run_ms"] > 0 and "attack" in timing["phases"]
+
+    text = client.get("/metrics").get_data(as_text=True)
+    assert "# TYPE battlesim_phase_seconds_total counter" in text
+    assert 'battlesim_phase_seconds_total{phase="attack"}' in text
+    assert "battlesim_cache_hits_total" in text
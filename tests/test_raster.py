@@ -0,0 +1,72 @@
+import cv2
+import numpy as np
+import pytest
+
+from battlesim.batch import create_model
+from battlesim.enums import DEAD
+from battlesim.raster import COLORS, MINE_ALPHA, Rasterizer, agent_arrays, encode, write_frame
+
+SCALER = 4
+
+
+def _frame(agents, mines=None, size=20):
+    x, y, health, fraction, kind = (np.array(column) for column in zip(*agents))
+    return {"height": size, "x": x, "y": y, "health": health, "fraction": fraction, "kind": kind,
+            "mines": np.zeros((size, size), dtype=int) if mines is None else mines}
+
+
+def _pixel(image, x, y, size=20):
+    """BGR color at the centre of cell (x, y)."""
+    return tuple(int(value) for value in image[(size - 1 - y) * SCALER, x * SCALER])
+
+
+def test_agents_are_stamped_in_the_colors_of_their_fraction_and_type():
+    layer = np.full((20 * SCALER, 20 * SCALER, 3), 200, dtype=np.uint8)
+    mines = np.zeros((20, 20), dtype=int)
+    mines[15, 15] = 3
+    frame = _frame([(2, 3, 100, 0, 0), (10, 10, 70, 1, 1), (5, 15, 30, 0, 2), (17, 2, 10, 1, 3)], mines)
+    rasterizer = Rasterizer(scaler=SCALER)
+    image = rasterizer.draw(layer, frame)
+
+    assert image.shape == layer.shape
+    assert _pixel(image, 2, 3) == COLORS["blue"]
+    assert _pixel(image, 10, 10) == COLORS["red"]
+    assert _pixel(image, 5, 15) == COLORS["blue"]
+    assert _pixel(image, 17, 2) == COLORS["orange"]
+    purple = (MINE_ALPHA * np.array(COLORS["purple"]) + (1 - MINE_ALPHA) * 200).astype(np.uint8)
+    assert _pixel(image, 15, 15) == tuple(purple.tolist())
+    assert _pixel(image, 0, 19) == (200, 200, 200)
+
+    # the buffer is reused and the layer left untouched
+    again = rasterizer.draw(layer, _frame([(0, 0, 100, 0, 0)]), show_mines=False)
+    assert again is image and _pixel(again, 2, 3) == (200, 200, 200) and _pixel(again, 15, 15) == (200, 200, 200)
+    assert (layer == 200).all()
+
+
+@pytest.mark.parametrize("format", ["png", "jpeg", "webp"])
+def test_frames_encode_to_decodable_images(format, tmp_path):
+    image = np.random.default_rng(1).integers(0, 255, (40, 60, 3), dtype=np.uint8)
+    decoded = cv2.imdecode(np.frombuffer(encode(image, format), np.uint8), cv2.IMREAD_COLOR)
+    assert decoded.shape == image.shape
+    if format == "png":
+        assert (decoded == image).all()
+
+    path = tmp_path / f"frame.{'jpg' if format == 'jpeg' else format}"
+    write_frame(image, str(path))
+    assert cv2.imread(str(path)).shape == image.shape
+    assert [entry.name for entry in tmp_path.iterdir()] == [path.name]
+
+
+def test_engine_arrays_match_the_agents():
+    model = create_model(20, 2, seed=3, engine="vector", n_mortars=1)
+    for _ in range(30):
+        model.step()
+    arrays = agent_arrays(model)
+    model.sync_agents()
+    expected = sorted((agent.pos[0], agent.pos[1], float(agent.health), int(agent.fraction), int(agent.type))
+                      for agent in model.schedule.agents if agent.status is not DEAD)
+    rows = sorted(zip(arrays["x"].tolist(), arrays["y"].tolist(), arrays["health"].tolist(),
+                      arrays["fraction"].tolist(), arrays["kind"].tolist()))
+    # projectiles fired by the engine are rows without a Mesa agent
+    assert [row for row in rows if row[-1] != 3] == expected
+    assert any(row[-1] == 3 for row in rows)
@@ -0,0 +1,53 @@
+import queue
+
+import cv2
+
+from battlesim.batch import create_model
+from battlesim.renderer import FrameRenderer
+from battlesim.utils import run_battle
+from battlesim.visualizer import Visualizer
+
+
+def _visualizer():
+    model = create_model(20, 2, 2, seed=3, engine="vector")
+    run_battle(model, max_steps=5)
+    return Visualizer(model, image_path="database/image.png")
+
+
+def test_frames_are_dropped_instead_of_blocking(tmp_path):
+    frame = _visualizer().frame()
+    renderer = FrameRenderer(max_queue=1)
+    try:
+        for i in range(30):
+            renderer.submit(frame, str(tmp_path / f"frame{i}.png"))
+        assert renderer.submitted + renderer.dropped == 30
+        assert renderer.dropped > 0
+    finally:
+        renderer.close()
+    assert not renderer.is_alive()
+    renderer.close()  # closing twice is harmless
+
+
+def test_queued_frames_are_written_on_close(tmp_path):
+    frame = _visualizer().frame()
+    output = str(tmp_path / "territory.png")
+    renderer = FrameRenderer(max_queue=4)
+    renderer.submit(frame, output)
+    renderer.close(timeout=30)
+    image = cv2.imread(output)
+    assert image is not None and image.size > 0
+
+
+def test_height_map_goes_with_the_first_frame_of_a_map_only():
+    frame = _visualizer().frame()
+    renderer = FrameRenderer()
+    renderer.close()
+    renderer.frames = queue.Queue()  # see what would be sent
+    renderer.submit(frame, "unused.png")
+    renderer.submit(frame, "unused.png")
+    first, second = renderer.frames.get()[0], renderer.frames.get()[0]
+    assert "height_map" in first and "height_map" not in second
+    assert "mines" not in first
+    mines = frame["mines"]
+    assert len(first["mine_x"]) == (mines > 0).sum()
+    assert (mines[first["mine_x"], first["mine_y"]] == first["mine_count"]).all()
@@ -0,0 +1,53 @@
+import random
+
+import numpy as np
+import pytest
+
+from battlesim.batch import create_model
+from battlesim.enums import DEAD
+from battlesim.raster import agent_arrays
+from battlesim.replay import Replay, ReplayRecorder
+from battlesim.utils import run_battle
+
+
+def _units(frame):
+    """Live non-projectile units as (id, x, y, health, status) rows, ordered by id."""
+    return sorted(zip(frame["id"].tolist(), frame["x"].tolist(), frame["y"].tolist(),
+                      np.float32(frame["health"][:len(frame["id"])]).tolist(), frame["status"].tolist()))
+
+
+@pytest.mark.parametrize("engine", ["mesa", "vector"])
+def test_seeking_any_step_gives_the_recorded_state(tmp_path, engine):
+    path = str(tmp_path / "battle.npz")
+    model = create_model(30, 3, 2, seed=6, engine=engine, n_mortars=1)
+    truth = {}
+    recorder = ReplayRecorder(path, model, chunk_steps=16)
+
+    def on_step(i):
+        recorder.record()
+        model.sync_agents()
+        agents = [agent for agent in model.schedule.agents
+                  if agent.status is not DEAD and not agent.is_projectile]
+        truth[model.schedule.steps] = (
+            sorted((agent.unique_id, int(agent.pos[0]), int(agent.pos[1]), float(np.float32(agent.health)),
+                    int(agent.status.value)) for agent in agents),
+            model.mine_map.grid.copy(),
+            int(np.sum(agent_arrays(model)["kind"] >= 3)))
+
+    run_battle(model, max_steps=50, stop_when_decided=False, on_step=on_step)
+    recorder.close()
+
+    replay = Replay(path)
+    try:
+        steps = sorted(truth)
+        assert replay.steps().tolist()[1:] == steps
+        order = steps[::-1] + random.Random(0).sample(steps, len(steps)) + steps
+        for step in order:
+            frame = replay.frame(step)
+            units, mines, projectiles = truth[step]
+            assert frame["step"] == step
+            assert _units(frame) == units
+            np.testing.assert_array_equal(frame["mines"], mines)
+            assert len(frame["x"]) - len(frame["id"]) == projectiles
+    finally:
+        replay.close()
@@ -0,0 +1,50 @@
+import pickle
+import random
+
+import numpy as np
+import pytest
+
+from battlesim.batch import create_model
+from battlesim.rng import BattleRandom, spawn_seeds
+from battlesim.utils import final_stats, run_battle
+
+
+@pytest.mark.parametrize("engine", ["mesa", "vector"])
+def test_seed_alone_reproduces_the_battle(engine):
+    results = []
+    for noise in (0, 1):
+        # draws from the global generators must not leak into the model
+        random.seed(noise)
+        np.random.seed(noise)
+        random.random(), np.random.random(noise + 1)
+        model = create_model(30, 3, 2, seed=21, engine=engine)
+        run_battle(model, max_steps=40)
+        results.append(final_stats(model))
+    assert results[0] == results[1]
+
+
+def test_streams_do_not_shift_each_other():
+    first, second = BattleRandom(5), BattleRandom(5)
+    first.generator("engine").random(1000)
+    assert [first.uniform() for _ in range(10)] == [second.uniform() for _ in range(10)]
+    assert first.generator("mines").random(3).tolist() == second.generator("mines").random(3).tolist()
+    assert first.integer_seed("schedule") != first.integer_seed("mines")
+
+
+def test_pickled_stream_continues_with_the_undrawn_uniforms():
+    rng = BattleRandom(8)
+    rng.uniform()
+    copy = pickle.loads(pickle.dumps(rng))
+    assert [copy.uniform() for _ in range(5)] == [rng.uniform() for _ in range(5)]
+
+
+def test_spawned_seeds_are_stable_and_distinct():
+    seeds = spawn_seeds(3, 4)
+    assert seeds == spawn_seeds(3, 4)
+    assert len(set(seeds)) == 4
+
+
+@pytest.mark.parametrize("seed", [True, 1.5, "7"])
+def test_non_integer_seeds_are_rejected(seed):
+    with pytest.raises(ValueError, match="seed must be an integer"):
+        BattleRandom(seed)
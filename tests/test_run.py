@@ -0,0 +1,82 @@
+import pytest
+
+from battlesim.batch import create_model
+from battlesim.enums import ALLY, INFANTRY, WOUNDED
+from battlesim.utils import final_stats, run_battle
+
+ENGINES = ["mesa", "vector"]
+
+
+def _squads(distance, movement="stay", count=3, **attributes):
+    """Two squads `distance` cells apart."""
+    spec = {"id": "squads", "map": {"width": 60, "height": 60},
+            "units": [{"fraction": "ally", "type": "infantry", "count": count, "movement": movement, "pos": [10, 30]},
+                      {"fraction": "enemy", "type": "infantry", "count": count, "movement": movement,
+                       "pos": [10 + distance, 30]}]}
+    if attributes:
+        spec["attributes"] = {"infantry": attributes}
+    return spec
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_wiped_out_side_decides_the_battle(engine):
+    scenario = _squads(2, count=1, max_health=5, damage=10, damage_chance=1.0)
+    model = create_model(seed=1, engine=engine, scenario=scenario, n_mines=0)
+    assert run_battle(model) == {"steps": 1, "reason": "decided"}
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_squads_out_of_range_stop_once_nothing_happens(engine):
+    model = create_model(seed=1, engine=engine, scenario=_squads(30), n_mines=0)
+    assert not model.can_engage()
+    assert run_battle(model) == {"steps": 2, "reason": "out_of_reach"}
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("scenario", [_squads(30, movement="random"), _squads(4)], ids=["walkers", "in_range"])
+def test_battles_that_can_go_on_are_not_stopped(engine, scenario):
+    model = create_model(seed=1, engine=engine, scenario=scenario, n_mines=0)
+    assert model.can_engage()
+    assert run_battle(model, max_steps=20, stop_when_decided=True)["reason"] in ("decided", "max_steps")
+
+
+def test_only_wounded_allies_keep_medics_busy():
+    scenario = _squads(30)
+    scenario["units"].append({"fraction": "ally", "type": "medic", "count": 1, "movement": "stay", "pos": [10, 31]})
+    model = create_model(seed=1, engine="mesa", scenario=scenario, n_mines=0)
+    soldier = next(a for a in model.schedule.agents if a.type is INFANTRY and a.fraction is ALLY)
+    soldier.health = 20  # a mine hit, which medics do not look for
+    assert not model.can_engage()
+    soldier.status = WOUNDED
+    assert model.can_engage()
+
+
+# allies with medics march through a minefield and halt out of range of the enemy
+MARCH = {"id": "march", "map": {"width": 60, "height": 60},
+         "mines": {"area": [[0, 20], [60, 30]], "per_cell": "n_mines"},
+         "params": {"n_mines": 1},
+         "units": [{"fraction": "ally", "type": "infantry", "count": 8, "movement": "route",
+                    "route": [[10, 45]], "pos": [10, 5]},
+                   {"fraction": "ally", "type": "medic", "count": 2, "movement": "route",
+                    "route": [[11, 45]], "pos": [11, 5]},
+                   {"fraction": "enemy", "type": "infantry", "count": 3, "movement": "stay", "pos": [50, 50]}]}
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_out_of_reach_stop_keeps_the_final_stats(engine):
+    runs = []
+    for stop in (True, False):
+        model = create_model(seed=4, engine=engine, scenario=MARCH)
+        runs.append((run_battle(model, max_steps=150, stop_when_decided=stop), final_stats(model)))
+    (early, early_stats), (full, full_stats) = runs
+    assert early["reason"] == "out_of_reach"
+    assert 40 < early["steps"] < full["steps"]
+    assert early_stats == full_stats
+    assert early_stats["Allies health"] < 8 * 100 + 2 * 70  # the mines did hit
+
+
+def test_stalemate_time_budget_and_step_limit():
+    model = create_model(seed=1, engine="vector", scenario=_squads(30), n_mines=0)
+    assert run_battle(model, stop_when_decided=False, stalemate_steps=5) == {"steps": 6, "reason": "stalemate"}
+    assert run_battle(model, time_budget=0) == {"steps": 0, "reason": "time_budget"}
+    assert run_battle(model, max_steps=3, stop_when_decided=False) == {"steps": 3, "reason": "max_steps"}
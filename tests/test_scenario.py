@@ -0,0 +1,76 @@
+import pytest
+
+from battlesim.batch import create_model
+from battlesim.enums import DEAD
+
+from battlesim.scenario import ScenarioError, compile_scenario, load_scenario, scenario_ids
+
+UNIT = {"fraction": "ally", "type": "infantry", "pos": [1, 1]}
+
+
+def _spec(**changes):
+    return {"id": "test", "map": {"width": 20, "height": 20}, "units": [dict(UNIT)], **changes}
+
+
+@pytest.mark.parametrize("spec, message", [
+    ([], "scenario: expected a mapping"),
+    (_spec(weather="rain"), "scenario: unknown keys ['weather']"),
+    (_spec(map={"width": 0, "height": 20}), "map: width and height must be positive integers"),
+    (_spec(map={"width": 20, "height": 20, "grid": "hex"}), "map.grid: expected dense or sparse"),
+    (_spec(units=[]), "units: expected a non-empty list"),
+    (_spec(units=[dict(UNIT, type="tank")]), "units[0].type: unknown value 'tank', expected one of infantry"),
+    (_spec(units=[dict(UNIT, fraction="neutral")]), "units[0].fraction: unknown value 'neutral'"),
+    (_spec(units=[dict(UNIT, pos=[25, 1])]), "units[0].pos: [25, 1] is outside the 20x20 map"),
+    (_spec(units=[dict(UNIT, area=[[0, 0], [5, 5]])]), "units[0]: give either pos or area"),
+    (_spec(units=[dict(UNIT, movement="route")]), "units[0].route: route movement needs a route"),
+    (_spec(units=[dict(UNIT, count="n_tanks")]), "units[0].count: unknown parameter 'n_tanks'"),
+    (_spec(units=[dict(UNIT, count="n/0")], params={"n": 4}), "units[0].count: bad divisor in 'n/0'"),
+    (_spec(map={"width": 20, "height": 20, "grid": "sparse"},
+           units=[dict(UNIT, movement="path", route=[[2, 2]])]), "units[0].movement: path movement needs a dense map"),
+    (_spec(mines={"area": [[5, 5], [2, 2]]}), "mines.area: the first corner must be below and left of the second"),
+    (_spec(attributes={"infantry": {"armour": 3}}), "attributes.infantry: unknown attributes ['armour']"),
+    (_spec(params={"n": 1.5}), "params.n: expected an integer, got 1.5"),
+])
+def test_invalid_scenarios_name_the_offending_field(spec, message):
+    with pytest.raises(ScenarioError) as error:
+        compile_scenario(spec)
+    assert message in str(error.value)
+
+
+def test_unknown_scenario_lists_the_built_in_ones():
+    with pytest.raises(ScenarioError, match="Unknown scenario: 'nope', built-in: .*small_battle"):
+        load_scenario("nope")
+
+
+@pytest.mark.parametrize("name", scenario_ids())
+def test_built_in_scenarios_compile(name):
+    compiled = compile_scenario(load_scenario(name))
+    assert compiled.blocks["count"].sum() > 0
+
+
+def test_parameters_override_the_declared_counts():
+    spec = _spec(params={"n": 4}, units=[dict(UNIT, count="n/2")])
+    assert compile_scenario(spec).blocks["count"].tolist() == [2]
+    assert compile_scenario(spec, {"n": 10, "other": 1}).blocks["count"].tolist() == [5]
+
+
+@pytest.mark.parametrize("grid", ["dense", "sparse"])
+def test_blocks_are_placed_on_the_grid_index_and_stats(grid):
+    spec = load_scenario("small_battle_route")  # path movement needs a dense map
+    spec["map"] = dict(spec["map"], grid=grid)
+    model = create_model(20, 3, 0, seed=2, scenario=spec, n_mortars=2)
+    agents = list(model.schedule.agents)
+    assert sorted(agent.unique_id for agent in agents) == list(range(1, model.max_id + 1))
+
+    buckets = {}
+    for agent in agents:
+        assert model.grid[agent.pos].count(agent) == 1
+        buckets.setdefault(agent.fraction, {}).setdefault(agent.pos, []).append(agent)
+    assert {fraction: {pos: sorted(cell, key=id) for pos, cell in cells.items()}
+            for fraction, cells in model.grid.buckets.items()} == \
+        {fraction: {pos: sorted(cell, key=id) for pos, cell in cells.items()}
+         for fraction, cells in buckets.items()}
+    for fraction in buckets:
+        members = [agent for agent in agents if agent.fraction is fraction and agent.status is not DEAD]
+        assert model.stats.alive_count(fraction) == len(members)
+        assert model.stats.total_health(fraction) == sum(agent.health for agent in members)
@@ -0,0 +1,42 @@
+import pytest
+
+from battlesim.batch import create_model
+from battlesim.model import BattleModel
+from battlesim.snapshot import run_branches
+from battlesim.utils import final_stats, run_battle
+
+from .helpers import battle_state
+
+ALLY_INFANTRY = {"fraction": "ally", "type": "infantry", "movement": "random", "route": []}
+
+
+@pytest.mark.parametrize("engine", ["mesa", "vector"])
+@pytest.mark.parametrize("scenario", ["small_battle", "small_battle_route"])
+def test_restored_battle_continues_as_the_original(engine, scenario):
+    model = create_model(30, 3, 2, seed=4, engine=engine, scenario=scenario, n_mortars=1)
+    run_battle(model, max_steps=15, stop_when_decided=False)
+    data = model.snapshot()
+    run_battle(model, max_steps=25, stop_when_decided=False)
+
+    restored = BattleModel.restore(data)
+    assert restored.schedule.steps == 15
+    run_battle(restored, max_steps=25, stop_when_decided=False)
+    assert battle_state(restored) == battle_state(model)
+
+
+
+def test_branches_replay_the_original_or_diverge():
+    model = create_model(30, 3, 2, seed=4, engine="vector")
+    run_battle(model, max_steps=10, stop_when_decided=False)
+    data = model.snapshot()
+    run_battle(model, max_steps=90, stop_when_decided=False)
+    expected = final_stats(model)
+
+    same, reseeded, reinforced = run_branches(data, [{"max_steps": 100, "stop_when_decided": False},
+                                                     {"max_steps": 100, "stop_when_decided": False, "seed": 9},
+                                                     {"max_steps": 100, "stop_when_decided": False,
+                                                      "add": [{"n": 5, "params": ALLY_INFANTRY}]}],
+                                     max_workers=1)
+    assert same == dict(expected, Steps=100, **{"Stop reason": "max_steps"})
+    assert reseeded["Steps"] == 100 and reseeded != same
+    assert reinforced["Number of allies alive"] > 0 and reinforced != same
@@ -0,0 +1,61 @@
+import random
+
+import pytest
+
+from battlesim.agents import SoldierAgent, register_agent
+from battlesim.batch import create_model
+from battlesim.enums import ALLY, DEAD, ENEMY
+from battlesim.spatial import IndexedGrid, SparseGrid
+
+
+def _brute_force(grid, pos, radius, fraction):
+    """What `cells_in_range` replaces: every cell of the neighbourhood, looked up one by one."""
+    found = []
+    for cell in grid.get_neighborhood(pos, moore=True, include_center=True, radius=radius):
+        agents = [agent for agent in grid.get_cell_list_contents([cell])
+                  if agent.fraction is fraction and not agent.is_projectile and agent.status is not DEAD]
+        if agents:
+            found.append((cell, agents))
+    return sorted(found)
+
+
+@pytest.mark.parametrize("grid", ["dense", "sparse"])
+def test_range_queries_match_the_neighbourhood_scan(grid):
+    model = create_model(40, 4, 0, seed=2, engine="mesa", scenario="small_battle")
+    if grid == "sparse":
+        dense, model.grid = model.grid, SparseGrid(100, 100, False, chunk=16)
+        for agent in list(model.schedule.agents):
+            pos = agent.pos
+            dense.remove_agent(agent)
+            model.grid.place_agent(agent, pos)
+    rng = random.Random(0)
+    for _ in range(40):
+        pos = (rng.randrange(100), rng.randrange(100))
+        radius = rng.choice([0, 1, 3, 6, 99])
+        for fraction in (ALLY, ENEMY):
+            assert model.grid.cells_in_range(pos, radius, [fraction]) == _brute_force(model.grid, pos, radius, fraction)
+
+
+def test_index_follows_moves_and_deaths():
+    model = create_model(2, 0, 0, seed=1, engine="mesa", scenario="demo")
+    grid = model.grid
+    assert isinstance(grid, IndexedGrid)
+    agent = SoldierAgent(1000, {"fraction": "enemy", "type": "infantry", "movement": "stay", "route": None}, model)
+    register_agent(model, agent, (50, 50))
+    assert [agent] == dict(grid.cells_in_range((52, 52), 2, [ENEMY]))[(50, 50)]
+
+    grid.move_agent(agent, (51, 50))
+    assert (50, 50) not in grid.buckets[ENEMY]
+    assert dict(grid.cells_in_range((52, 52), 2, [ENEMY]))[(51, 50)] == [agent]
+
+    agent.kill_agent()
+    assert (51, 50) not in dict(grid.cells_in_range((52, 52), 2, [ENEMY]))
+    model.remove_dead()
+    assert grid.is_cell_empty((51, 50))
+
+
+def test_large_radius_scans_only_occupied_cells():
+    model = create_model(20, 0, 0, seed=1, engine="mesa", scenario="small_battle")
+    occupied = len(model.grid.buckets[ENEMY])
+    assert model.grid.scan_size(99, [ENEMY]) == occupied
+    assert model.grid.scan_size(1, [ENEMY]) == min(9, occupied)
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from battlesim.agents import add_agents_to_model
+from battlesim.assets import load_heights
+from battlesim.mines import MineField
+from battlesim.model import BattleModel
+from battlesim.utils import final_stats, run_battle
+
+
+def _model(engine="mesa", **kwargs):
+    model = BattleModel(100, 100, load_heights("database/heights.txt"),
+                        MineField.random(100, 100, (0, 0), (100, 100), 1, seed=3),
+                        engine=engine, seed=12, **kwargs)
+    add_agents_to_model(model, "small_battle", n=30, n_medics=3, n_mortars=1)
+    return model
+
+
+@pytest.mark.parametrize("engine", ["mesa", "vector"])
+def test_streaming_counters_match_the_mesa_datacollector(engine):
+    models = [_model(engine, collector="mesa"), _model(engine, collector="stream", agent_history=True)]
+    for model in models:
+        run_battle(model, max_steps=60, stop_when_decided=False)
+    mesa, stream = (model.datacollector for model in models)
+
+    expected = mesa.get_model_vars_dataframe()
+    np.testing.assert_allclose(stream.get_model_vars_dataframe()[list(expected.columns)].to_numpy(),
+                               expected.to_numpy())
+
+    # the stream history keeps dead agents but no projectiles, compare the agents both hold
+    expected = mesa.get_agent_vars_dataframe()
+    expected = expected[expected.index.get_level_values("AgentID").isin(list(stream.agents))]
+    history = stream.get_agent_vars_dataframe().loc[expected.index]
+    for column in ("Fraction", "Status", "Health", "Damaged", "Healed"):
+        assert history[column].tolist() == expected[column].tolist(), column
+    assert final_stats(models[0]) == final_stats(models[1])
+
+
+def test_without_history_only_live_agents_are_kept():
+    model = _model("mesa")
+    run_battle(model, max_steps=80, stop_when_decided=False)
+    stats = model.stats
+    graveyard = stats.get_graveyard_dataframe()
+    assert len(graveyard) > 0
+    assert not set(graveyard["AgentID"]) & set(stats.agents)
+    live = {agent.unique_id for agent in model.schedule.agents if not agent.is_projectile}
+    assert set(stats.agents) == live
+    assert len(stats.get_agent_vars_dataframe()) == len(live)
+
+
+def test_history_keeps_every_agent_in_preallocated_arrays():
+    model = _model("mesa", agent_history=True)
+    n = len(model.schedule.agents)
+    run_battle(model, max_steps=80, stop_when_decided=False)
+    stats = model.stats
+    assert len(model.schedule.agents) < n
+    assert len(stats.agents) == n
+    assert stats.agent_vars["Health"].shape[0] >= 80
+    assert len(stats.get_agent_vars_dataframe()) == 80 * n
@@ -0,0 +1,68 @@
+import json
+
+import numpy as np
+import pytest
+
+from battlesim.batch import create_model
+from battlesim.enums import DEAD
+from battlesim.stream import BattleBroadcast, FRACTIONS, decode_agents, encode_frame
+
+
+def _events(broadcast):
+    """(event name, data) of every SSE message of a broadcast."""
+    events = []
+    for message in broadcast.sse():
+        lines = dict(line.split(": ", 1) for line in message.strip().split("\n"))
+        events.append((lines.get("event", "message"), json.loads(lines["data"])))
+    return events
+
+
+@pytest.mark.parametrize("engine", ["mesa", "vector"])
+def test_frame_packs_the_live_agents(engine):
+    model = create_model(n_soldiers=20, n_medics=4, seed=3, engine=engine)
+    for _ in range(15):
+        model.step()
+    frame = json.loads(json.dumps(encode_frame(model, 15, agents=True)))
+    agents = decode_agents(frame)
+
+    model.sync_agents()
+    live = sorted((agent.pos, agent.health, agent.fraction, 3 if agent.is_projectile else agent.type)
+                  for agent in model.schedule.agents if agent.status is not DEAD)
+    decoded = sorted(((int(x), int(y)), float(health), int(fraction), int(kind)) for x, y, health, fraction, kind
+                     in zip(agents["x"], agents["y"], agents["health"], agents["fraction"], agents["type"]))
+    assert frame["agents"]["n"] == len(live)
+    assert [row[0] for row in decoded] == [row[0] for row in live]
+    assert np.allclose([row[1] for row in decoded], [row[1] for row in live])
+    assert [row[2:] for row in decoded] == [row[2:] for row in live]
+    for fraction in FRACTIONS:
+        assert frame["alive"][fraction] == model.stats.alive_count(fraction)
+        assert frame["health"][fraction] == model.stats.total_health(fraction)
+
+
+def test_stream_ends_with_the_result():
+    model = create_model(n_soldiers=10, seed=1, engine="vector")
+    broadcast = BattleBroadcast(model, fps=0, max_steps=20).start()
+    events = _events(broadcast)
+
+    assert events[0] == ("battle", {"id": broadcast.id})
+    frames = [data for _, data in events[1:]]
+    assert all(name == "message" for name, _ in events[1:])
+    assert [frame["step"] for frame in frames] == sorted(frame["step"] for frame in frames)
+    assert frames[-1]["result"] == broadcast.result
+    assert frames[-1]["step"] == broadcast.result["steps"]
+    assert "agents" in frames[-1]
+
+
+def test_failed_battle_sends_an_error_event(caplog):
+    model = create_model(n_soldiers=10, seed=1)
+
+    def broken_step():
+        raise RuntimeError("out of ammunition")
+    model.step = broken_step
+
+    broadcast = BattleBroadcast(model, fps=0).start()
+    events = _events(broadcast)
+
+    assert events[-1] == ("error", {"step": 0, "error": "RuntimeError: out of ammunition"})
+    assert broadcast.finished and broadcast.result is None
+    assert "out of ammunition" in caplog.text
@@ -0,0 +1,54 @@
+import threading
+
+import pytest
+
+from battlesim.scenario import ScenarioError
+from battlesim.sweep import Sweep, SweepError
+
+SPEC = {"scenario": "small_battle", "search": "n_soldiers",
+        "params": {"n_soldiers": [5, 10, 20, 40]}, "fixed": {"n_medics": 0, "n_mines": 0},
+        "target": 0.6, "initial_replications": 2, "max_replications": 4, "coarse_step": 2,
+        "seed": 3, "max_steps": 30}
+
+
+def _results(summary):
+    return summary["answer"], summary["configs"], summary["simulations"]
+
+
+def test_interrupted_sweep_resumes_to_the_uninterrupted_answer(tmp_path):
+    expected = Sweep(SPEC, checkpoint=str(tmp_path / "full.json")).run(max_workers=1)
+    assert expected["status"] == "done"
+
+    checkpoint = str(tmp_path / "sweep.json")
+    stop = threading.Event()
+
+    def on_progress(sweep):
+        if sum(map(len, sweep.outcomes.values())) >= 3:
+            stop.set()
+
+    interrupted = Sweep(SPEC, checkpoint=checkpoint).run(max_workers=1, stop=stop, on_progress=on_progress)
+    assert interrupted["status"] == "interrupted"
+    assert 3 <= interrupted["simulations"] < expected["simulations"]
+
+    resumed = Sweep.resume(checkpoint)
+    assert resumed.status == "interrupted"
+    assert resumed.summary()["simulations"] == interrupted["simulations"]
+    assert _results(resumed.run(max_workers=1)) == _results(expected)
+
+
+def test_checkpoint_of_another_sweep_is_refused(tmp_path):
+    checkpoint = str(tmp_path / "sweep.json")
+    Sweep(SPEC, checkpoint=checkpoint).save()
+    with pytest.raises(SweepError, match="belongs to another sweep"):
+        Sweep(dict(SPEC, seed=4), checkpoint=checkpoint)
+
+
+@pytest.mark.parametrize("changes, error", [
+    ({"params": {"n_tanks": [1]}, "search": None}, SweepError),
+    ({"initial_replications": 8}, SweepError),
+    ({"target": 1.5}, SweepError),
+    ({"scenario": "nope"}, ScenarioError),
+])
+def test_invalid_specs_are_refused(changes, error):
+    with pytest.raises(error):
+        Sweep(dict(SPEC, **changes))